@@ -0,0 +1,112 @@
+# benchmark for /api/bills on a synthetic corpus, fully offline (mongomock)
+#
+#   python bench_bills.py --bills 50000 --queries 200
+#
+# compares ranking through the in-memory BillIndex against ranking the scores dicts in python (the
+# best case for a per-request scan: documents already loaded, no db round trip), then times whole
+# requests through the flask app including the summary join for the page. mongomock answers $in
+# with a collection scan, so the request numbers overstate what a real mongod (an _id index
+# lookup per page) costs.
+
+import sys
+import time
+import random
+import argparse
+
+import numpy as np
+
+from loadtest import percentile
+from score_matrix import LABELS
+from bill_index import BillIndex, parse_weights
+
+
+def make_corpus(db, n, seed=0):
+    rng = np.random.default_rng(seed)
+    scores = rng.random((n, len(LABELS)), dtype=np.float32)
+    ids = [f"HB{i}" for i in range(n)]
+    db["scores"].insert_many({"_id": _id, "scores": dict(zip(LABELS, map(float, row)))}
+                             for _id, row in zip(ids, scores))
+    db["bills"].insert_many({"_id": _id, "title": _id} for _id in ids)
+    db["summaries"].insert_many({"_id": _id, "summary": f"Summary of {_id}.", "bullet_points": ["a", "b", "c"]}
+                                for _id in ids)
+
+
+def random_weights(rnd):
+    labels = rnd.sample(LABELS, rnd.randint(1, 5))
+    return {label: round(rnd.uniform(0.1, 1.0), 2) for label in labels}
+
+
+def scan_rank(docs, weights, limit):
+    # the per-request alternative: weight every scores doc in python and sort
+    ranked = []
+    for doc in docs:
+        scores = doc["scores"]
+        ranked.append((sum(w * scores.get(label, 0.0) for label, w in weights.items()), doc["_id"]))
+    ranked.sort(reverse=True)
+    return ranked[:limit]
+
+
+def report(name, times):
+    ms = [t * 1000 for t in times]
+    print(f"{name}: p50 {percentile(ms, 50):.2f}ms p90 {percentile(ms, 90):.2f}ms p99 {percentile(ms, 99):.2f}ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bills", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--scan-queries", type=int, default=20, help="the python scan is slow; run it fewer times")
+    args = parser.parse_args(argv)
+
+    import mongomock
+    db = mongomock.MongoClient()["civiclens"]
+    a = time.time()
+    make_corpus(db, args.bills)
+    print(f"synthetic corpus: {args.bills} bills in {time.time() - a:.1f}s")
+
+    index = BillIndex(db)
+    index.refresh()
+    print(f"index build: {index.build_seconds:.2f}s, matrix {index.scores.nbytes / 1e6:.1f}MB")
+
+    rnd = random.Random(0)
+    queries = [random_weights(rnd) for _ in range(args.queries)]
+
+    times = []
+    for weights in queries:
+        vector = parse_weights(weights)
+        a = time.perf_counter()
+        index.rank(vector, rnd.randint(0, 4) * args.page_size, args.page_size)
+        times.append(time.perf_counter() - a)
+    report("index rank (top-k)", times)
+
+    docs = list(db["scores"].find({}, {"scores": 1}))
+    times = []
+    for weights in queries[:args.scan_queries]:
+        a = time.perf_counter()
+        scan_rank(docs, weights, args.page_size)
+        times.append(time.perf_counter() - a)
+    report("python scan over loaded dicts", times)
+
+    # same answer either way
+    weights = queries[0]
+    expected = [_id for _, _id in scan_rank(docs, weights, args.page_size)]
+    got = [_id for _id, _ in index.rank(parse_weights(weights), 0, args.page_size)[1]]
+    print("rankings match:", expected == got)
+
+    import main as backend
+    backend.bill_index = index
+    client = backend.app.test_client()
+    times = []
+    for weights in queries:
+        body = {"weights": weights, "page": rnd.randint(1, 5), "page_size": args.page_size}
+        a = time.perf_counter()
+        resp = client.post("/api/bills", json=body)
+        times.append(time.perf_counter() - a)
+        assert resp.status_code == 200, resp.get_json()
+    report("POST /api/bills (rank + summary join, mongomock)", times)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
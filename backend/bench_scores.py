@@ -0,0 +1,110 @@
+# memory and latency of the ScoreMatrix against the per-bill dict form stored in `scores`
+#
+#   python bench_scores.py --sizes 10000 100000 1000000
+#
+# for each corpus size: resident size of the python dicts vs the float32 matrix + id array, top-k
+# for one user (dict scan with heapq vs matmul + argpartition), batch top-k for many users, a
+# notification fan-out, and how long a saved snapshot takes to map back in.
+
+import os
+import sys
+import json
+import time
+import heapq
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+from loadtest import percentile
+from score_matrix import LABELS, ScoreMatrix
+
+
+def make_docs(n, seed=0):
+    rng = np.random.default_rng(seed)
+    scores = rng.random((n, len(LABELS)), dtype=np.float32).tolist()
+    return [{"_id": f"HB{i}", "scores": dict(zip(LABELS, row))} for i, row in enumerate(scores)]
+
+
+def random_weights(rnd):
+    return {label: rnd.uniform(0.1, 1.0) for label in rnd.sample(LABELS, rnd.randint(1, 5))}
+
+
+def dict_top_k(docs, weights, k):
+    items = weights.items()
+    return heapq.nlargest(k, ((sum(w * doc["scores"][label] for label, w in items), doc["_id"]) for doc in docs))
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        a = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - a) * 1000)
+    return {"p50_ms": round(percentile(times, 50), 3), "p99_ms": round(percentile(times, 99), 3)}
+
+
+def bench(n, users, queries, k):
+    rnd = random.Random(n)
+    out = {"bills": n}
+
+    tracemalloc.start()
+    docs = make_docs(n)
+    out["dict_mb"] = round(tracemalloc.get_traced_memory()[0] / 1e6, 1)
+    tracemalloc.stop()
+
+    a = time.perf_counter()
+    matrix = ScoreMatrix.from_docs(docs)
+    out["matrix_build_s"] = round(time.perf_counter() - a, 2)
+    out["matrix_mb"] = round(matrix.nbytes / 1e6, 1)
+
+    weights = [random_weights(rnd) for _ in range(queries)]
+    vectors = [np.array([w.get(label, 0.0) for label in LABELS], dtype=np.float32) for w in weights]
+    dict_queries = max(1, min(queries, 2_000_000 // n))
+    it = iter(weights * 2)
+    out["dict_top_k"] = timed(lambda docs=docs: dict_top_k(docs, next(it), k), dict_queries)
+    it = iter(vectors * 2)
+    out["matrix_top_k"] = timed(lambda: matrix.top_k(next(it), k), queries)
+    it = iter(vectors * 2)
+    out["matrix_top_k_threshold"] = timed(lambda: matrix.top_k(next(it), k, thresholds={"health": 0.5}), queries)
+
+    many = np.random.default_rng(1).random((users, len(LABELS)), dtype=np.float32)
+    a = time.perf_counter()
+    matrix.top_k_many(many, k)
+    elapsed = time.perf_counter() - a
+    out["batch_top_k"] = {"users": users, "seconds": round(elapsed, 3), "users_per_sec": round(users / elapsed)}
+
+    new_rows = np.arange(min(100, n))
+    a = time.perf_counter()
+    matrix.fan_out(new_rows, many, float(len(LABELS)) / 2)
+    out["fan_out_100_bills_ms"] = round((time.perf_counter() - a) * 1000, 2)
+
+    del docs
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bills_matrix")
+        matrix.save(path)
+        a = time.perf_counter()
+        mapped = ScoreMatrix.load(path)
+        out["mmap_load_ms"] = round((time.perf_counter() - a) * 1000, 2)
+        it = iter(vectors * 2)
+        out["mmap_top_k"] = timed(lambda mapped=mapped: mapped.top_k(next(it), k), queries)
+        del mapped
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--users", type=int, default=2_000, help="users scored at once in the batch and fan-out runs")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=20)
+    args = parser.parse_args(argv)
+    for n in args.sizes:
+        print(json.dumps(bench(n, args.users, args.queries, args.k)), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
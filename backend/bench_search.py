@@ -0,0 +1,221 @@
+# benchmark for the full-text search index (search_index.py) on a synthetic corpus, fully offline
+#
+#   python bench_search.py --bills 100000 --queries 300
+#
+# bills are made of english stopwords, a handful of topic words per category (the bill's top
+# categories get high scores, so facets and thresholds line up with the text) and a zipf-distributed
+# vocabulary of made-up words, at roughly the length of a title, summary, four bullets and a few
+# hundred words of cleaned text. queries mix one to three words, phrases, stopwords that get dropped,
+# and category thresholds, and are timed with facet counts on, the way /api/search serves them. the
+# "broad" set is the worst case: single words that match a large share of the corpus. also times
+# an incremental update of changed bills while the index is live.
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+import numpy as np
+
+from loadtest import percentile
+from score_matrix import LABELS
+from search_index import SearchIndex, STOPWORDS
+
+TOPIC_WORDS = {
+    "agriculture": "farm crop livestock farmer dairy grain agricultural rural irrigation harvest",
+    "budget": "appropriation budget fiscal expenditure revenue deficit fund allocation treasury audit",
+    "economy": "economic business commerce trade market investment growth tax enterprise jobs",
+    "crime": "criminal offense felony prosecution sentencing police theft assault penalty conviction",
+    "education": "school student teacher education curriculum university tuition classroom literacy college",
+    "environment": "environmental pollution emission conservation wildlife climate water forest wetland recycling",
+    "health": "health hospital patient medical medicaid physician insurance clinic pharmacy treatment",
+    "housing": "housing rent tenant landlord mortgage homeless affordable dwelling eviction zoning",
+    "infrastructure": "infrastructure bridge broadband utility pipeline construction facility grid road sewer",
+    "judiciary": "court judge judicial appeal jury attorney litigation civil procedure justice",
+    "labor": "labor employee employer wage worker union overtime workplace employment compensation",
+    "safety": "safety emergency fire hazard inspection disaster rescue protection firearm security",
+    "transportation": "transportation highway vehicle transit traffic driver railroad airport motor license",
+}
+FILLER = sorted(STOPWORDS) + "shall section act state department provided under this subsection".split()
+
+
+def make_vocabulary(n, rng):
+    syllables = ["ba", "ker", "lo", "ti", "men", "sa", "vor", "qui", "del", "an", "ro", "pet", "ul", "gra", "fen", "is"]
+    words = set()
+    while len(words) < n:
+        words.add("".join(rng.choice(syllables, rng.integers(2, 5))))
+    return sorted(words)
+
+
+def make_bills(n, body_words, seed=0):
+    rng = np.random.default_rng(seed)
+    vocab = np.array(make_vocabulary(20000, rng))
+    # zipf over the made-up vocabulary, so a few words are everywhere and most are rare
+    cumulative = np.cumsum(1.0 / np.arange(1, len(vocab) + 1) ** 1.05)
+    cumulative /= cumulative[-1]
+    topics = {label: words.split() for label, words in TOPIC_WORDS.items()}
+    filler = np.array(FILLER)
+
+    def words(k, labels):
+        # ~40% filler, ~8% topic words of the bill's categories, the rest from the vocabulary
+        picks = vocab[np.searchsorted(cumulative, rng.random(k))]
+        kind = rng.random(k)
+        picks = np.where(kind < 0.4, filler[rng.integers(len(filler), size=k)], picks)
+        topic = np.array([w for label in labels for w in topics[label]])
+        picks = np.where(kind > 0.92, topic[rng.integers(len(topic), size=k)], picks)
+        return picks.tolist()
+
+    for i in range(n):
+        labels = [LABELS[j] for j in rng.choice(len(LABELS), rng.integers(1, 4), replace=False)]
+        scores = {label: float(rng.random() * 0.3) for label in LABELS}
+        scores.update({label: float(0.5 + rng.random() * 0.5) for label in labels})
+        yield {
+            "id": f"HB{i}",
+            "title": "An act relating to " + " ".join(words(10, labels)),
+            "summary": " ".join(words(70, labels)) + ".",
+            "bullets": [" ".join(words(15, labels)) for _ in range(4)],
+            "body": " ".join(words(body_words, labels)),
+            "scores": scores,
+            "version": "1",
+        }
+
+
+def make_queries(n, bills_sample, rnd):
+    # what people type: topic words, less common vocabulary, the odd stopword, phrases lifted from text
+    topic = [w for words in TOPIC_WORDS.values() for w in words.split()]
+    # distinct words, so a rare word is as likely to be searched as a common one
+    content = sorted({w for bill in bills_sample for w in bill["summary"].rstrip(".").split()} - set(FILLER))
+    queries = []
+    for _ in range(n):
+        r = rnd.random()
+        if r < 0.1:
+            # two neighbouring content words, the way someone would quote "drinking water"
+            words = rnd.choice(bills_sample)["body"].split()
+            pairs = [(a, b) for a, b in zip(words, words[1:]) if a not in FILLER and b not in FILLER]
+            text = '"' + " ".join(rnd.choice(pairs)) + '"'
+        else:
+            terms = [rnd.choice(topic if rnd.random() < 0.6 else content) for _ in range(rnd.randint(1, 3))]
+            if rnd.random() < 0.2:
+                terms.insert(rnd.randrange(len(terms) + 1), rnd.choice(sorted(STOPWORDS)))
+            text = " ".join(terms)
+        thresholds = {rnd.choice(LABELS): 0.5} if rnd.random() < 0.3 else None
+        queries.append((text, thresholds))
+    return queries
+
+
+def broad_queries(index):
+    # the most widespread content words in the index: the slowest single-word searches there are
+    db = index._db()
+    db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp.vocab USING fts5vocab(main, bills_fts, row)")
+    # vocab terms are stemmed ("thi" for "this"), so filler is recognised by prefix
+    return [term for term, in db.execute("SELECT term FROM temp.vocab ORDER BY doc DESC LIMIT 100")
+            if not any(word.startswith(term) for word in FILLER)][:10]
+
+
+def report(name, times, budget_ms=None):
+    ms = [t * 1000 for t in times]
+    line = f"{name}: p50 {percentile(ms, 50):.2f}ms p90 {percentile(ms, 90):.2f}ms p99 {percentile(ms, 99):.2f}ms " \
+           f"max {max(ms):.2f}ms"
+    if budget_ms:
+        line += f" ({'within' if percentile(ms, 99) < budget_ms else 'OVER'} {budget_ms:g}ms at p99)"
+    print(line)
+
+
+def timed(index, queries, **kw):
+    times, totals = [], []
+    for text, thresholds in queries:
+        a = time.perf_counter()
+        total, _, _ = index.search(text, thresholds, **kw)
+        times.append(time.perf_counter() - a)
+        totals.append(total)
+    return times, totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bills", type=int, default=100000)
+    parser.add_argument("--body-words", type=int, default=300, help="words of cleaned bill text per bill")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=2000, help="bills per upsert transaction")
+    parser.add_argument("--updates", type=int, default=1000, help="bills rewritten in the incremental update")
+    parser.add_argument("--path", help="index file (default: a temp file, removed afterwards)")
+    parser.add_argument("--reuse", action="store_true", help="search the index already at --path instead of building")
+    parser.add_argument("--budget-ms", type=float, default=50.0)
+    args = parser.parse_args(argv)
+
+    tmp = None
+    if args.path is None:
+        tmp = tempfile.TemporaryDirectory()
+        args.path = os.path.join(tmp.name, "search.db")
+    index = SearchIndex(args.path)
+
+    if args.reuse:
+        # same seed, so the sample queries are drawn from the bills that are in the index
+        sample = [bill for bill, _ in zip(make_bills(args.bills, args.body_words), range(500))]
+        print(f"reusing {len(index)} bills, {index.stats()['bytes'] / 1e6:.0f}MB")
+    else:
+        a = time.time()
+        batch, sample = [], []
+        for bill in make_bills(args.bills, args.body_words):
+            batch.append(bill)
+            if len(sample) < 500:
+                sample.append(bill)
+            if len(batch) == args.batch:
+                index.upsert(batch)
+                batch = []
+        index.upsert(batch)
+        built = time.time() - a
+        a = time.time()
+        index.optimize()
+        print(f"indexed {len(index)} bills in {built:.1f}s ({len(index) / built:.0f} bills/sec, generation "
+              f"included), optimize {time.time() - a:.1f}s, {index.stats()['bytes'] / 1e6:.0f}MB")
+    a = time.time()
+    index.refresh()
+    print(f"scores loaded in {time.time() - a:.2f}s")
+
+    rnd = random.Random(0)
+    queries = make_queries(args.queries, sample, rnd)
+    timed(index, queries[:20], limit=1)  # warm the page cache (a different key, so not the result cache)
+
+    times, totals = timed(index, queries, limit=args.page_size, facets=True)
+    report("search + facets", times, args.budget_ms)
+    print(f"  matches per query: median {int(np.median(totals))}, max {max(totals)} "
+          f"({max(totals) / len(index):.0%} of the corpus)")
+    times, _ = timed(index, queries, limit=args.page_size)
+    report("search only", times, args.budget_ms)
+    times, _ = timed(index, [(text, thr) for text, thr in queries], limit=args.page_size, offset=3 * args.page_size)
+    report("search, page 4", times, args.budget_ms)
+
+    broad = broad_queries(index)
+    times, totals = timed(index, [(term, None) for term in broad], limit=args.page_size, facets=True)
+    report(f"broad single words + facets, first time ({min(totals) / len(index):.0%}-"
+           f"{max(totals) / len(index):.0%} of the corpus each)", times, args.budget_ms)
+    times, _ = timed(index, [(term, None) for term in broad] * 3, limit=args.page_size, facets=True)
+    report("broad single words + facets, repeated", times, args.budget_ms)
+
+    # a toolchain run rewriting bills while the index is being read
+    changed = list(make_bills(args.updates, args.body_words, seed=1))
+    for bill in changed:
+        bill["id"] = f"HB{rnd.randrange(args.bills)}"
+        bill["version"] = "2"
+    changed = list({bill["id"]: bill for bill in changed}.values())
+    a = time.time()
+    for start in range(0, len(changed), 200):
+        index.upsert(changed[start:start + 200])
+    elapsed = time.time() - a
+    print(f"incremental update: {len(changed)} changed bills in {elapsed:.2f}s ({len(changed) / elapsed:.0f} bills/sec)")
+    times, _ = timed(index, queries, limit=args.page_size, facets=True)
+    report("search + facets after the update", times, args.budget_ms)
+    versions = index.versions()
+    assert len(versions) == args.bills and all(versions[bill["id"]] == "2" for bill in changed)
+
+    if tmp is not None:
+        tmp.cleanup()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
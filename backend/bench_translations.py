@@ -0,0 +1,113 @@
+# cold start and memory of the translation cache: the single cached_translations.json against the
+# per-pipeline shards of ShardedTranslationStore, on a synthetic cache
+#
+#   python bench_translations.py --languages 47 --strings 100000
+#
+# every measurement runs in a fresh interpreter so RSS isn't polluted by the generator or by the
+# previous run.
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+
+from translation_store import TranslationStore, ShardedTranslationStore
+
+WORDS = ("bill act federal state funding program health education tax credit agency report public "
+         "safety housing transport energy water rural veterans labor court budget grant").split()
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+
+def generate(directory, languages, strings, seed=0):
+    # writes the same cache both ways, one language at a time so the generator stays small
+    rnd = random.Random(seed)
+    texts = [" ".join(rnd.choice(WORDS) for _ in range(rnd.randint(3, 12))).capitalize() for _ in range(strings)]
+    codes = [chr(97 + i // 26) + chr(97 + i % 26) for i in range(languages)]
+    shards = ShardedTranslationStore(os.path.join(directory, "translations"))
+    with open(os.path.join(directory, "cached_translations.json"), "w", encoding="utf-8") as legacy:
+        legacy.write("{\n")
+        for n, code in enumerate(codes):
+            entries = {text: f"[{code}] {text[::-1]}" for text in texts}
+            shards.write_shard("en-" + code, entries)
+            body = json.dumps(entries, ensure_ascii=False, indent=4)
+            # nest the pipeline object one level deeper, like json.dump(store.to_dict(), indent=4)
+            legacy.write(f'    "en-{code}": ' + body.replace("\n", "\n    "))
+            legacy.write(",\n" if n < len(codes) - 1 else "\n")
+        legacy.write("}\n")
+    return codes, texts[:100]
+
+
+def measure(mode, directory, codes, probes, budget_mb):
+    out = {"mode": mode, "rss_start_mb": round(rss_mb(), 1)}
+    a = time.perf_counter()
+    if mode == "legacy":
+        store = TranslationStore(os.path.join(directory, "cached_translations.json"))
+    else:
+        store = ShardedTranslationStore(os.path.join(directory, "translations"), memory_budget=budget_mb * 1024 * 1024)
+    out["cold_start_s"] = round(time.perf_counter() - a, 3)
+    a = time.perf_counter()
+    assert store.get("en-" + codes[0], probes[0]) is not None
+    out["first_lookup_s"] = round(time.perf_counter() - a, 3)
+    out["rss_after_first_lookup_mb"] = round(rss_mb(), 1)
+    a = time.perf_counter()
+    for code in codes:
+        for text in probes:
+            store.get("en-" + code, text)
+    out["all_languages_s"] = round(time.perf_counter() - a, 3)
+    out["rss_after_all_languages_mb"] = round(rss_mb(), 1)
+    a = time.perf_counter()
+    n = 0
+    for _ in range(10):
+        for text in probes:
+            store.get("en-" + codes[-1], text)
+            n += 1
+    out["warm_lookup_us"] = round((time.perf_counter() - a) / n * 1e6, 2)
+    if mode != "legacy":
+        out["budget_mb"] = budget_mb
+        out["evictions"] = store.evictions
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--languages", type=int, default=47)
+    parser.add_argument("--strings", type=int, default=100_000)
+    parser.add_argument("--budgets", type=int, nargs="+", default=[256, 4096], help="shard LRU budgets (MB) to try")
+    parser.add_argument("--measure", nargs=3, metavar=("MODE", "DIR", "BUDGET_MB"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.measure:
+        mode, directory, budget = args.measure
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        print(json.dumps(measure(mode, directory, meta["codes"], meta["probes"], int(budget))))
+        return 0
+
+    with tempfile.TemporaryDirectory() as directory:
+        a = time.time()
+        codes, probes = generate(directory, args.languages, args.strings)
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump({"codes": codes, "probes": probes}, f)
+        legacy_mb = os.path.getsize(os.path.join(directory, "cached_translations.json")) / 1e6
+        shard_dir = os.path.join(directory, "translations")
+        shard_mb = sum(os.path.getsize(os.path.join(shard_dir, n)) for n in os.listdir(shard_dir)) / 1e6
+        print(json.dumps({"languages": args.languages, "strings": args.strings, "generate_s": round(time.time() - a, 1),
+                          "legacy_file_mb": round(legacy_mb, 1), "shards_mb": round(shard_mb, 1)}), flush=True)
+        runs = [("legacy", 0)] + [("sharded", budget) for budget in args.budgets]
+        for mode, budget in runs:
+            result = subprocess.run([sys.executable, os.path.abspath(__file__), "--measure", mode, directory, str(budget)],
+                                    capture_output=True, text=True)
+            print(result.stdout.strip() or result.stderr.strip().splitlines()[-1], flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+from __future__ import annotations
+import os
+import time
+import threading
+
+from score_matrix import ScoreMatrix, label_vector
+
+# in-memory ranking index over the `scores` collection the toolchain writes.
+#
+# every bill's label scores sit in one float32 row of a ScoreMatrix, so ranking a user's weighted
+# topic preferences is a single matrix-vector product plus an argpartition top-k instead of a
+# mongo scan per request. the matrix is rebuilt in the background when `scores` changes (a change
+# stream when mongo runs as a replica set, polling otherwise) and swapped in whole, so readers
+# never take a lock. with a snapshot path, each rebuild is also written out as memory-mappable
+# .npy files and a restarted process serves from them before its first rebuild finishes.
+
+
+def parse_weights(weights):
+    # {label: weight} -> weight vector; raises ValueError on unknown labels or no positive weight
+    vector = label_vector(weights)
+    if not (vector > 0).any():
+        raise ValueError("at least one weight must be positive")
+    return vector
+
+
+class BillIndex:
+    def __init__(self, db, refresh_every=60.0, snapshot_path=None):
+        self.db = db
+        self.refresh_every = refresh_every
+        self.snapshot_path = snapshot_path
+        self.scores = ScoreMatrix.empty()
+        self.loaded_at = None
+        self.build_seconds = None
+        self._stop = threading.Event()
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.loaded_at is not None
+
+    def refresh(self):
+        with self._refresh_lock:
+            start = time.time()
+            scores = ScoreMatrix.from_docs(self.db["scores"].find({}, {"scores": 1}))
+            if self.snapshot_path:
+                scores.save(self.snapshot_path)
+            # one assignment, so a concurrent reader sees either the old matrix or the new one
+            self.scores = scores
+            self.loaded_at = time.time()
+            self.build_seconds = self.loaded_at - start
+
+    def load_snapshot(self):
+        if self.snapshot_path and os.path.exists(self.snapshot_path + ".npy"):
+            self.scores = ScoreMatrix.load(self.snapshot_path)
+            self.loaded_at = os.path.getmtime(self.snapshot_path + ".npy")
+            return True
+        return False
+
+    def rank(self, vector, offset, limit, thresholds=None):
+        # (total, [(bill id, score)]) for one page; thresholds are {label: minimum score}
+        scores = self.scores
+        total, ranked = scores.top_k(vector, limit, offset, thresholds)
+        return total, [(str(scores.ids[row]), score) for row, score in ranked]
+
+    def page(self, vector, offset, limit, thresholds=None, lang=None):
+        # a page of ranked bills joined with their titles and summaries. with lang, the summary
+        # and bullets come from translate_summaries.py's translation when it matches the current
+        # english (summary_hash), else the english is returned and "lang" says so
+        total, ranked = self.rank(vector, offset, limit, thresholds)
+        page_ids = [bill_id for bill_id, _ in ranked]
+        fields = {"summary": 1, "bullet_points": 1}
+        if lang:
+            fields.update({"summary_hash": 1, f"translations.{lang}": 1, f"translated.{lang}": 1})
+        summaries = {doc["_id"]: doc for doc in self.db["summaries"].find({"_id": {"$in": page_ids}}, fields)}
+        titles = {doc["_id"]: doc.get("title") for doc in self.db["bills"].find(
+            {"_id": {"$in": page_ids}}, {"title": 1})}
+        bills = []
+        for bill_id, score in ranked:
+            summary = summaries.get(bill_id, {})
+            shown, shown_lang = summary, "en"
+            if lang and summary.get("summary_hash") and \
+                    (summary.get("translated") or {}).get(lang) == summary["summary_hash"]:
+                shown, shown_lang = summary["translations"][lang], lang
+            bills.append({
+                "id": bill_id,
+                "title": titles.get(bill_id, bill_id),
+                "score": score,
+                "summary": shown.get("summary"),
+                "bullet_points": shown.get("bullet_points", []),
+                "lang": shown_lang,
+            })
+        return total, bills
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        try:
+            self.load_snapshot()
+        except Exception as e:
+            print(f"bill index: could not map snapshot: {e!r}")
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"bill index: initial load failed: {e!r}")
+        try:
+            # change streams need a replica set; a standalone mongod raises here
+            with self.db["scores"].watch(max_await_time_ms=1000) as stream:
+                while not self._stop.is_set():
+                    changed = False
+                    while stream.try_next() is not None:
+                        changed = True
+                    if changed:
+                        self.refresh()
+                    # rebuild at most this often while the toolchain is writing
+                    self._stop.wait(min(self.refresh_every, 5.0))
+            return
+        except Exception:
+            pass
+        while not self._stop.wait(self.refresh_every):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"bill index: refresh failed: {e!r}")
@@ -0,0 +1,129 @@
+from __future__ import annotations
+import os
+import gzip
+import json
+import hashlib
+import threading
+
+from flask import Response, request
+
+from translation_store import split_leading_prefix
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# static-ish JSON documents served whole and revalidated with strong ETags.
+#
+# a Bundle is encoded once when its content changes: the JSON body, its sha256 as the ETag, and
+# gzip/brotli copies of the body. requests then cost a header compare (304 when the client's
+# If-None-Match still matches) or a write of bytes that are already compressed. responses carry
+# `Cache-Control: no-cache`, so clients keep the body but check back once per use with a
+# conditional request.
+#
+#   /api/languages             languages.json, re-read only when the file's mtime changes
+#   /api/translations/<lang>   {"lang", "translations": {ui string: translation}} for every line of
+#                              logs/texts.log the translation cache has for that language, keyed and
+#                              prefixed the way /api/translate returns them
+
+
+class Bundle:
+    def __init__(self, payload):
+        self.payload = payload
+        self.body = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        self.tag = hashlib.sha256(self.body).hexdigest()[:32]
+        # mtime=0 so the same content always compresses to the same bytes
+        self.encoded = {"gzip": gzip.compress(self.body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.encoded["br"] = brotli.compress(self.body, quality=11)
+
+    def etag(self, encoding=None):
+        # strong validators are per representation, so each content-coding gets its own tag
+        return self.tag + ("-" + encoding if encoding else "")
+
+    def response(self):
+        # the flask response for the current request: 304 when the client already holds one of
+        # our representations, else the body in the best encoding it accepts
+        headers = {"Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        held = [encoding for encoding in (None, *self.encoded)
+                if request.if_none_match.contains_weak(self.etag(encoding))]
+        if held:
+            headers["ETag"] = f'"{self.etag(held[0])}"'
+            return Response(status=304, headers=headers)
+        encoding = None
+        accepted = request.accept_encodings
+        for candidate in ("br", "gzip"):
+            if candidate in self.encoded and accepted[candidate] > 0:
+                encoding = candidate
+                break
+        body = self.encoded[encoding] if encoding else self.body
+        headers["ETag"] = f'"{self.etag(encoding)}"'
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(body, status=200, headers=headers, content_type="application/json; charset=utf-8")
+
+
+class FileBundle:
+    # a JSON file served as a Bundle, rebuilt when the file changes on disk
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._bundle = None
+
+    def get(self):
+        # raises FileNotFoundError when the file is missing
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        self._bundle = Bundle(json.load(f))
+                    self._mtime = mtime
+        return self._bundle
+
+
+class TranslationBundles:
+    # one Bundle per language, rebuilt when that language's shard changes (store.version) or
+    # texts.log does
+    def __init__(self, store, texts_path):
+        self.store = store
+        self.texts_path = texts_path
+        self._lock = threading.Lock()
+        self._texts_mtime = None
+        self._texts = []
+        self._bundles = {}  # lang -> (version, Bundle)
+
+    def texts(self):
+        try:
+            mtime = os.stat(self.texts_path).st_mtime_ns
+        except FileNotFoundError:
+            return self._texts
+        if mtime != self._texts_mtime:
+            with open(self.texts_path, "r", encoding="utf-8") as f:
+                lines = list(dict.fromkeys(line.strip() for line in f if line.strip()))
+            with self._lock:
+                self._texts, self._texts_mtime = lines, mtime
+                self._bundles.clear()
+        return self._texts
+
+    def get(self, lang):
+        texts = self.texts()
+        pipeline = "en-" + lang
+        # loads the shard (if it isn't already) before its version is read
+        self.store.get(pipeline, "")
+        version = (self._texts_mtime, self.store.version(pipeline))
+        cached = self._bundles.get(lang)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        translations = {}
+        for text in texts:
+            prefix, core_text = split_leading_prefix(text)
+            translation = self.store.get(pipeline, core_text) if core_text else None
+            if translation is not None:
+                translations[text] = prefix + translation
+        bundle = Bundle({"lang": lang, "translations": translations})
+        with self._lock:
+            self._bundles[lang] = (version, bundle)
+        return bundle
@@ -0,0 +1,258 @@
+# load test for the translate endpoints
+#
+#   python loadtest.py fake-upstream --port 5005 --delay 0.5
+#   TRANSLATE_URL=http://localhost:5005/translate python main.py
+#   python loadtest.py run --url http://localhost:11111 --users 64 --requests 20 --target es --miss-rate 0.2
+#   python loadtest.py replicas --replica 0.02:0 --replica 0.2:0 --replica 0.02:0.5 --replica down
+#
+# `fake-upstream` stands in for LibreTranslate so cache misses can be measured offline with a
+# known latency. `run` hammers /api/translate with strings from logs/texts.log and prints
+# latency percentiles; errors counts non-200s and the english `fallback` answers the backend gives
+# when upstream fails (also shown on their own as fallbacks). `replicas` starts one fake per --replica (delay:fail_rate, or `down` for a
+# port nothing listens on) and drives translate_client.TranslateClient at them through three
+# phases: healthy, an outage where every replica fails, and recovery. per phase it prints
+# latency, how many calls succeeded or failed fast with the circuit open, and where requests went.
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+base = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_texts():
+    with open(os.path.join(base, "logs", "texts.log"), "r", encoding="utf-8") as f:
+        return [ln for ln in f.read().split("\n") if ln.strip()]
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(p / 100 * (len(values) - 1)))))
+    return values[k]
+
+
+def run(args):
+    texts = load_texts()
+    url = args.url.rstrip("/") + "/api/translate"
+    local = threading.local()
+    latencies = []
+    errors = fallbacks = 0
+    lock = threading.Lock()
+
+    def user(n):
+        nonlocal errors, fallbacks
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        rng = random.Random(n)
+        for i in range(args.requests):
+            text = rng.choice(texts)
+            if rng.random() < args.miss_rate:
+                # unique suffix so the backend has to go upstream
+                text = f"{text} {n}-{i}-{time.time_ns()}"
+            a = time.perf_counter()
+            try:
+                r = local.session.post(url, json={"source": "en", "target": args.target, "text": text}, timeout=60)
+                ok = r.status_code == 200
+                # upstream failures come back as a 200 carrying the english text
+                fallback = ok and bool(r.json().get("fallback"))
+            except (requests.RequestException, ValueError):
+                ok = fallback = False
+            elapsed = time.perf_counter() - a
+            with lock:
+                latencies.append(elapsed)
+                if not ok or fallback:
+                    errors += 1
+                if fallback:
+                    fallbacks += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        list(pool.map(user, range(args.users)))
+    wall = time.perf_counter() - start
+
+    result = {
+        "users": args.users,
+        "requests": len(latencies),
+        "errors": errors,
+        "fallbacks": fallbacks,
+        "wall_s": round(wall, 3),
+        "req_per_s": round(len(latencies) / wall, 1) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p90_ms": round(percentile(latencies, 90) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1) if latencies else 0.0,
+    }
+    print(json.dumps(result, indent=2))
+    return result
+
+
+class FakeServer(ThreadingHTTPServer):
+    # the default listen backlog of 5 drops SYNs under a burst of new connections, which shows up
+    # as 1s connect retries that have nothing to do with what's being measured
+    request_queue_size = 256
+
+
+def make_fake_upstream(delay=0.0, fail_rate=0.0):
+    # answers like LibreTranslate: reversed words per line, after `delay` seconds. delay and
+    # fail_rate are class attributes so a running fake can be slowed down or broken
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # headers and body go out as separate writes; without this nagle + delayed acks add ~40ms
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            time.sleep(self.delay)
+            if random.random() < self.fail_rate:
+                body = json.dumps({"error": "injected failure"}).encode()
+                self.send_response(500)
+            else:
+                q = payload.get("q", "")
+                target = payload.get("target", "")
+                translated = "\n".join(f"[{target}] {line[::-1]}" for line in q.split("\n"))
+                body = json.dumps({"translatedText": translated, "alternatives": []}, ensure_ascii=False).encode()
+                self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    Handler.delay = delay
+    Handler.fail_rate = fail_rate
+    return Handler
+
+
+def fake_upstream(args):
+    server = FakeServer(("127.0.0.1", args.port), make_fake_upstream(args.delay, args.fail_rate))
+    print(f"fake LibreTranslate on http://127.0.0.1:{args.port}/translate (delay {args.delay}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def replicas(args):
+    from translate_client import TranslateClient, UpstreamUnavailable
+
+    servers, handlers, urls = [], [], []
+    for spec in args.replica:
+        if spec == "down":
+            # bind and close, so the port is very likely free and connections get refused
+            server = ThreadingHTTPServer(("127.0.0.1", 0), BaseHTTPRequestHandler)
+            urls.append(f"http://127.0.0.1:{server.server_port}/translate")
+            server.server_close()
+            continue
+        delay, fail_rate = (float(x) for x in spec.split(":"))
+        handler = make_fake_upstream(delay, fail_rate)
+        server = FakeServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        handlers.append((handler, fail_rate))
+        urls.append(f"http://127.0.0.1:{server.server_port}/translate")
+
+    client = TranslateClient(urls, max_concurrency=args.concurrency, timeout=args.timeout, retries=args.retries,
+                             backoff=args.backoff, failure_threshold=args.failures, reset_after=args.reset)
+    texts = load_texts()
+
+    def phase(name):
+        before = {r["url"]: r["requests"] for r in client.stats()["replicas"]}
+        latencies = []
+        counts = {"ok": 0, "unavailable": 0, "error": 0}
+        lock = threading.Lock()
+
+        def user(n):
+            rng = random.Random(n)
+            for i in range(args.requests):
+                a = time.perf_counter()
+                try:
+                    client.translate(f"{rng.choice(texts)} {n}-{i}", "es")
+                    outcome = "ok"
+                except UpstreamUnavailable:
+                    outcome = "unavailable"
+                except requests.RequestException:
+                    outcome = "error"
+                with lock:
+                    latencies.append(time.perf_counter() - a)
+                    counts[outcome] += 1
+                time.sleep(args.think)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.users) as pool:
+            list(pool.map(user, range(args.users)))
+        wall = time.perf_counter() - start
+        stats = client.stats()
+        result = dict(counts, phase=name, wall_s=round(wall, 3),
+                      p50_ms=round(percentile(latencies, 50) * 1000, 1),
+                      p99_ms=round(percentile(latencies, 99) * 1000, 1),
+                      sent={r["url"].rsplit(":", 1)[1]: r["requests"] - before[r["url"]] for r in stats["replicas"]},
+                      circuits={r["url"].rsplit(":", 1)[1]: r["state"] for r in stats["replicas"]})
+        print(json.dumps(result))
+        return result
+
+    results = [phase("healthy")]
+    for handler, _ in handlers:
+        handler.fail_rate = 1.0
+    results.append(phase("outage"))
+    for handler, fail_rate in handlers:
+        handler.fail_rate = fail_rate
+    time.sleep(args.reset)
+    results.append(phase("recovered"))
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("run")
+    p.add_argument("--url", default="http://localhost:11111")
+    p.add_argument("--users", type=int, default=64)
+    p.add_argument("--requests", type=int, default=20, help="requests per user")
+    p.add_argument("--target", default="es")
+    p.add_argument("--miss-rate", type=float, default=0.0)
+    p.set_defaults(func=run)
+
+    p = sub.add_parser("fake-upstream")
+    p.add_argument("--port", type=int, default=5005)
+    p.add_argument("--delay", type=float, default=0.5)
+    p.add_argument("--fail-rate", type=float, default=0.0)
+    p.set_defaults(func=fake_upstream)
+
+    p = sub.add_parser("replicas")
+    p.add_argument("--replica", action="append", default=[], help="delay:fail_rate, or `down`; repeatable")
+    p.add_argument("--users", type=int, default=32)
+    p.add_argument("--requests", type=int, default=20, help="requests per user per phase")
+    p.add_argument("--think", type=float, default=0.01, help="seconds each user waits between requests")
+    p.add_argument("--concurrency", type=int, default=16)
+    p.add_argument("--timeout", type=float, default=2.0)
+    p.add_argument("--retries", type=int, default=2)
+    p.add_argument("--backoff", type=float, default=0.05)
+    p.add_argument("--failures", type=int, default=5, help="consecutive failures that open a replica's circuit")
+    p.add_argument("--reset", type=float, default=1.0, help="seconds a circuit stays open before a probe")
+    p.set_defaults(func=replicas)
+
+    args = parser.parse_args(argv)
+    if args.cmd == "replicas" and not args.replica:
+        args.replica = ["0.02:0", "0.2:0", "0.02:0.3", "down"]
+    args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
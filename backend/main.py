@@ -1,96 +1,437 @@
 from __future__ import annotations
 import os
+import re
 import json
+import contextlib
 from datetime import datetime
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
 import threading
 import requests
 
+from translation_store import ShardedTranslationStore, migrate_once, split_leading_prefix
+from singleflight import SingleFlight
+from bill_index import BillIndex, parse_weights
+from score_matrix import label_vector
+from bundles import FileBundle, TranslationBundles
+from metrics import Metrics, RequestTimer
+from translate_client import DEFAULT_URL, RETRY_STATUSES, TranslateClient, UpstreamUnavailable
+from search_index import SearchIndex
+
 app = Flask(__name__)
-CORS(app)
+# clients read the ETag to send it back as If-None-Match, and Server-Timing when profiling
+CORS(app, expose_headers=["ETag", "Server-Timing"])
 
 
 import json
 base = os.path.dirname(os.path.abspath(__file__))
 
+# one shard per pipeline, each read on its first request and kept in an LRU under the memory
+# budget; lookups are dict hits and misses append one record to that pipeline's log
+TRANSLATIONS_DIR = os.getenv("TRANSLATIONS_DIR", os.path.join(base, "translations"))
+# first start after the switch to shards; safe with several workers starting at once
+migrate_once(os.path.join(base, "cached_translations.json"), TRANSLATIONS_DIR)
+store = ShardedTranslationStore(TRANSLATIONS_DIR,
+                                memory_budget=int(os.getenv("TRANSLATIONS_MEMORY_MB", "512")) * 1024 * 1024)
+
+# served from memory with an ETag; the file is only read again after it changes
+languages = FileBundle(os.path.join(base, 'languages.json'))
+# every UI string the frontend shows, for the per-language bundles
+translation_bundles = TranslationBundles(store, os.getenv("TEXTS_LOG", os.path.join(base, "logs", "texts.log")))
+
+# stage timings, cache hit/miss and upstream outcomes per target language, scraped from /metrics.
+# a request with `X-Profile: 1` also gets its stage breakdown back in a Server-Timing header
+# (METRICS_PROFILING=0 turns that off)
+metrics = Metrics()
+metrics.describe("civiclens_request_seconds", "histogram", "request latency by endpoint, target language and status")
+metrics.describe("civiclens_stage_seconds", "histogram", "time spent in each stage of a request")
+metrics.describe("civiclens_upstream_seconds", "histogram", "LibreTranslate request latency by outcome")
+metrics.describe("civiclens_translate_cache_total", "counter", "translation cache lookups by result (hit/miss)")
+metrics.describe("civiclens_translate_misses_total", "counter",
+                 "cache misses by how they were served (upstream, coalesced onto another request's call)")
+metrics.describe("civiclens_translate_errors_total", "counter", "failed translations by reason")
+PROFILING = os.getenv("METRICS_PROFILING", "1") == "1"
+TIMED_ENDPOINTS = {"translate", "translate_batch", "get_languages", "get_translation_bundle", "search"}
+
+
+def _target_label(target):
+    # only languages we serve become label values, so made-up targets can't mint new series
+    try:
+        known = languages.get().payload
+    except Exception:
+        known = {}
+    return target if isinstance(target, str) and target in known else "other"
+
+
+def _stage(name):
+    timer = g.get("timer")
+    return timer.stage(name) if timer is not None else contextlib.nullcontext()
+
+
+@app.before_request
+def start_timer():
+    if request.endpoint in TIMED_ENDPOINTS:
+        g.timer = RequestTimer(metrics, request.endpoint, PROFILING and request.headers.get("X-Profile") == "1")
+
+
+@app.after_request
+def finish_timer(response):
+    timer = g.pop("timer", None)
+    if timer is not None:
+        total = timer.finish(response.status_code)
+        if timer.profile:
+            response.headers["Server-Timing"] = timer.server_timing(total)
+    return response
+
+
+@metrics.gauges
+def _store_gauges():
+    stats = store.stats()
+    flights = in_flight.stats()
+    return [(f"civiclens_store_{k}", f"translation store {k}", {}, v) for k, v in stats.items()
+            if isinstance(v, (int, float))] + \
+           [(f"civiclens_single_flight_{k}", f"single-flight {k} calls", {}, v) for k, v in flights.items()]
+
+
+@metrics.gauges
+def _upstream_gauges():
+    rows = []
+    for replica in translator.stats()["replicas"]:
+        labels = {"replica": replica["url"]}
+        rows.append(("civiclens_upstream_outstanding", "requests in flight to a translation replica", labels,
+                     replica["outstanding"]))
+        rows.append(("civiclens_upstream_circuit_open", "1 while a replica's circuit breaker is open", labels,
+                     int(replica["state"] == "open")))
+    return rows
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route('/api/languages', methods=['GET'])
 def get_languages():
     try:
-        lang_path = os.path.join(os.path.dirname(__file__), 'languages.json')
-        with open(lang_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return jsonify(data), 200
+        with _stage("load"):
+            bundle = languages.get()
+        with _stage("respond"):
+            return bundle.response()
     except FileNotFoundError:
         return jsonify({'error': 'languages.json not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/translations/<lang>', methods=['GET'])
+def get_translation_bundle(lang):
+    # every cached UI string for a language in one response, so a client launching in a language
+    # it has seen before costs one conditional request (304 when nothing changed)
+    try:
+        known = languages.get().payload
+    except (FileNotFoundError, ValueError):
+        known = None
+    if not LANG_RE.match(lang) or (known is not None and lang not in known):
+        return jsonify({'error': 'unknown language'}), 404
+    g.timer.target = lang
+    with _stage("build"):
+        bundle = translation_bundles.get(lang)
+    with _stage("respond"):
+        return bundle.response()
+
+
+
+def _record_upstream(url, target, seconds, outcome):
+    # every attempt the client makes, including retries and calls refused by an open circuit
+    metrics.observe("civiclens_upstream_seconds", seconds, {"target": _target_label(target), "outcome": outcome})
+
+
+# pooled keep-alive connections to the translation service shared by all worker threads. set
+# TRANSLATE_URL to a comma-separated list to spread requests over several LibreTranslate replicas
+translator = TranslateClient(os.getenv("TRANSLATE_URL", DEFAULT_URL),
+                             pool_size=int(os.getenv("TRANSLATE_POOL_SIZE", "32")),
+                             max_concurrency=int(os.getenv("TRANSLATE_MAX_CONCURRENCY", "16")),
+                             timeout=float(os.getenv("TRANSLATE_TIMEOUT", "10")),
+                             retries=int(os.getenv("TRANSLATE_RETRIES", "2")),
+                             failure_threshold=int(os.getenv("TRANSLATE_BREAKER_FAILURES", "5")),
+                             reset_after=float(os.getenv("TRANSLATE_BREAKER_RESET", "30")),
+                             on_result=_record_upstream)
+# concurrent misses for the same (target, core_text) share one upstream call
+in_flight = SingleFlight()
+# upper bound on characters sent in one newline-joined batch request
+BATCH_MAX_CHARS = 5000
+
+
+def _translate_upstream(core_text: str, target: str) -> str | None:
+    with _stage("upstream"):
+        return translator.translate(core_text, target, alternatives=1)
+
+
+def _translate_upstream_many(core_texts: list[str], target: str) -> dict[str, str]:
+    # a whole screen in one or two newline-joined upstream calls
+    with _stage("upstream"):
+        return translator.translate_many(core_texts, target, max_chars=BATCH_MAX_CHARS)
+
+
+def _translate_miss(pipeline: str, core_text: str, target: str) -> str | None:
+    led = []
+
+    def fetch():
+        led.append(True)
+        # the previous leader for this key may have stored it between our miss and our claim
+        translation = store.get(pipeline, core_text)
+        if translation is None:
+            translation = _translate_upstream(core_text, target)
+            if translation:
+                with _stage("store"):
+                    store.put(pipeline, core_text, translation)
+        return translation
+
+    try:
+        return in_flight.do((target, core_text), fetch)
+    finally:
+        metrics.inc("civiclens_translate_misses_total",
+                    {"target": _target_label(target), "served": "upstream" if led else "coalesced"})
+
 
 @app.route("/api/translate", methods=["POST"])
 def translate(): 
     # should match schema {source: str, target: str, text: str}
-    data = request.json
-    # Helper: split leading non-alphanumeric characters (prefix) from the rest (core).
-    def _split_leading_prefix(s: str) -> tuple[str, str]:
-        if not s:
-            return "", ""
-        for i, ch in enumerate(s):
-            # isalnum covers Unicode letters and numbers
-            if ch in "QWERTYUIOPASDFGHJKLZXCVBNMqwertyuiopasdfghjklzxcvbnm1234567890":
-                return s[:i], s[i:]
-        # no alnum found -> everything is prefix
-        return s, ""
-
-    orig_text = data.get("text", "")
-    prefix, core_text = _split_leading_prefix(orig_text)
+    with _stage("parse"):
+        data = request.json
+        orig_text = data.get("text", "")
+        prefix, core_text = split_leading_prefix(orig_text)
     # Languages that are written RTL where we want the prefix appended on the right
     rtl_langs = {"ar", "fa", "he", "ur"}
     # If there's nothing left to translate, just return the prefix (original text)
     if core_text == "":
         return jsonify({"translation": prefix}), 200
-    with open(os.path.join(base, "cached_translations.json"), "r", encoding="utf-8") as f:
-        cached = json.load(f)
+    target = _target_label(data["target"])
+    g.timer.target = target
     pipeline = "en-" + data["target"]
-    if pipeline in cached:
-        if core_text in cached[pipeline]:
-            # reattach prefix before returning
-            cached_translation = cached[pipeline][core_text]
-            #if data.get("target") in rtl_langs and prefix:
-            #    # append reversed prefix on the right for RTL targets
-            #    print(cached_translation, prefix)
-            #    return jsonify({"translation": cached_translation + prefix[::-1]}), 200
+    with _stage("cache"):
+        cached_translation = store.get(pipeline, core_text)
+    metrics.inc("civiclens_translate_cache_total",
+                {"endpoint": "translate", "target": target, "result": "miss" if cached_translation is None else "hit"})
+    if cached_translation is not None:
+        # reattach prefix before returning
+        #if data.get("target") in rtl_langs and prefix:
+        #    # append reversed prefix on the right for RTL targets
+        #    print(cached_translation, prefix)
+        #    return jsonify({"translation": cached_translation + prefix[::-1]}), 200
+        with _stage("respond"):
             return jsonify({"translation": prefix + cached_translation}), 200
-    else:
-        cached[pipeline] = {}
 
-    payload = {
-        "q": core_text,
-        "source": "en",
-        "target": data["target"],
-        "alternatives": 1
-    }
+    # stores the translation for the stripped/core text on success
+    reason = "upstream_empty"
+    try:
+        translation = _translate_miss(pipeline, core_text, data["target"])
+    except UpstreamUnavailable:
+        translation, reason = None, "upstream_unavailable"
+    except requests.Timeout:
+        translation, reason = None, "upstream_timeout"
+    except requests.HTTPError as e:
+        # before RequestException, which it subclasses
+        status = e.response.status_code if e.response is not None else None
+        if status is not None and status < 500 and status not in RETRY_STATUSES:
+            # upstream refused this request (unsupported language, text too long): not an outage,
+            # so no fallback that the client would take for one
+            metrics.inc("civiclens_translate_errors_total", {"target": target, "reason": "upstream_rejected"})
+            return jsonify({"error": f"translation rejected upstream ({status})", "reason": "upstream_rejected"}), 400
+        translation, reason = None, "upstream_http_error"
+    except ValueError:
+        # unparseable body (requests' JSONDecodeError is a ValueError too)
+        translation, reason = None, "upstream_bad_response"
+    except requests.RequestException:
+        translation, reason = None, "upstream_unreachable"
+    if translation:
+        # reattach the original prefix when returning
+        #if data.get("target") in rtl_langs and prefix:
+        #    print(translation, prefix[::-1])
+        #    return jsonify({"translation": translation + prefix[::-1]}), 200
+        with _stage("respond"):
+            return jsonify({"translation": prefix + translation}), 200
+    metrics.inc("civiclens_translate_errors_total", {"target": target, "reason": reason})
+    # the english text, so the page still renders; `fallback` tells the client not to cache it
+    return jsonify({"translation": orig_text, "fallback": True, "reason": reason}), 200
+
+
+@app.route("/api/translate/batch", methods=["POST"])
+def translate_batch():
+    # should match schema {source: str, target: str, texts: [str]}
+    # returns {translations: [str | null]} in the same order as texts;
+    # null marks an item that could not be translated
+    data = request.json or {}
+    texts = data.get("texts")
+    target = data.get("target")
+    if not target or not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+        return jsonify({"error": "expected {target: str, texts: [str]}"}), 400
 
-    resp = requests.post("https://translate.civiclens.app/translate", json=payload, timeout=10)
+    g.timer.target = _target_label(target)
+    pipeline = "en-" + target
+    split = [split_leading_prefix(t) for t in texts]
 
-    if resp.status_code == 200:
-        if len(resp.json().get("alternatives", [])) > 0:
-            translation = resp.json()["alternatives"][0]
+    resolved = {}
+    misses = []
+    for _, core_text in split:
+        if core_text == "" or core_text in resolved:
+            continue
+        cached_translation = store.get(pipeline, core_text)
+        resolved[core_text] = cached_translation
+        if cached_translation is None:
+            misses.append(core_text)
+    hits = len(resolved) - len(misses)
+    for result, n in (("hit", hits), ("miss", len(misses))):
+        if n:
+            metrics.inc("civiclens_translate_cache_total",
+                        {"endpoint": "translate_batch", "target": g.timer.target, "result": result}, n)
+
+    if misses:
+        # claim every miss; strings another request is already translating are waited on
+        # instead of being sent upstream a second time
+        leading = {}
+        following = {}
+        for core_text in misses:
+            call, leader = in_flight.claim((target, core_text))
+            (leading if leader else following)[core_text] = call
+
+        results = {}
+        try:
+            for core_text in leading:
+                if store.get(pipeline, core_text) is not None:
+                    results[core_text] = store.get(pipeline, core_text)
+            pending = [t for t in leading if t not in results]
+            if pending:
+                for core_text, translation in _translate_upstream_many(pending, target).items():
+                    store.put(pipeline, core_text, translation)
+                    results[core_text] = translation
+        finally:
+            for core_text, call in leading.items():
+                in_flight.resolve((target, core_text), call, result=results.get(core_text))
+        resolved.update(results)
+
+        for core_text, call in following.items():
+            try:
+                resolved[core_text] = in_flight.wait(call, timeout=30)
+            except Exception:
+                resolved[core_text] = None
+
+    translations = []
+    for prefix, core_text in split:
+        if core_text == "":
+            translations.append(prefix)
+        elif resolved.get(core_text) is None:
+            translations.append(None)
         else:
-            translation = resp.json().get("translatedText")
-        if translation:
-            # store translation for the stripped/core text
-            cached[pipeline][core_text] = translation
-            with open(os.path.join(base, "cached_translations.json"), "w", encoding="utf-8") as f:
-                json.dump(cached, f, ensure_ascii=False, indent=4)
-            # reattach the original prefix when returning
-            #if data.get("target") in rtl_langs and prefix:
-            #    print(translation, prefix[::-1])
-            #    return jsonify({"translation": translation + prefix[::-1]}), 200
-            return jsonify({"translation": prefix + translation}), 200
-    return jsonify({"error": "Translation failed"}), 500
+            translations.append(prefix + resolved[core_text])
+    return jsonify({"translations": translations}), 200
+
+
+# ranking index over the toolchain's scores; built in the background so startup isn't blocked
+bill_index = None
+if os.getenv("MONGO_URI"):
+    from pymongo import MongoClient
+    bill_index = BillIndex(MongoClient(os.getenv("MONGO_URI"))["civiclens"],
+                           refresh_every=float(os.getenv("BILLS_REFRESH_SECONDS", "60")),
+                           snapshot_path=os.getenv("BILLS_MATRIX_PATH", os.path.join(base, "bills_matrix"))).start()
+BILLS_MAX_PAGE_SIZE = 100
+LANG_RE = re.compile(r"^[A-Za-z]{2,3}(-[A-Za-z]{2,4})?$")
+
+
+def _label_pairs(value, default):
+    # "health:1,economy:0.5" -> {"health": "1", "economy": "0.5"}
+    pairs = {}
+    for part in filter(None, value.split(",")):
+        label, _, number = part.partition(":")
+        pairs[label.strip()] = number or default
+    return pairs
+
+
+@app.route("/api/bills", methods=["GET", "POST"])
+def get_bills():
+    # POST {weights: {label: weight}, thresholds: {label: min score}, page: int, page_size: int, lang: str}, or
+    # GET ?weights=health:1,economy:0.5&thresholds=health:0.6&page=1&page_size=20&lang=es
+    # returns {bills: [{id, title, score, summary, bullet_points, lang}], page, page_size, total}
+    # ranked by the weighted sum of each bill's label scores; summaries are in `lang` where a
+    # current translation exists
+    if bill_index is None:
+        return jsonify({"error": "bills are not configured (MONGO_URI)"}), 503
+    if not bill_index.ready:
+        return jsonify({"error": "bill index is still loading"}), 503
+    try:
+        if request.method == "POST":
+            data = request.json or {}
+            weights = data.get("weights") or {}
+            thresholds = data.get("thresholds") or {}
+        else:
+            data = request.args
+            weights = _label_pairs(data.get("weights", ""), 1)
+            thresholds = _label_pairs(data.get("thresholds", ""), 0)
+        vector = parse_weights(weights)
+        if not isinstance(thresholds, dict):
+            raise ValueError("thresholds must map labels to minimum scores")
+        label_vector(thresholds)
+        page = max(1, int(data.get("page", 1)))
+        page_size = min(BILLS_MAX_PAGE_SIZE, max(1, int(data.get("page_size", 20))))
+        lang = data.get("lang") or None
+        if lang is not None and not (isinstance(lang, str) and LANG_RE.match(lang)):
+            raise ValueError("lang must be a language code")
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    total, bills = bill_index.page(vector, (page - 1) * page_size, page_size, thresholds,
+                                   None if lang == "en" else lang)
+    return jsonify({"bills": bills, "page": page, "page_size": page_size, "total": total}), 200
+
+
+# full-text index written by toolchain/index_search.py; the in-memory copy of its scores is loaded
+# in the background so the first search doesn't pay for it
+search_index = SearchIndex(os.getenv("SEARCH_INDEX_PATH", os.path.join(base, "search.db")))
+threading.Thread(target=search_index.refresh, daemon=True).start()
+SEARCH_MAX_QUERY = 200
+
+
+@app.route("/api/search", methods=["GET"])
+def search():
+    # GET ?q=drinking water&thresholds=health:0.5&page=1&page_size=20&facets=1
+    # returns {results: [{id, title, score, snippet, scores}], total, page, page_size, facets}
+    # ranked by bm25 over title, summary, bullet points and bill text; thresholds keep bills scoring
+    # at least that much for a label, facets are {label: matching bills scoring >= 0.5} (null with facets=0)
+    data = request.args
+    try:
+        q = data.get("q", "").strip()
+        if not q or len(q) > SEARCH_MAX_QUERY:
+            raise ValueError(f"q must be 1 to {SEARCH_MAX_QUERY} characters")
+        thresholds = {label: float(value) for label, value in _label_pairs(data.get("thresholds", ""), 0).items()}
+        label_vector(thresholds)
+        page = max(1, int(data.get("page", 1)))
+        page_size = min(BILLS_MAX_PAGE_SIZE, max(1, int(data.get("page_size", 20))))
+        facets = data.get("facets", "1") != "0"
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    with _stage("search"):
+        total, results, counts = search_index.search(q, thresholds, page_size, (page - 1) * page_size, facets)
+    return jsonify({"results": results, "total": total, "page": page, "page_size": page_size,
+                    "facets": counts}), 200
+
+
+@app.route("/api/translate/stats", methods=["GET"])
+def translate_stats():
+    # originating = misses that went upstream, coalesced = misses that piggybacked on one
+    return jsonify({"cached": len(store), "store": store.stats(), "single_flight": in_flight.stats(),
+                    "upstream": translator.stats()}), 200
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=11111, debug=False, threaded=False, use_reloader=False)
+    # serve with waitress (a thread pool sharing one store and one upstream session) when it's
+    # installed; otherwise fall back to the threaded flask server. run multiple processes with
+    # e.g. `gunicorn -w 4 --threads 16 -b 0.0.0.0:11111 main:app` if one process isn't enough,
+    # keeping in mind each process holds its own copy of the cache
+    threads = int(os.getenv("SERVER_THREADS", "32"))
+    try:
+        from waitress import serve
+    except ImportError:
+        app.run(host='0.0.0.0', port=11111, debug=False, threaded=True, use_reloader=False)
+    else:
+        serve(app, host='0.0.0.0', port=11111, threads=threads, connection_limit=threads * 8)
@@ -0,0 +1,147 @@
+from __future__ import annotations
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# in-process counters and latency histograms, rendered in the Prometheus text format for /metrics.
+#
+# recording is a dict update under one lock, so it stays on in production. label values come from
+# the server (endpoint, stage) or are checked against a known set (target languages) before they
+# get here, so the number of series stays bounded whatever clients send.
+#
+# a RequestTimer collects the stage breakdown of one request. stages are recorded into
+# civiclens_stage_seconds when the request finishes, and with profiling on the same breakdown goes
+# back to the client as a Server-Timing header.
+
+# seconds; translate hits are sub-millisecond, upstream calls run to the 10s timeout
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}  # name -> {label items: value}
+        self._histograms = {}  # name -> {label items: [bucket counts..., +Inf count, sum]}
+        self._gauges = []  # callables returning [(name, help, {labels}, value)] at scrape time
+
+    def describe(self, name, kind, text):
+        self._help[name] = (kind, text)
+
+    def inc(self, name, labels=None, value=1):
+        key = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, seconds, labels=None):
+        self.observe_many(name, [(seconds, labels)])
+
+    def observe_many(self, name, observations):
+        # [(seconds, labels)] recorded under one lock acquisition
+        rows = [(bisect.bisect_left(self.buckets, seconds), seconds, tuple(sorted((labels or {}).items())))
+                for seconds, labels in observations]
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            for i, seconds, key in rows:
+                row = series.get(key)
+                if row is None:
+                    row = series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+                row[i] += 1
+                row[-1] += seconds
+
+    def gauges(self, fn):
+        self._gauges.append(fn)
+        return fn
+
+    def render(self):
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: {k: list(row) for k, row in series.items()} for name, series in self._histograms.items()}
+        lines = []
+
+        def header(name, default_kind):
+            kind, text = self._help.get(name, (default_kind, ""))
+            if text:
+                lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for name in sorted(counters):
+            header(name, "counter")
+            for key, value in sorted(counters[name].items()):
+                lines.append(f"{name}{_labels(key)} {_number(value)}")
+        for name in sorted(histograms):
+            header(name, "histogram")
+            for key, row in sorted(histograms[name].items()):
+                running = 0
+                for bound, count in zip(self.buckets + (float("inf"),), row[:-1]):
+                    running += count
+                    lines.append(f"{name}_bucket{_labels(key, ('le', _number(bound)))} {running}")
+                lines.append(f"{name}_sum{_labels(key)} {_number(row[-1])}")
+                lines.append(f"{name}_count{_labels(key)} {running}")
+        described = set()
+        for fn in self._gauges:
+            for name, text, labels, value in fn():
+                if name not in described:
+                    described.add(name)
+                    lines.append(f"# HELP {name} {text}")
+                    lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name}{_labels(sorted(labels.items()))} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class RequestTimer:
+    def __init__(self, metrics, endpoint, profile=False):
+        self.metrics = metrics
+        self.endpoint = endpoint
+        self.profile = profile
+        self.target = None
+        self.stages = []  # [(stage, seconds)] in the order they ran
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        a = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - a))
+
+    def finish(self, status):
+        total = time.perf_counter() - self.start
+        labels = {"endpoint": self.endpoint, "target": self.target or ""}
+        self.metrics.observe_many("civiclens_stage_seconds",
+                                  [(seconds, dict(labels, stage=name)) for name, seconds in self.stages])
+        self.metrics.observe("civiclens_request_seconds", total, dict(labels, status=str(status)))
+        return total
+
+    def server_timing(self, total):
+        # Server-Timing header value, durations in milliseconds; repeated stages are numbered
+        seen = {}
+        parts = []
+        for name, seconds in self.stages:
+            seen[name] = seen.get(name, 0) + 1
+            label = name if seen[name] == 1 else f"{name}-{seen[name]}"
+            parts.append(f"{label};dur={seconds * 1000:.3f}")
+        parts.append(f"total;dur={total * 1000:.3f}")
+        return ", ".join(parts)
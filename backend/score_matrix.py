@@ -0,0 +1,180 @@
+from __future__ import annotations
+import os
+import sys
+import json
+
+import numpy as np
+
+# compact form of the `scores` collection: one float32 row per bill, one column per label, and a
+# parallel array of bill ids. ranking for any weight vector is matrix @ weights plus an
+# argpartition top-k, and many users can be scored in one matrix product (feeds, notification
+# fan-out).
+#
+# snapshots are two plain .npy files (<path>.npy for the matrix, <path>.ids.npy for the ids) so
+# they can be memory-mapped: a fresh server process is ready without touching mongo, and every
+# process on the host shares the same page cache instead of holding its own copy.
+#
+#   MONGO_URI=... python score_matrix.py snapshot bills_matrix
+
+# must match candidate_labels in toolchain/categorize.py; columns are in this order
+LABELS = [
+    "agriculture",
+    "budget",
+    "economy",
+    "crime",
+    "education",
+    "environment",
+    "health",
+    "housing",
+    "infrastructure",
+    "judiciary",
+    "labor",
+    "safety",
+    "transportation",
+]
+LABEL_INDEX = {label: i for i, label in enumerate(LABELS)}
+# size of the (users x bills) score block top_k_many works on at once
+BLOCK_BYTES = 64 * 1024 * 1024
+
+
+def label_vector(values, fill=0.0):
+    # {label: value} -> float32 vector in column order; raises ValueError on unknown labels
+    vector = np.full(len(LABELS), fill, dtype=np.float32)
+    for label, value in values.items():
+        if label not in LABEL_INDEX:
+            raise ValueError(f"unknown label {label!r}")
+        vector[LABEL_INDEX[label]] = float(value)
+    return vector
+
+
+def _top(ranked, k):
+    # indices of the k largest entries of a 1-d array, largest first
+    k = min(k, len(ranked))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    part = np.argpartition(-ranked, k - 1)[:k] if k < len(ranked) else np.arange(len(ranked))
+    return part[np.argsort(-ranked[part], kind="stable")]
+
+
+class ScoreMatrix:
+    def __init__(self, ids, matrix):
+        self.ids = ids
+        self.matrix = matrix
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        return self.ids.nbytes + self.matrix.nbytes
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, dtype="U1"), np.zeros((0, len(LABELS)), dtype=np.float32))
+
+    @classmethod
+    def from_docs(cls, docs):
+        # docs: iterable of {_id, scores: {label: score}}; labels a doc lacks score 0
+        ids = []
+        rows = []
+        for doc in docs:
+            scores = doc.get("scores") or {}
+            ids.append(str(doc["_id"]))
+            rows.append([scores.get(label, 0.0) for label in LABELS])
+        matrix = np.array(rows, dtype=np.float32).reshape(len(rows), len(LABELS))
+        # fixed-width unicode rather than objects, so the ids can be saved and mapped without pickle
+        return cls(np.array(ids, dtype=str) if ids else np.empty(0, dtype="U1"), matrix)
+
+    def save(self, path):
+        # write next to the target and rename, so a reader mapping the old files never sees a torn one
+        for suffix, array in ((".npy", self.matrix), (".ids.npy", self.ids)):
+            # pid in the name: every server process snapshots to the same path
+            tmp = f"{path}{suffix}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp, path + suffix)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        mode = "r" if mmap else None
+        ids, matrix = np.load(path + ".ids.npy", mmap_mode=mode), np.load(path + ".npy", mmap_mode=mode)
+        if matrix.shape != (len(ids), len(LABELS)):
+            # caught between the two renames of a save, or written for another label set
+            raise ValueError(f"snapshot {path} has shape {matrix.shape} for {len(ids)} ids")
+        return cls(ids, matrix)
+
+    def mask(self, thresholds):
+        # rows meeting every {label: minimum score}, or None when there are no thresholds
+        if not thresholds:
+            return None
+        keep = np.ones(len(self.ids), dtype=bool)
+        for label, minimum in thresholds.items():
+            if label not in LABEL_INDEX:
+                raise ValueError(f"unknown label {label!r}")
+            keep &= self.matrix[:, LABEL_INDEX[label]] >= float(minimum)
+        return keep
+
+    def top_k(self, weights, k, offset=0, thresholds=None):
+        # (rows matching the thresholds, [(row, score)] for ranks offset..offset+k) for one weight vector
+        ranked = self.matrix @ weights
+        keep = self.mask(thresholds)
+        total = len(ranked)
+        if keep is not None:
+            ranked = np.where(keep, ranked, -np.inf)
+            total = int(keep.sum())
+        order = _top(ranked, min(offset + k, total))[offset:]
+        return total, [(int(i), float(ranked[i])) for i in order]
+
+    def top_k_many(self, weights, k):
+        # weights: (users x labels) -> (users x k) rows and scores, best first. users are scored a
+        # block at a time so the (users x bills) intermediate stays around BLOCK_BYTES
+        weights = np.asarray(weights, dtype=np.float32)
+        n = len(self.ids)
+        k = min(k, n)
+        rows = np.empty((len(weights), k), dtype=np.int64)
+        scores = np.empty((len(weights), k), dtype=np.float32)
+        if k == 0:
+            return rows, scores
+        step = max(1, BLOCK_BYTES // (4 * n))
+        for start in range(0, len(weights), step):
+            block = weights[start:start + step] @ self.matrix.T  # users x bills, one row per user
+            part = np.argpartition(-block, k - 1, axis=1)[:, :k] if k < n else np.broadcast_to(np.arange(n), block.shape)
+            top = np.take_along_axis(block, part, axis=1)
+            order = np.argsort(-top, axis=1, kind="stable")
+            rows[start:start + step] = np.take_along_axis(part, order, axis=1)
+            scores[start:start + step] = np.take_along_axis(top, order, axis=1)
+        return rows, scores
+
+    def rows_for(self, ids):
+        # row numbers for bill ids (missing ids are skipped)
+        position = {bill_id: i for i, bill_id in enumerate(self.ids.tolist())}
+        return np.array([position[bill_id] for bill_id in ids if bill_id in position], dtype=np.int64)
+
+    def fan_out(self, rows, weights, min_score):
+        # notification fan-out: for each given bill row, the users (rows of `weights`) whose weighted
+        # score for it reaches their min_score. returns {row: array of user indexes}
+        weights = np.asarray(weights, dtype=np.float32)
+        min_score = np.broadcast_to(np.asarray(min_score, dtype=np.float32), (len(weights),))
+        hits = (self.matrix[rows] @ weights.T) >= min_score  # bills x users
+        return {int(row): np.flatnonzero(hit) for row, hit in zip(rows, hits)}
+
+
+def snapshot(db, path):
+    matrix = ScoreMatrix.from_docs(db["scores"].find({}, {"scores": 1}))
+    matrix.save(path)
+    return matrix
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2 or argv[0] != "snapshot":
+        print("usage: score_matrix.py snapshot <path>")
+        return 2
+    from pymongo import MongoClient
+    matrix = snapshot(MongoClient(os.getenv("MONGO_URI"))["civiclens"], argv[1])
+    print(json.dumps({"bills": len(matrix), "bytes": matrix.nbytes, "path": argv[1]}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
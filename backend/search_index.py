@@ -0,0 +1,266 @@
+from __future__ import annotations
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from score_matrix import LABELS, LABEL_INDEX
+
+# full-text search over bills: a SQLite FTS5 table holding each bill's title, summary, bullet points
+# and cleaned text, next to a plain table with its label scores for facet filters.
+#
+#   index = SearchIndex("search.db")
+#   index.upsert([{"id": "HB12", "title": ..., "summary": ..., "bullets": [...], "body": ...,
+#                  "scores": {"health": 0.91, ...}, "version": ...}])
+#   index.search("drinking water", thresholds={"health": 0.5}, limit=20, facets=True)
+#
+# results are ranked by bm25 with the columns weighted by WEIGHTS, so a word in the title counts for
+# more than the same word deep in the bill text. thresholds keep only bills scoring at least that
+# much for a label; facets count the matching bills per label (score >= FACET_MIN) so the frontend
+# can show "health (120)" next to each filter.
+#
+# a query costs what it matches, so the work is kept off the per-match path where it can be:
+#   - the match set comes back as one group_concat string of rowids, parsed by numpy
+#   - thresholds, the total and the facet counts are numpy over a rowid-indexed copy of the scores
+#     (and a bitmask of each bill's facets) held in memory, refreshed from the rows a write touched
+#     by generation number, rather than a join per match
+#   - bm25 is computed for at most the RANK_WINDOW newest matches (rowids are assigned in the order
+#     bills were first indexed). a word in a fifth of all bills would otherwise mean scoring 20k rows
+#     (~3us each) per request, and past half the corpus FTS5 clamps its idf to ~0, so the ranking
+#     among that many matches is noise anyway
+#
+# the file is written by toolchain/index_search.py as bills, summaries and scores change (one
+# transaction per batch, upserts keyed by bill id) and read by the backend at the same time: WAL
+# mode lets readers keep going while a batch commits, and every thread gets its own connection.
+
+COLUMNS = ("title", "summary", "bullets", "body")
+WEIGHTS = (10.0, 5.0, 3.0, 1.0)
+FACET_MIN = 0.5
+RANK_WINDOW = 5000
+CACHE_SIZE = 256
+# dropped from queries unless the query is nothing but these; they match nearly every bill
+STOPWORDS = frozenset("""a an and are as at be by for from has have in is it its of on or that the this to was
+were will with shall such any all""".split())
+
+_phrase_re = re.compile(r'"([^"]*)"')
+_word_re = re.compile(r"\w+")
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta VALUES ('generation', 0);
+CREATE TABLE IF NOT EXISTS bills (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    version TEXT,
+    title TEXT,
+    generation INTEGER NOT NULL,
+    {", ".join(f"{label} REAL NOT NULL DEFAULT 0" for label in LABELS)}
+);
+CREATE INDEX IF NOT EXISTS bills_generation ON bills (generation);
+CREATE VIRTUAL TABLE IF NOT EXISTS bills_fts USING fts5(
+    {", ".join(COLUMNS)}, tokenize = 'porter unicode61 remove_diacritics 2'
+);
+"""
+
+
+def fts_query(text):
+    # user text -> an FTS5 query string, or None when nothing searchable is left. every word has to
+    # match (implicit AND) and "quoted words" have to match as a phrase. terms are quoted, so
+    # FTS5 operators and punctuation in the input are taken literally
+    phrases = [_word_re.findall(p.lower()) for p in _phrase_re.findall(text)]
+    words = _word_re.findall(_phrase_re.sub(" ", text).lower())
+    kept = [w for w in words if w not in STOPWORDS] or words
+    parts = ['"' + " ".join(p) + '"' for p in phrases if p] + [f'"{w}"' for w in dict.fromkeys(kept)]
+    return " ".join(parts) or None
+
+
+def _bullets(value):
+    return "\n".join(value) if isinstance(value, (list, tuple)) else (value or "")
+
+
+class SearchIndex:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._snapshot = (-1, np.zeros((0, len(LABELS)), dtype=np.float32), np.zeros(0, dtype=np.uint16))
+        # whole results by (generation, query, ...): the broad queries that cost the most are also
+        # the common ones, and any write moves the generation on
+        self._cache_lock = threading.Lock()
+        self._cache = OrderedDict()
+        with self._write_lock:
+            db = self._db()
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+            db.commit()
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def __len__(self):
+        return self._db().execute("SELECT count(*) FROM bills").fetchone()[0]
+
+    def generation(self):
+        return self._db().execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+
+    def versions(self):
+        # {bill id: version} of everything indexed, for working out what changed
+        return dict(self._db().execute("SELECT id, version FROM bills"))
+
+    def upsert(self, docs):
+        # docs: [{id, title, summary, bullets, body, scores, version}], written in one transaction
+        with self._write_lock:
+            db = self._db()
+            with db:
+                generation = self._bump(db)
+                for doc in docs:
+                    scores = doc.get("scores") or {}
+                    row = db.execute("SELECT rowid FROM bills WHERE id = ?", (doc["id"],)).fetchone()
+                    values = (doc.get("version"), doc.get("title") or "", generation,
+                              *(float(scores.get(label, 0.0)) for label in LABELS))
+                    if row is None:
+                        rowid = db.execute(
+                            f"INSERT INTO bills (id, version, title, generation, {', '.join(LABELS)}) "
+                            f"VALUES (?, {', '.join('?' * len(values))})", (doc["id"], *values)).lastrowid
+                    else:
+                        rowid = row[0]
+                        db.execute(f"UPDATE bills SET version = ?, title = ?, generation = ?, "
+                                   f"{', '.join(f'{label} = ?' for label in LABELS)} WHERE rowid = ?", (*values, rowid))
+                        db.execute("DELETE FROM bills_fts WHERE rowid = ?", (rowid,))
+                    db.execute("INSERT INTO bills_fts (rowid, title, summary, bullets, body) VALUES (?, ?, ?, ?, ?)",
+                               (rowid, doc.get("title") or "", doc.get("summary") or "",
+                                _bullets(doc.get("bullets")), doc.get("body") or ""))
+        return len(docs)
+
+    def remove(self, ids):
+        # removed bills stop matching, so their stale rows in the in-memory scores are never read
+        with self._write_lock:
+            db = self._db()
+            with db:
+                self._bump(db)
+                for bill_id in ids:
+                    row = db.execute("SELECT rowid FROM bills WHERE id = ?", (bill_id,)).fetchone()
+                    if row is not None:
+                        db.execute("DELETE FROM bills_fts WHERE rowid = ?", row)
+                        db.execute("DELETE FROM bills WHERE rowid = ?", row)
+        return len(ids)
+
+    def _bump(self, db):
+        db.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+        return db.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+
+    def optimize(self):
+        # merge the b-tree segments incremental writes leave behind; worth it after a big batch
+        with self._write_lock:
+            db = self._db()
+            with db:
+                db.execute("INSERT INTO bills_fts (bills_fts) VALUES ('optimize')")
+
+    def refresh(self):
+        # (generation, scores, flags) with scores[rowid] = that bill's label scores and bit j of
+        # flags[rowid] set when label j scores >= FACET_MIN, after catching up on rows written since
+        # the last call
+        generation = self.generation()
+        snapshot = self._snapshot
+        if generation == snapshot[0]:
+            return snapshot
+        with self._snapshot_lock:
+            loaded, scores, flags = self._snapshot
+            if generation != loaded:
+                rows = self._db().execute(f"SELECT rowid, {', '.join(LABELS)} FROM bills WHERE generation > ?",
+                                          (loaded,)).fetchall()
+                if rows:
+                    rows = np.array(rows, dtype=np.float64)
+                    rowids = rows[:, 0].astype(np.int64)
+                    size = max(len(scores), int(rowids.max()) + 1)
+                    # new arrays rather than writing into the ones readers may be holding
+                    scores = np.concatenate([scores, np.zeros((size - len(scores), len(LABELS)), dtype=np.float32)])
+                    scores[rowids] = rows[:, 1:]
+                    flags = np.concatenate([flags, np.zeros(size - len(flags), dtype=np.uint16)])
+                    flags[rowids] = ((rows[:, 1:] >= FACET_MIN) << np.arange(len(LABELS))).sum(axis=1)
+                self._snapshot = (generation, scores, flags)
+        return self._snapshot
+
+    def search(self, text, thresholds=None, limit=20, offset=0, facets=False):
+        # (total, [{id, title, score, snippet, scores}], {label: count} or None) for one page.
+        # score is bm25 negated, so higher is better; raises ValueError on unknown labels
+        limits = []
+        for label, minimum in (thresholds or {}).items():
+            if label not in LABEL_INDEX:
+                raise ValueError(f"unknown label {label!r}")
+            limits.append((LABEL_INDEX[label], float(minimum)))
+        query = fts_query(text)
+        if query is None:
+            return 0, [], ({label: 0 for label in LABELS} if facets else None)
+        generation, scores, flags = self.refresh()
+        key = (generation, query, tuple(sorted(limits)), limit, offset, facets)
+        with self._cache_lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        result = self._search(query, scores, flags, limits, limit, offset, facets)
+        with self._cache_lock:
+            self._cache[key] = result
+            while len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return result
+
+    def _search(self, query, scores, flags, limits, limit, offset, facets):
+        db = self._db()
+        found = db.execute("SELECT group_concat(rowid) FROM bills_fts WHERE bills_fts MATCH ?", (query,)).fetchone()[0]
+        matched = np.fromstring(found, dtype=np.int64, sep=",") if found else np.empty(0, dtype=np.int64)
+        # a bill written after refresh() can match before its scores are in memory
+        matched = matched[matched < len(scores)]
+        for column, minimum in limits:
+            matched = matched[scores[matched, column] >= minimum]
+        counts = None
+        if facets:
+            bits = flags[matched]
+            counts = {label: int(np.count_nonzero(bits & (1 << j))) for j, label in enumerate(LABELS)}
+        want = offset + limit
+        if not len(matched) or offset >= len(matched):
+            return len(matched), [], counts
+
+        # rank the newest RANK_WINDOW matches (more if the page is deeper than that)
+        floor = int(matched[-max(RANK_WINDOW, want)]) if len(matched) > max(RANK_WINDOW, want) else 0
+        allowed = None
+        if limits:
+            allowed = np.zeros(len(scores), dtype=bool)
+            allowed[matched] = True
+        ranked = []
+        cursor = db.execute(f"SELECT rowid, bm25(bills_fts, {', '.join(map(str, WEIGHTS))}) AS rank FROM bills_fts "
+                            "WHERE bills_fts MATCH ? AND rowid >= ? ORDER BY rank" + ("" if limits else " LIMIT ?"),
+                            (query, floor) + (() if limits else (want,)))
+        for rowid, rank in cursor:
+            if allowed is not None and (rowid >= len(allowed) or not allowed[rowid]):
+                continue
+            ranked.append((rowid, rank))
+            if len(ranked) == want:
+                break
+        cursor.close()
+        ranked = ranked[offset:]
+
+        marks = ", ".join("?" * len(ranked))
+        rowids = [rowid for rowid, _ in ranked]
+        titles = {rowid: (bill_id, title) for rowid, bill_id, title in db.execute(
+            f"SELECT rowid, id, title FROM bills WHERE rowid IN ({marks})", rowids)}
+        snippets = dict(db.execute(f"SELECT rowid, snippet(bills_fts, -1, '[', ']', '…', 16) FROM bills_fts "
+                                   f"WHERE bills_fts MATCH ? AND rowid IN ({marks})", (query, *rowids)))
+        hits = []
+        for rowid, rank in ranked:
+            bill_id, title = titles[rowid]
+            hits.append({"id": bill_id, "title": title, "score": -rank, "snippet": snippets.get(rowid, ""),
+                         "scores": {label: round(value, 4) for label, value in zip(LABELS, scores[rowid].tolist())}})
+        return len(matched), hits, counts
+
+    def stats(self):
+        size = sum(os.path.getsize(self.path + suffix) for suffix in ("", "-wal") if os.path.exists(self.path + suffix))
+        return {"bills": len(self), "generation": self.generation(), "bytes": size}
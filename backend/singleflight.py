@@ -0,0 +1,66 @@
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    # coalesces concurrent calls for the same key: the first caller (the leader) does the work,
+    # everyone else arriving while it's in flight waits for and shares its result
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.originating = 0
+        self.coalesced = 0
+
+    def claim(self, key):
+        # returns (call, is_leader); a leader must finish the call with resolve()
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                return call, False
+            call = _Call()
+            self._calls[key] = call
+            self.originating += 1
+            return call, True
+
+    def resolve(self, key, call, result=None, error=None):
+        call.result = result
+        call.error = error
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.done.set()
+
+    def wait(self, call, timeout=None):
+        if not call.done.wait(timeout):
+            raise TimeoutError("timed out waiting for in-flight call")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def do(self, key, fn):
+        call, leader = self.claim(key)
+        if not leader:
+            return self.wait(call)
+        try:
+            result = fn()
+        except BaseException as e:
+            self.resolve(key, call, error=e)
+            raise
+        self.resolve(key, call, result=result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "originating": self.originating,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls),
+            }
@@ -0,0 +1,267 @@
+from __future__ import annotations
+import os
+import time
+import random
+import threading
+
+import requests
+
+# the one way to call LibreTranslate, shared by the backend (main.py) and the scripts in toolchain/
+# and utils/.
+#
+#   client = TranslateClient("http://lt-a:5000/translate,http://lt-b:5000/translate")
+#   client.translate("Get Started", "es")           -> "Empezar"
+#   client.translate_many(["a", "b"], "es")         -> {"a": ..., "b": ...}, one newline-joined request
+#   client.post({"q": ..., "source": "en", "target": "es"})  -> the raw json
+#
+# - one keep-alive session, with a connection pool per replica, so calls reuse TCP/TLS connections
+# - at most max_concurrency requests in flight; a caller that can't get a slot within
+#   queue_timeout fails instead of piling up behind a slow upstream
+# - connection errors, timeouts, 429 and 5xx are retried on another replica when there is one,
+#   after a jittered exponential backoff
+# - each replica has a circuit breaker: after failure_threshold consecutive failures it stops
+#   taking requests for reset_after seconds, then lets one probe through and closes again if the
+#   probe succeeds. with every replica open, calls raise UpstreamUnavailable at once, so callers
+#   can fall back (english text, stale cache) instead of waiting on the timeout
+# - requests go to the replica with the fewest outstanding requests
+#
+# UpstreamUnavailable is a requests.RequestException, so existing `except RequestException`
+# handlers already cover it.
+
+DEFAULT_URL = "https://translate.civiclens.app/translate"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class UpstreamUnavailable(requests.RequestException):
+    # every replica's breaker is open, or no request slot freed up in time
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_after=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self.trips = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() - self.opened_at >= self.reset_after else "open"
+
+    def allow(self):
+        # None if the call may not go ahead, else a token to pass back to record(). closed: yes.
+        # open: no until reset_after has passed, then yes for one probe at a time
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if self._probing or time.monotonic() - self.opened_at < self.reset_after:
+                return None
+            self._probing = True
+            return "probe"
+
+    def record(self, ok, token="closed"):
+        with self._lock:
+            if token == "probe":
+                self._probing = False
+                if ok:
+                    self.failures = 0
+                    self.opened_at = None
+                else:
+                    self.failures += 1
+                    self.trips += 1
+                    self.opened_at = time.monotonic()
+                return
+            if self.opened_at is not None:
+                # a call that started before the breaker opened; only the probe decides when it closes
+                return
+            if ok:
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.trips += 1
+                self.opened_at = time.monotonic()
+
+
+class Replica:
+    def __init__(self, url, breaker):
+        self.url = url
+        self.breaker = breaker
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+
+
+def parse_urls(urls):
+    # "a,b" or ["a", "b"] -> ["a", "b"]
+    if isinstance(urls, str):
+        urls = urls.split(",")
+    return [u.strip() for u in urls if u and u.strip()]
+
+
+class TranslateClient:
+    def __init__(self, urls=None, pool_size=32, max_concurrency=16, timeout=10.0, connect_timeout=3.05,
+                 retries=2, backoff=0.25, failure_threshold=5, reset_after=30.0, queue_timeout=None,
+                 session=None, on_result=None):
+        # on_result(url, target, seconds, outcome) is called after every attempt, for metrics
+        urls = parse_urls(urls or os.getenv("TRANSLATE_URL", DEFAULT_URL))
+        if not urls:
+            raise ValueError("no translation urls")
+        self.replicas = [Replica(url, CircuitBreaker(failure_threshold, reset_after)) for url in urls]
+        self.timeout = (connect_timeout, timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.queue_timeout = timeout if queue_timeout is None else queue_timeout
+        self.on_result = on_result or (lambda *a: None)
+        self.session = session or requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max(1, len(urls)), pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    @property
+    def healthy(self):
+        return any(r.breaker.state != "open" for r in self.replicas)
+
+    def _pick(self, tried):
+        # least outstanding among replicas whose breaker lets a request through, preferring ones
+        # this call hasn't tried yet
+        with self._lock:
+            order = sorted(self.replicas, key=lambda r: (r in tried, r.outstanding, random.random()))
+            for replica in order:
+                token = replica.breaker.allow()
+                if token is not None:
+                    replica.outstanding += 1
+                    replica.requests += 1
+                    return replica, token
+        return None, None
+
+    def _done(self, replica, token, ok):
+        replica.breaker.record(ok, token)
+        with self._lock:
+            replica.outstanding -= 1
+            if not ok:
+                replica.errors += 1
+
+    def post(self, payload):
+        # the upstream json for one request; raises UpstreamUnavailable, requests.HTTPError for a
+        # 4xx, or the last error once retries are used up
+        target = payload.get("target", "")
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.rejected += 1
+            self.on_result(None, target, 0.0, "saturated")
+            raise UpstreamUnavailable("too many translation requests in flight")
+        try:
+            tried = []
+            error = None
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    # full jitter, so callers that failed together don't retry together
+                    time.sleep(random.uniform(0, self.backoff * 2 ** (attempt - 1)))
+                replica, token = self._pick(tried)
+                if replica is None:
+                    self.on_result(None, target, 0.0, "circuit_open")
+                    raise error or UpstreamUnavailable("translation upstream is unavailable")
+                tried.append(replica)
+                a = time.perf_counter()
+                outcome = "error"
+                ok = False
+                try:
+                    resp = self.session.post(replica.url, json=payload, timeout=self.timeout)
+                    if resp.status_code in RETRY_STATUSES:
+                        outcome = "http_error"
+                        resp.raise_for_status()
+                    if resp.status_code >= 400:
+                        # other 4xx are the request's fault, not the replica's
+                        outcome, ok = "rejected", True
+                        resp.raise_for_status()
+                    outcome = "bad_body"
+                    body = resp.json()
+                    outcome, ok = "ok", True
+                    return body
+                except requests.Timeout as e:
+                    outcome, error = "timeout", e
+                except requests.HTTPError as e:
+                    if outcome == "rejected":
+                        raise
+                    error = e
+                except requests.RequestException as e:
+                    if outcome != "bad_body":
+                        outcome = "connection"
+                    error = e
+                finally:
+                    self._done(replica, token, ok)
+                    self.on_result(replica.url, target, time.perf_counter() - a, outcome)
+            raise error
+        finally:
+            self._slots.release()
+
+    def translate(self, text, target, source="en", alternatives=None):
+        # one string -> its translation, or None when upstream answered without one
+        payload = {"q": text, "source": source, "target": target}
+        if alternatives:
+            payload["alternatives"] = alternatives
+        body = self.post(payload)
+        if body.get("alternatives"):
+            return body["alternatives"][0]
+        return body.get("translatedText") or None
+
+    def translate_many(self, texts, target, source="en", max_chars=5000):
+        # join lines with "\n" and split the translatedText back apart, so many strings cost one
+        # request. strings containing newlines, and chunks upstream merged or split lines in, go
+        # one at a time. failed strings are left out; stops early once upstream is unavailable
+        results = {}
+        singles = [t for t in texts if "\n" in t]
+        chunks, chunk, size = [], [], 0
+        for text in texts:
+            if "\n" in text:
+                continue
+            if chunk and size + len(text) + 1 > max_chars:
+                chunks.append(chunk)
+                chunk, size = [], 0
+            chunk.append(text)
+            size += len(text) + 1
+        if chunk:
+            chunks.append(chunk)
+
+        try:
+            for chunk in chunks:
+                try:
+                    body = self.post({"q": "\n".join(chunk), "source": source, "target": target})
+                except UpstreamUnavailable:
+                    raise
+                except (requests.RequestException, ValueError):
+                    continue
+                lines = (body.get("translatedText") or "").split("\n")
+                if len(lines) == len(chunk):
+                    results.update((text, line) for text, line in zip(chunk, lines) if line.strip())
+                else:
+                    singles.extend(chunk)
+            for text in singles:
+                try:
+                    translation = self.translate(text, target, source)
+                except UpstreamUnavailable:
+                    raise
+                except (requests.RequestException, ValueError):
+                    continue
+                if translation:
+                    results[text] = translation
+        except UpstreamUnavailable:
+            pass
+        return results
+
+    def stats(self):
+        with self._lock:
+            replicas = [{"url": r.url, "state": r.breaker.state, "outstanding": r.outstanding,
+                         "requests": r.requests, "errors": r.errors, "trips": r.breaker.trips}
+                        for r in self.replicas]
+            return {"replicas": replicas, "rejected": self.rejected}
@@ -0,0 +1,379 @@
+import os
+import re
+import sys
+import gzip
+import json
+import fcntl
+import argparse
+import threading
+from collections import OrderedDict
+
+
+# Helper: split leading non-alphanumeric characters (prefix) from the rest (core).
+# the cache is keyed by the core so "📊 Track Legislation" and "Track Legislation" share an entry
+def split_leading_prefix(s: str) -> tuple[str, str]:
+    if not s:
+        return "", ""
+    for i, ch in enumerate(s):
+        # isalnum covers Unicode letters and numbers
+        if ch in "QWERTYUIOPASDFGHJKLZXCVBNMqwertyuiopasdfghjklzxcvbnm1234567890":
+            return s[:i], s[i:]
+    # no alnum found -> everything is prefix
+    return s, ""
+
+
+class TranslationStore:
+    # in-memory translation cache keyed by (pipeline, core_text).
+    # cached_translations.json is the snapshot; new translations are appended to a
+    # jsonl log (one record per line) instead of rewriting the whole snapshot.
+
+    def __init__(self, snapshot_path, log_path=None):
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path or os.path.splitext(snapshot_path)[0] + ".log"
+        self._lock = threading.Lock()
+        self._data = {}
+        self._log = None
+        self.load()
+
+    def load(self):
+        data = {}
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            snapshot = {}
+        for pipeline, entries in snapshot.items():
+            for text, translation in entries.items():
+                data[(pipeline, text)] = translation
+
+        try:
+            with open(self.log_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # partially written last line from a crash, skip it
+                        continue
+                    data[(record["pipeline"], record["text"])] = record["translation"]
+        except FileNotFoundError:
+            pass
+
+        with self._lock:
+            self._data = data
+
+    def get(self, pipeline, text):
+        return self._data.get((pipeline, text))
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def put(self, pipeline, text, translation):
+        record = json.dumps({"pipeline": pipeline, "text": text, "translation": translation}, ensure_ascii=False)
+        with self._lock:
+            if self._data.get((pipeline, text)) == translation:
+                return
+            self._data[(pipeline, text)] = translation
+            if self._log is None:
+                self._log = open(self.log_path, "a", encoding="utf-8")
+            self._log.write(record + "\n")
+            self._log.flush()
+
+    def pipelines(self):
+        return sorted(set(pipeline for pipeline, _ in self._data))
+
+    def to_dict(self):
+        out = {}
+        for (pipeline, text), translation in list(self._data.items()):
+            out.setdefault(pipeline, {})[text] = translation
+        return out
+
+    def compact(self):
+        # fold the log back into the snapshot file and truncate the log
+        with self._lock:
+            tmp = self.snapshot_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.to_dict(), f, ensure_ascii=False, indent=4)
+            os.replace(tmp, self.snapshot_path)
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            open(self.log_path, "w", encoding="utf-8").close()
+
+
+# shard files are named after their pipeline, so anything else (e.g. a made-up target from a
+# request) never touches the filesystem
+PIPELINE_RE = re.compile(r"^[a-z]{2,3}-[A-Za-z]{2,3}(-[A-Za-z]{2,4})?$")
+
+
+def _entry_bytes(text, translation):
+    # rough resident cost of one cached pair: both strings plus a dict slot
+    return sys.getsizeof(text) + sys.getsizeof(translation) + 100
+
+
+class ShardedTranslationStore:
+    # translation cache with one shard per pipeline in `directory`:
+    #   <pipeline>.json.gz (or .json)  compact {text: translation} snapshot
+    #   <pipeline>.log                 jsonl of translations added since the last compact
+    #   <pipeline>.log.compacting      the log while `compact` (often another process) folds it in
+    # a shard is read the first time its pipeline is asked for, and loaded shards are kept in an
+    # LRU under memory_budget bytes. evicting loses nothing since every put is in the log.
+    # appends hold flock on the log and compact takes it after renaming the log away, so a record
+    # is either in the rotated file before compact reads it or in a fresh .log.
+
+    def __init__(self, directory, compress=True, memory_budget=512 * 1024 * 1024):
+        self.directory = directory
+        self.compress = compress
+        self.memory_budget = memory_budget
+        self._lock = threading.Lock()
+        self._shards = OrderedDict()  # pipeline -> {text: translation}, least recently used first
+        self._sizes = {}
+        self._loading = {}  # pipeline -> lock, so concurrent first requests parse a shard once
+        self._logs = {}
+        self._versions = {}  # pipeline -> bumped on every load and put, for things built from a shard
+        self.loads = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, pipeline):
+        stem = os.path.join(self.directory, pipeline)
+        return stem + ".json.gz", stem + ".json", stem + ".log"
+
+    def _rotated(self, pipeline):
+        return self._paths(pipeline)[2] + ".compacting"
+
+    @staticmethod
+    def _read_log(path, data):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # partially written last line from a crash, skip it
+                        continue
+                    data[record["text"]] = record["translation"]
+        except FileNotFoundError:
+            pass
+
+    def _read(self, pipeline):
+        gz_path, json_path, log_path = self._paths(pipeline)
+        data = {}
+        if os.path.exists(gz_path):
+            with gzip.open(gz_path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        elif os.path.exists(json_path):
+            with open(json_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        # a rotated log is left over from a compact that hasn't finished (or crashed); it is older
+        # than whatever is in the current log
+        self._read_log(self._rotated(pipeline), data)
+        self._read_log(log_path, data)
+        # every pipeline is keyed by the same english strings; share one copy between loaded shards
+        return {sys.intern(text): translation for text, translation in data.items()}
+
+    def _shard(self, pipeline):
+        with self._lock:
+            shard = self._shards.get(pipeline)
+            if shard is not None:
+                self._shards.move_to_end(pipeline)
+                return shard
+            loading = self._loading.setdefault(pipeline, threading.Lock())
+        with loading:
+            with self._lock:
+                if pipeline in self._shards:
+                    return self._shards[pipeline]
+            data = self._read(pipeline)
+            size = sum(_entry_bytes(t, v) for t, v in data.items())
+            with self._lock:
+                self._shards[pipeline] = data
+                self._sizes[pipeline] = size
+                self._versions[pipeline] = self._versions.get(pipeline, 0) + 1
+                self.loads += 1
+                self._evict(keep=pipeline)
+            return data
+
+    def _evict(self, keep):
+        # caller holds self._lock
+        while sum(self._sizes.values()) > self.memory_budget and len(self._shards) > 1:
+            pipeline = next(iter(self._shards))
+            if pipeline == keep:
+                self._shards.move_to_end(pipeline)
+                continue
+            del self._shards[pipeline]
+            del self._sizes[pipeline]
+            self.evictions += 1
+
+    def get(self, pipeline, text):
+        if not PIPELINE_RE.match(pipeline):
+            return None
+        return self._shard(pipeline).get(text)
+
+    def __contains__(self, key):
+        return self.get(*key) is not None
+
+    def version(self, pipeline):
+        # changes whenever the pipeline's shard is (re)loaded or gains a translation
+        with self._lock:
+            return self._versions.get(pipeline, 0)
+
+    def __len__(self):
+        # entries in the shards currently loaded
+        with self._lock:
+            return sum(len(shard) for shard in self._shards.values())
+
+    def put(self, pipeline, text, translation):
+        if not PIPELINE_RE.match(pipeline):
+            return
+        shard = self._shard(pipeline)
+        record = json.dumps({"text": text, "translation": translation}, ensure_ascii=False)
+        with self._lock:
+            if shard.get(text) == translation:
+                return
+            shard[text] = translation
+            self._versions[pipeline] = self._versions.get(pipeline, 0) + 1
+            if pipeline in self._sizes:
+                self._sizes[pipeline] += _entry_bytes(text, translation)
+                self._evict(keep=pipeline)
+            self._append(pipeline, record)
+
+    def _append(self, pipeline, record):
+        # caller holds self._lock
+        path = self._paths(pipeline)[2]
+        while True:
+            log = self._logs.get(pipeline)
+            if log is None:
+                log = self._logs[pipeline] = open(path, "a", encoding="utf-8")
+            fcntl.flock(log, fcntl.LOCK_EX)
+            try:
+                # a compact in another process may have renamed the file this handle points at
+                try:
+                    current = os.stat(path).st_ino == os.fstat(log.fileno()).st_ino
+                except FileNotFoundError:
+                    current = False
+                if current:
+                    log.write(record + "\n")
+                    log.flush()
+                    return
+            finally:
+                fcntl.flock(log, fcntl.LOCK_UN)
+            log.close()
+            del self._logs[pipeline]
+
+    def pipelines(self):
+        names = set()
+        for name in os.listdir(self.directory):
+            for suffix in (".json.gz", ".json", ".log", ".log.compacting"):
+                if name.endswith(suffix) and PIPELINE_RE.match(name[:-len(suffix)]):
+                    names.add(name[:-len(suffix)])
+        return sorted(names)
+
+    def stats(self):
+        with self._lock:
+            return {"loaded": list(self._shards), "bytes": sum(self._sizes.values()),
+                    "budget": self.memory_budget, "loads": self.loads, "evictions": self.evictions}
+
+    def write_shard(self, pipeline, data):
+        gz_path, json_path, _ = self._paths(pipeline)
+        path = gz_path if self.compress else json_path
+        tmp = path + ".tmp"
+        blob = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        if self.compress:
+            with gzip.open(tmp, "wb", compresslevel=6) as f:
+                f.write(blob)
+        else:
+            with open(tmp, "wb") as f:
+                f.write(blob)
+        os.replace(tmp, path)
+        # drop the other format so a shard never has two snapshots
+        stale = json_path if self.compress else gz_path
+        if os.path.exists(stale):
+            os.remove(stale)
+
+    def compact(self, pipeline=None):
+        # fold each shard's log back into its snapshot. the log is renamed to .log.compacting
+        # first, so a backend still appending to this pipeline starts a fresh .log instead of
+        # writing into a file that is about to be deleted
+        for name in [pipeline] if pipeline else self.pipelines():
+            with self._lock:
+                log = self._logs.pop(name, None)
+                if log is not None:
+                    log.close()
+                log_path, rotated = self._paths(name)[2], self._rotated(name)
+                if os.path.exists(log_path) and not os.path.exists(rotated):
+                    os.rename(log_path, rotated)
+                if os.path.exists(rotated):
+                    # wait out an append that opened the log before the rename
+                    with open(rotated, "a", encoding="utf-8") as f:
+                        fcntl.flock(f, fcntl.LOCK_EX)
+                        fcntl.flock(f, fcntl.LOCK_UN)
+                data = self._read(name)
+                self.write_shard(name, data)
+                if os.path.exists(rotated):
+                    os.remove(rotated)
+                if name in self._shards:
+                    self._shards[name] = data
+
+
+def migrate(snapshot_path, directory, compress=True):
+    # cached_translations.json (+ its log) -> one shard per pipeline
+    legacy = TranslationStore(snapshot_path)
+    store = ShardedTranslationStore(directory, compress=compress)
+    counts = {}
+    for pipeline, entries in legacy.to_dict().items():
+        if not PIPELINE_RE.match(pipeline):
+            print(f"skipping pipeline {pipeline!r}: not a valid shard name")
+            continue
+        # keep anything already in the directory, the legacy file wins on conflicts
+        merged = store._read(pipeline)
+        merged.update(entries)
+        store.write_shard(pipeline, merged)
+        counts[pipeline] = len(merged)
+    store.compact()
+    return counts
+
+
+def migrate_once(snapshot_path, directory, compress=True):
+    # migrate() on the first start after the switch to shards. several server workers can start
+    # at once: one migrates under a lock file while the rest wait, and the shard directory
+    # appears with a single rename, so nobody serves from a half-written one
+    if os.path.isdir(directory) or not os.path.exists(snapshot_path):
+        return None
+    stem = directory.rstrip(os.sep)
+    with open(stem + ".migrate.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.isdir(directory):
+            return None
+        tmp = f"{stem}.migrating.{os.getpid()}"
+        counts = migrate(snapshot_path, tmp, compress)
+        os.rename(tmp, directory)
+        return counts
+
+
+def main(argv=None):
+    base = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Maintain the backend translation cache")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("migrate", help="split cached_translations.json into per-pipeline shards")
+    p.add_argument("--src", default=os.path.join(base, "cached_translations.json"))
+    p.add_argument("--dest", default=os.path.join(base, "translations"))
+    p.add_argument("--no-compress", action="store_true")
+    p = sub.add_parser("compact", help="fold shard logs back into their snapshots")
+    p.add_argument("--dir", default=os.path.join(base, "translations"))
+    p.add_argument("--no-compress", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "migrate":
+        counts = migrate(args.src, args.dest, compress=not args.no_compress)
+        print(f"Migrated {sum(counts.values())} translations in {len(counts)} pipelines into {args.dest}")
+    else:
+        store = ShardedTranslationStore(args.dir, compress=not args.no_compress)
+        store.compact()
+        print(f"Compacted {len(store.pipelines())} pipelines in {args.dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
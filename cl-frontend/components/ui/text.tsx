@@ -5,6 +5,7 @@ import * as React from 'react';
 import { Platform, Text as RNText, type Role } from 'react-native';
 import { useSettings } from '@/lib/SettingsContext';
 import extractor, { addTextsFromNode, registerText, postTexts } from './text-extractor';
+import { translateQueued } from '@/lib/translate';
 
 const textVariants = cva(
   cn(
@@ -219,7 +220,6 @@ function Text({
       }
 
       let didCancel = false;
-      const controller = typeof AbortController !== 'undefined' ? new AbortController() : undefined;
 
       const doFetch = async () => {
         setIsTranslating(true);
@@ -228,30 +228,16 @@ function Text({
         console.log(target);
         // let target2 = "en";
         try {
-          const resp = await fetch('https://civiclens.app/api/translate', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ text: text, source: 'en', target: target }),
-            signal: controller?.signal,
-          });
-          if (!resp.ok) throw new Error(`status ${resp.status}`);
-          const body = await resp.json();
-          // Accept either {alternatives: [str]} or {translation: str}
-          let result: string | undefined;
-          if (body) {
-            if (Array.isArray(body.alternatives) && body.alternatives.length) result = body.alternatives[0];
-            if (!result && typeof body.translation === 'string') result = body.translation;
-            if (!result && typeof body.text === 'string') result = body.text;
-            if (!result && typeof body.translatedText === 'string') result = body.translatedText;
-          }
-          if (!didCancel && result) {
+          // batched with every other string rendered this tick (lib/translate)
+          const result = await translateQueued(text);
+          if (!didCancel && result && result !== text) {
             translationCache.current.set(cacheKey, result);
             setTranslated(result);
             // eslint-disable-next-line no-console
             console.log('[Text] translation received for', cacheKey, '->', result);
           } else {
             // eslint-disable-next-line no-console
-            console.log('[Text] translation fetch returned no result for', cacheKey, body);
+            console.log('[Text] translation fetch returned no result for', cacheKey);
           }
         } catch (err) {
           // noop: leave translated as null and render original
@@ -267,11 +253,6 @@ function Text({
 
       return () => {
         didCancel = true;
-        try {
-          controller?.abort();
-        } catch (e) {
-          // ignore
-        }
       };
     }
     // If not a string/number, clear any previous translated state
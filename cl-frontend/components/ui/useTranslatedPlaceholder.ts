@@ -1,5 +1,6 @@
 import * as React from 'react';
 import { registerText } from './text-extractor';
+import { translateQueued } from '@/lib/translate';
 
 /**
  * Custom hook for translating placeholder text.
@@ -113,38 +114,13 @@ export function useTranslatedPlaceholder(placeholder?: string): string | undefin
     }
 
     let didCancel = false;
-    const controller = typeof AbortController !== 'undefined' ? new AbortController() : undefined;
 
     const doFetch = async () => {
       try {
-        const resp = await fetch('https://civiclens.app/api/translate', {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({ text: text, source: 'en', target: target }),
-          signal: controller?.signal,
-        });
-        
-        if (!resp.ok) throw new Error(`status ${resp.status}`);
-        
-        const body = await resp.json();
-        let result: string | undefined;
-        
-        if (body) {
-          if (Array.isArray(body.alternatives) && body.alternatives.length) {
-            result = body.alternatives[0];
-          }
-          if (!result && typeof body.translation === 'string') {
-            result = body.translation;
-          }
-          if (!result && typeof body.text === 'string') {
-            result = body.text;
-          }
-          if (!result && typeof body.translatedText === 'string') {
-            result = body.translatedText;
-          }
-        }
-        
-        if (!didCancel && result) {
+        // batched with every other string rendered this tick (lib/translate)
+        const result = await translateQueued(text);
+
+        if (!didCancel && result && result !== text) {
           translationCache.current.set(cacheKey, result);
           setTranslated(result);
         }
@@ -157,11 +133,6 @@ export function useTranslatedPlaceholder(placeholder?: string): string | undefin
 
     return () => {
       didCancel = true;
-      try {
-        controller?.abort();
-      } catch (e) {
-        // ignore
-      }
     };
   }, [placeholder, langVersion, resolveTargetLang]);
 
@@ -29,6 +29,66 @@ function resolveTargetLang(): string {
   return 'en';
 }
 
+// Per-language bundle of every UI string (/api/translations/<lang>). The last one received is kept
+// in localStorage with its ETag, so a launch seeds the cache from disk and costs one conditional
+// request: 304 when nothing changed, the new bundle otherwise.
+const bundleLoads = new Map<string, Promise<void>>();
+
+function applyBundle(target: string, translations: Record<string, string>) {
+  for (const [text, result] of Object.entries(translations || {})) {
+    if (typeof result === 'string' && result) cache.set(`${target}::${text}`, result);
+  }
+  try {
+    // eslint-disable-next-line @typescript-eslint/no-explicit-any
+    (window as any)?.dispatchEvent?.(new CustomEvent('civic-lens-translation-updated', { detail: { target } }));
+  } catch (e) {
+    // ignore
+  }
+}
+
+export function loadBundle(target: string = resolveTargetLang()): Promise<void> {
+  if (target === 'en') return Promise.resolve();
+  const existing = bundleLoads.get(target);
+  if (existing) return existing;
+
+  const storageKey = `translationBundle:${target}`;
+  let etag: string | undefined;
+  try {
+    if (typeof localStorage !== 'undefined') {
+      const saved = JSON.parse(localStorage.getItem(storageKey) || 'null');
+      if (saved && saved.translations) {
+        applyBundle(target, saved.translations);
+        etag = saved.etag;
+      }
+    }
+  } catch (e) {
+    // ignore
+  }
+
+  const load = (async () => {
+    try {
+      const resp = await fetch(`https://civiclens.app/api/translations/${encodeURIComponent(target)}`, {
+        headers: etag ? { 'If-None-Match': etag } : {},
+      });
+      if (resp.status === 304 || !resp.ok) return;
+      const body = await resp.json();
+      applyBundle(target, body?.translations);
+      try {
+        if (typeof localStorage !== 'undefined') {
+          localStorage.setItem(storageKey, JSON.stringify({ etag: resp.headers.get('ETag'), translations: body?.translations }));
+        }
+      } catch (e) {
+        // ignore (quota)
+      }
+    } catch (err) {
+      // offline: keep whatever was seeded from storage, and allow a retry later
+      bundleLoads.delete(target);
+    }
+  })();
+  bundleLoads.set(target, load);
+  return load;
+}
+
 export async function translate(text: string, opts?: { signal?: AbortSignal }): Promise<string> {
   if (text == null) return '';
   const trimmed = String(text).trim();
@@ -38,6 +98,7 @@ export async function translate(text: string, opts?: { signal?: AbortSignal }):
   if (target === 'en') return trimmed;
 
   const key = `${target}::${trimmed}`;
+  if (!cache.get(key)) await loadBundle(target);
   const cached = cache.get(key);
   if (cached) return cached;
 
@@ -50,6 +111,9 @@ export async function translate(text: string, opts?: { signal?: AbortSignal }):
     });
     if (!resp.ok) throw new Error(`status ${resp.status}`);
     const body = await resp.json();
+    // the backend answers with the english text while the translation service is down; show it but
+    // don't cache it, so the next call tries again
+    if (body?.fallback) return trimmed;
     let result: string | undefined;
     if (body) {
       if (Array.isArray(body.alternatives) && body.alternatives.length) result = body.alternatives[0];
@@ -74,6 +138,85 @@ export async function translate(text: string, opts?: { signal?: AbortSignal }):
   return trimmed;
 }
 
+// Translate a whole screen of strings in one round trip and warm the cache with the results.
+export async function translateBatch(texts: string[], opts?: { signal?: AbortSignal }): Promise<string[]> {
+  const trimmed = texts.map((t) => (t == null ? '' : String(t).trim()));
+  const target = resolveTargetLang();
+  if (target === 'en') return trimmed;
+
+  await loadBundle(target);
+  const pending = Array.from(new Set(trimmed.filter((t) => t && !cache.has(`${target}::${t}`))));
+  if (pending.length) {
+    try {
+      const resp = await fetch('https://civiclens.app/api/translate/batch', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ texts: pending, source: 'en', target }),
+        signal: opts?.signal as any,
+      });
+      if (!resp.ok) throw new Error(`status ${resp.status}`);
+      const body = await resp.json();
+      const results: (string | null)[] = Array.isArray(body?.translations) ? body.translations : [];
+      pending.forEach((text, i) => {
+        const result = results[i];
+        if (typeof result === 'string' && result) {
+          const key = `${target}::${text}`;
+          cache.set(key, result);
+          try {
+            // eslint-disable-next-line @typescript-eslint/no-explicit-any
+            (window as any)?.dispatchEvent?.(new CustomEvent('civic-lens-translation-updated', { detail: { key, result } }));
+          } catch (e) {
+            // ignore
+          }
+        }
+      });
+    } catch (err) {
+      // ignore and fallthrough to return originals for anything missing
+    }
+  }
+  return trimmed.map((t) => (t ? cache.get(`${target}::${t}`) ?? t : t));
+}
+
+// Strings asked for during one render pass are collected and sent as a single translateBatch call
+// on the next tick, so a screen of <Text> nodes costs one request instead of one per node.
+let queued = new Map<string, { resolve: (t: string) => void }[]>();
+let flushTimer: ReturnType<typeof setTimeout> | null = null;
+const BATCH_MAX = 100;
+
+function flushQueued() {
+  flushTimer = null;
+  const waiting = queued;
+  queued = new Map();
+  const texts = Array.from(waiting.keys());
+  for (let i = 0; i < texts.length; i += BATCH_MAX) {
+    const chunk = texts.slice(i, i + BATCH_MAX);
+    translateBatch(chunk)
+      .catch(() => chunk)
+      .then((results) => {
+        chunk.forEach((text, j) => {
+          for (const waiter of waiting.get(text) || []) waiter.resolve(results[j] ?? text);
+        });
+      });
+  }
+}
+
+export function translateQueued(text: string): Promise<string> {
+  if (text == null) return Promise.resolve('');
+  const trimmed = String(text).trim();
+  if (!trimmed) return Promise.resolve(trimmed);
+  const target = resolveTargetLang();
+  if (target === 'en') return Promise.resolve(trimmed);
+  const cached = cache.get(`${target}::${trimmed}`);
+  if (cached) return Promise.resolve(cached);
+
+  return new Promise((resolve) => {
+    const waiters = queued.get(trimmed) || [];
+    waiters.push({ resolve });
+    queued.set(trimmed, waiters);
+    if (flushTimer == null) flushTimer = setTimeout(flushQueued, 0);
+  });
+}
+
 export function translateSync(text: string): string {
 
     console.log(text);
@@ -98,6 +241,7 @@ export function translateSync(text: string): string {
 export function clearTranslateCache(): number {
   const n = cache.size;
   cache.clear();
+  bundleLoads.clear();
   try {
     // also dispatch language changed so components re-evaluate
     // eslint-disable-next-line @typescript-eslint/no-explicit-any
@@ -130,4 +274,4 @@ try {
   // ignore
 }
 
-export default { translate, translateSync, clearTranslateCache };
+export default { translate, translateBatch, translateQueued, translateSync, clearTranslateCache, loadBundle };
@@ -0,0 +1,132 @@
+# how categorize time grows with the number of labels, full NLI vs the embedding screen
+#
+#   python bench_screening.py --labels 13 26 52 104 --bills 200
+#
+# offline: the NLI model and the encoder are stand-ins with a fixed cost per pair / per text (the
+# same shape as the real ones: the pipeline's work is one forward pass per text x label, the
+# encoder's one per text). synthetic topics each own a handful of keywords, and bills mention one to
+# three topics. reports NLI pairs per bill, seconds, items/sec and how many of the labels the full
+# run scores >= 0.5 the screened run still does.
+
+import sys
+import json
+import time
+import random
+import argparse
+
+import numpy as np
+
+from label_screen import ScreenedClassifier, screen_options
+
+
+class FakeNLI:
+    tokenizer = None
+
+    def __init__(self, topics, seconds_per_pair):
+        self.topics = topics
+        self.seconds_per_pair = seconds_per_pair
+
+    def __call__(self, sequences, candidate_labels, multi_label=True, batch_size=8, hypothesis_template=None):
+        single = isinstance(sequences, str)
+        sequences = [sequences] if single else sequences
+        time.sleep(self.seconds_per_pair * len(sequences) * len(candidate_labels))
+        out = []
+        for seq in sequences:
+            words = set(seq.split())
+            scores = [len(words & self.topics[label]) / len(self.topics[label]) for label in candidate_labels]
+            out.append({"sequence": seq, "labels": list(candidate_labels), "scores": scores})
+        return out[0] if single else out
+
+    def score_pairs(self, pairs, batch_size=8):
+        # the flattened path ScreenedClassifier takes; hypotheses end in the topic name
+        time.sleep(self.seconds_per_pair * len(pairs))
+        topics = [self.topics[hypothesis.rstrip(".").split()[-1]] for _, hypothesis in pairs]
+        return np.array([len(set(premise.split()) & topic) / len(topic) for (premise, _), topic in zip(pairs, topics)])
+
+
+class FakeEncoder:
+    # a bag of word vectors, with a topic's name standing for the sum of its keywords
+    def __init__(self, topics, seconds_per_text, dim=64):
+        rng = np.random.default_rng(0)
+        self.vectors = {}
+        for label, words in topics.items():
+            for word in words:
+                self.vectors[word] = rng.normal(size=dim).astype(np.float32)
+        for label, words in topics.items():
+            self.vectors[label] = sum(self.vectors[w] for w in words)
+        self.dim = dim
+        self.seconds_per_text = seconds_per_text
+
+    def __call__(self, texts, batch_size=32):
+        time.sleep(self.seconds_per_text * len(texts))
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.rstrip(".").split():
+                out[i] += self.vectors.get(word, 0)
+        return out / np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-9)
+
+
+def make_corpus(n_labels, n_bills, seed=0):
+    rnd = random.Random(seed)
+    topics = {f"topic{i}": {f"t{i}w{j}" for j in range(6)} for i in range(n_labels)}
+    filler = [f"filler{j}" for j in range(200)]
+    bills = []
+    for _ in range(n_bills):
+        words = rnd.sample(filler, 40)
+        for label in rnd.sample(sorted(topics), rnd.randint(1, 3)):
+            words += rnd.sample(sorted(topics[label]), rnd.randint(2, 5))
+        rnd.shuffle(words)
+        bills.append(" ".join(words))
+    return topics, bills
+
+
+def positives(result, cut=0.5):
+    return {label for label, score in zip(result["labels"], result["scores"]) if score >= cut}
+
+
+def bench(n_labels, n_bills, batch_size, pair_cost, text_cost, screen):
+    topics, bills = make_corpus(n_labels, n_bills)
+    labels = sorted(topics)
+    nli = FakeNLI(topics, pair_cost)
+    out = {"labels": n_labels, "bills": n_bills}
+
+    a = time.perf_counter()
+    full = nli(bills, labels, batch_size=batch_size)
+    elapsed = time.perf_counter() - a
+    out["full"] = {"nli_pairs_per_bill": n_labels, "seconds": round(elapsed, 2),
+                   "items_per_sec": round(n_bills / elapsed, 1)}
+
+    screened = ScreenedClassifier(nli, FakeEncoder(topics, text_cost), screen["top"], screen["min_similarity"],
+                                  screen["floor"])
+    a = time.perf_counter()
+    got = screened(bills, labels, batch_size=batch_size, hypothesis_template="{}")
+    elapsed = time.perf_counter() - a
+    # of the labels the full run puts at >= 0.5, how many the screened run does too, and how many
+    # it adds
+    hit = sum(len(positives(f) & positives(g)) for f, g in zip(full, got))
+    wanted = sum(len(positives(f)) for f in full) or 1
+    extra = sum(len(positives(g) - positives(f)) for f, g in zip(full, got))
+    out["screened"] = {"nli_pairs_per_bill": round(screened.pairs["nli"] / n_bills, 2), "seconds": round(elapsed, 2),
+                       "items_per_sec": round(n_bills / elapsed, 1), "recall_at_0.5": round(hit / wanted, 3),
+                       "extra_at_0.5": extra}
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--labels", type=int, nargs="+", default=[13, 26, 52, 104])
+    parser.add_argument("--bills", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--pair-cost", type=float, default=0.0005, help="seconds per NLI pair")
+    parser.add_argument("--text-cost", type=float, default=0.0002, help="seconds per encoder text")
+    parser.add_argument("--top", type=int, default=4)
+    parser.add_argument("--min-similarity", type=float, default=0.35)
+    args = parser.parse_args(argv)
+    screen = screen_options("fake", args.top, args.min_similarity)
+    for n in args.labels:
+        print(json.dumps(bench(n, args.bills, args.batch_size, args.pair_cost, args.text_cost, screen)), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,361 @@
+# offline benchmarks for the backend and toolchain hot paths, with a regression check.
+#
+#   python bench_suite.py run --out bench_results.json
+#   python bench_suite.py run --quick --only translate_hit translate_miss
+#   python bench_suite.py compare bench_baseline.json bench_results.json --tolerance 0.25
+#   python bench_suite.py run --baseline bench_baseline.json      # run, then compare
+#
+# everything runs against local stand-ins, so results don't depend on the network:
+#   translate_*   the backend app (flask test client) over a fresh shard directory, with
+#                 backend/loadtest.py's fake LibreTranslate behind it
+#   ingest        legiscan_data.sync against fake_congress.py, into mongomock
+#   categorize    categorize.process on a tiny numpy NLI model with a real (word-level) fast
+#                 tokenizer, so chunking and the per-pair batching run as they do for the real one
+#   summarize_*   generate_summaries.run_concurrent against fake_openai.py
+#
+# compare looks at every metric whose name says which way is better (*_ms / *_seconds lower,
+# *_per_sec higher) and flags the ones that moved the wrong way by more than the tolerance. it
+# exits 1 when anything regressed, so it can gate a change. numbers are only comparable on the same
+# machine, so keep the baseline next to where it was recorded.
+
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+
+import numpy as np
+
+base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(base, 'backend'))
+
+# below this much movement a latency isn't flagged, whatever the ratio (timer noise on sub-ms paths)
+MIN_DELTA_MS = 0.05
+WORDS = ("the state shall provide funding for public schools teachers students farm crop water river "
+         "police court judge sentence tax revenue budget deficit hospital patient insurance medicaid "
+         "highway bridge transit rail housing rent tenant wage worker union safety fire emergency "
+         "environment emissions climate energy grid broadband contract agency report section act").split()
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def latency(times):
+    return {"p50_ms": round(percentile(times, 50) * 1000, 3), "p99_ms": round(percentile(times, 99) * 1000, 3),
+            "per_sec": round(len(times) / sum(times), 1) if sum(times) else 0.0}
+
+
+def make_texts(n, words=600, seed=0):
+    rnd = random.Random(seed)
+    return [" ".join(rnd.choice(WORDS) for _ in range(words)) for _ in range(n)]
+
+
+# --- translate -----------------------------------------------------------------------------
+
+_app = None
+
+
+def backend_app(upstream_delay):
+    # imports backend/main.py once, pointed at a fake upstream and an empty shard directory
+    global _app
+    if _app is None:
+        from http.server import ThreadingHTTPServer
+        from loadtest import make_fake_upstream
+        server = ThreadingHTTPServer(("127.0.0.1", 0), make_fake_upstream(upstream_delay))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        os.environ["TRANSLATIONS_DIR"] = tempfile.mkdtemp(prefix="bench-translations-")
+        os.environ["TRANSLATE_URL"] = f"http://127.0.0.1:{server.server_port}/translate"
+        import main
+        _app = main
+    return _app
+
+
+def bench_translate_hit(args):
+    main = backend_app(args.upstream_delay)
+    client = main.app.test_client()
+    texts = [f"hit string {i}" for i in range(50)]
+    for text in texts:
+        main.store.put("en-es", text, text[::-1])
+    times = []
+    for i in range(args.requests):
+        a = time.perf_counter()
+        r = client.post("/api/translate", json={"text": texts[i % len(texts)], "target": "es"})
+        times.append(time.perf_counter() - a)
+        assert r.status_code == 200
+    return latency(times)
+
+
+def bench_translate_miss(args):
+    main = backend_app(args.upstream_delay)
+    client = main.app.test_client()
+    times = []
+    for i in range(max(1, args.requests // 10)):
+        a = time.perf_counter()
+        r = client.post("/api/translate", json={"text": f"miss string {i} {time.time()}", "target": "fr"})
+        times.append(time.perf_counter() - a)
+        assert r.status_code == 200
+    return dict(latency(times), upstream_delay_s=args.upstream_delay)
+
+
+def bench_translate_batch(args):
+    main = backend_app(args.upstream_delay)
+    client = main.app.test_client()
+    cold, warm = [], []
+    for i in range(max(1, args.requests // 50)):
+        texts = [f"batch {i} string {j} {time.time()}" for j in range(50)]
+        for times in (cold, warm):
+            a = time.perf_counter()
+            r = client.post("/api/translate/batch", json={"texts": texts, "target": "de"})
+            times.append(time.perf_counter() - a)
+            assert r.status_code == 200 and None not in r.json["translations"]
+    return {"strings_per_request": 50, "cold": latency(cold), "warm": latency(warm)}
+
+
+# --- ingest --------------------------------------------------------------------------------
+
+def bench_ingest(args):
+    import mongomock
+    import legiscan_data
+    from fake_congress import FakeCongress
+
+    fake = FakeCongress(bills=args.bills, latency=args.upstream_delay).start()
+    legiscan_data.LEGISCAN_URL = fake.base + "/legiscan/"
+    legiscan_data.CONGRESS_API_URL = fake.base + "/v3"
+    base_db = mongomock.MongoClient()["civiclens"]
+    try:
+        session = legiscan_data.make_session(8)
+        a = time.perf_counter()
+        stats = legiscan_data.sync(base_db, session, workers=8, api_rate=1000, text_rate=1000, log=lambda *a: None)
+        elapsed = time.perf_counter() - a
+    finally:
+        fake.stop()
+    stored = base_db["bills"].count_documents({})
+    return {"bills": stored, "failed": stats["failed"], "seconds": round(elapsed, 3),
+            "bills_per_sec": round(stored / elapsed, 1)}
+
+
+# --- categorize ----------------------------------------------------------------------------
+
+class TinyZeroShot:
+    # a few-kilobyte stand-in for comprehend_it: tokenizes every premise/hypothesis pair with a
+    # fast tokenizer like the pipeline does, then mean-pools hashed word embeddings through a
+    # small MLP to (contradiction, entailment) logits
+    def __init__(self, dim=64, hidden=256, seed=0):
+        from tokenizers import Tokenizer, models, pre_tokenizers
+        from tokenizers.processors import TemplateProcessing
+        from transformers import PreTrainedTokenizerFast
+        import categorize
+
+        words = dict.fromkeys(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "this", "example", "is", "."] + WORDS +
+                              list(categorize.candidate_labels))
+        vocab = {w: i for i, w in enumerate(words)}
+        tok = Tokenizer(models.WordLevel(vocab, unk_token="[UNK]"))
+        tok.pre_tokenizer = pre_tokenizers.Whitespace()
+        tok.post_processor = TemplateProcessing(single="[CLS] $A [SEP]", pair="[CLS] $A [SEP] $B:1 [SEP]:1",
+                                                special_tokens=[("[CLS]", 2), ("[SEP]", 3)])
+        self.tokenizer = PreTrainedTokenizerFast(tokenizer_object=tok, pad_token="[PAD]", unk_token="[UNK]",
+                                                 model_max_length=512)
+        rng = np.random.default_rng(seed)
+        self.embeddings = rng.normal(size=(len(vocab), dim)).astype(np.float32)
+        self.w1 = (rng.normal(size=(dim, hidden)) * 0.2).astype(np.float32)
+        self.w2 = (rng.normal(size=(hidden, 2)) * 0.2).astype(np.float32)
+
+    def __call__(self, sequences, candidate_labels, multi_label=True, batch_size=8,
+                 hypothesis_template="This example is {}."):
+        single = isinstance(sequences, str)
+        sequences = [sequences] if single else list(sequences)
+        pairs = [(s, hypothesis_template.format(label)) for s in sequences for label in candidate_labels]
+        probs = []
+        for i in range(0, len(pairs), batch_size):
+            chunk = pairs[i:i + batch_size]
+            enc = self.tokenizer([p for p, _ in chunk], [h for _, h in chunk], padding=True,
+                                 truncation="only_first", return_tensors="np")
+            mask = enc["attention_mask"][..., None].astype(np.float32)
+            pooled = (self.embeddings[enc["input_ids"]] * mask).sum(1) / mask.sum(1)
+            logits = np.tanh(pooled @ self.w1) @ self.w2
+            probs.extend(1 / (1 + np.exp(logits[:, 0] - logits[:, 1])))
+        probs = np.array(probs).reshape(len(sequences), len(candidate_labels))
+        out = [{"sequence": s, "labels": list(candidate_labels), "scores": [float(p) for p in row]}
+               for s, row in zip(sequences, probs)]
+        return out[0] if single else out
+
+
+def bench_categorize(args):
+    import mongomock
+    import categorize
+    from result_cache import text_hash
+
+    base_db = mongomock.MongoClient()["civiclens"]
+    classifier = TinyZeroShot()
+    chunk_opts = categorize.chunk_options("max", 128, None)
+    cache = categorize.make_cache(base_db, chunk_opts)
+    texts = make_texts(args.bills, seed=1)
+    work = [({"_id": f"HB{i}", "text": text}, cache.key_for_hash(text_hash(text))) for i, text in enumerate(texts)]
+    a = time.perf_counter()
+    processed, _, stats, failed = categorize.process(base_db, cache, work, 8, 1, 1, chunk_opts, log=lambda *a: None,
+                                                     classifier=classifier)
+    elapsed = time.perf_counter() - a
+    windows = sum(s["windows"] for s in stats)
+    return {"bills": processed, "failed": failed, "windows_per_bill": round(windows / max(1, len(stats)), 2),
+            "seconds": round(elapsed, 3), "items_per_sec": round(processed / elapsed, 2)}
+
+
+# --- summarize -----------------------------------------------------------------------------
+
+def bench_summarize(args, concurrency):
+    import mongomock
+    import openai
+    import generate_summaries
+    from fake_openai import FakeOpenAI
+
+    fake = FakeOpenAI(latency=args.openai_latency).start()
+    client = openai.OpenAI(api_key="bench", base_url=fake.base, max_retries=0)
+    base_db = mongomock.MongoClient()["civiclens"]
+    cache = generate_summaries.make_cache(base_db)
+    bills = [({"_id": f"HB{i}", "text": text}, hashlib.sha256(text.encode()).hexdigest())
+             for i, text in enumerate(make_texts(args.summaries, words=200, seed=2))]
+    a = time.perf_counter()
+    done, failed = generate_summaries.run_concurrent(client, base_db, cache, bills, concurrency=concurrency,
+                                                     log=lambda *a: None)
+    elapsed = time.perf_counter() - a
+    fake.server.shutdown()
+    return {"concurrency": concurrency, "summaries": done, "failed": failed, "seconds": round(elapsed, 3),
+            "summaries_per_sec": round(done / elapsed, 2), "max_in_flight": fake.max_in_flight}
+
+
+BENCHMARKS = {
+    "translate_hit": bench_translate_hit,
+    "translate_miss": bench_translate_miss,
+    "translate_batch": bench_translate_batch,
+    "ingest": bench_ingest,
+    "categorize": bench_categorize,
+    "summarize_serial": lambda args: bench_summarize(args, 1),
+    "summarize_concurrent": lambda args: bench_summarize(args, args.summarize_concurrency),
+}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=base, capture_output=True, text=True,
+                              timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(args):
+    results = {}
+    for name in args.only or list(BENCHMARKS):
+        print(f"{name}...", file=sys.stderr, flush=True)
+        results[name] = BENCHMARKS[name](args)
+        print(f"  {json.dumps(results[name])}", file=sys.stderr, flush=True)
+    return {
+        "meta": {"commit": git_commit(), "python": platform.python_version(), "machine": platform.machine(),
+                 "cpus": os.cpu_count(), "when": time.strftime("%Y-%m-%dT%H:%M:%S"), "quick": args.quick},
+        "results": results,
+    }
+
+
+def flatten(tree, prefix=""):
+    out = {}
+    for key, value in tree.items():
+        if isinstance(value, dict):
+            out.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[prefix + key] = value
+    return out
+
+
+def direction(metric):
+    # +1 when higher is better, -1 when lower is better, None for counts and settings
+    name = metric.rsplit(".", 1)[-1]
+    if name.endswith("per_sec"):
+        return 1
+    if name.endswith("_ms") or name == "seconds":
+        return -1
+    return None
+
+
+def compare(baseline, current, tolerance=0.25):
+    # [(metric, baseline, current, change)] for every directional metric, and the regressed subset
+    old, new = flatten(baseline["results"]), flatten(current["results"])
+    rows, regressed = [], []
+    for metric in sorted(old.keys() & new.keys()):
+        sign = direction(metric)
+        if sign is None or not old[metric]:
+            continue
+        change = (new[metric] - old[metric]) / old[metric]
+        rows.append((metric, old[metric], new[metric], change))
+        worse = -sign * change > tolerance
+        if worse and metric.endswith("_ms") and abs(new[metric] - old[metric]) < MIN_DELTA_MS:
+            worse = False
+        if worse:
+            regressed.append(metric)
+    return rows, regressed
+
+
+def print_comparison(rows, regressed, tolerance):
+    for metric, old, new, change in rows:
+        flag = "  REGRESSION" if metric in regressed else ""
+        print(f"{metric:45s} {old:>12g} -> {new:<12g} {change:+7.1%}{flag}")
+    print(f"{len(regressed)} regression(s) beyond {tolerance:.0%}" if regressed else f"no regressions beyond {tolerance:.0%}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks with a baseline comparison")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("run")
+    p.add_argument("--only", nargs="+", choices=list(BENCHMARKS))
+    p.add_argument("--out", help="write results here (default: stdout)")
+    p.add_argument("--baseline", help="compare against this results file afterwards")
+    p.add_argument("--tolerance", type=float, default=0.25)
+    p.add_argument("--quick", action="store_true", help="smaller workloads, for a smoke test")
+    p.add_argument("--requests", type=int, default=2000, help="translate requests for the hit benchmark")
+    p.add_argument("--bills", type=int, default=200, help="bills for ingest and categorize")
+    p.add_argument("--summaries", type=int, default=64)
+    p.add_argument("--summarize-concurrency", type=int, default=16)
+    p.add_argument("--upstream-delay", type=float, default=0.005, help="fake LibreTranslate / congress latency")
+    p.add_argument("--openai-latency", type=float, default=0.05)
+    p = sub.add_parser("compare")
+    p.add_argument("baseline")
+    p.add_argument("current")
+    p.add_argument("--tolerance", type=float, default=0.25, help="relative change counted as a regression")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "compare":
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.current, encoding="utf-8") as f:
+            current = json.load(f)
+        rows, regressed = compare(baseline, current, args.tolerance)
+        print_comparison(rows, regressed, args.tolerance)
+        return 1 if regressed else 0
+
+    if args.quick:
+        args.requests, args.bills, args.summaries = min(args.requests, 300), min(args.bills, 40), min(args.summaries, 16)
+    report = run(args)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows, regressed = compare(baseline, report, args.tolerance)
+        print_comparison(rows, regressed, args.tolerance)
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,24 +1,35 @@
 import dotenv
 dotenv.load_dotenv()
-from transformers.utils import logging
 import os
+import sys
+import json
+import atexit
+import argparse
 import pymongo
+from pymongo import ReplaceOne
 import time
+import itertools
+import multiprocessing
+import collections
 
-logging.set_verbosity_error()
+import chunking
+from result_cache import ResultCache
+from work_selection import iter_work
+import changeset
 
-from transformers import pipeline
-
-print("Loading classification model...")
-classifier = pipeline("zero-shot-classification",
-                      model="knowledgator/comprehend_it-base",
-                      device=-1)  # CPU only
-print("Model loaded successfully!")
+MODEL_NAME = "knowledgator/comprehend_it-base"
+# torch (the stock transformers pipeline), onnx or onnx-int8; the onnx backends load from an
+# exported directory, see onnx_backend.py
+BACKENDS = ("torch", "onnx", "onnx-int8")
+BACKEND = os.getenv("CLASSIFIER_BACKEND", "torch")
+MODEL_DIR = os.getenv("CLASSIFIER_MODEL_DIR")
+# rough resident size of one comprehend_it-base pipeline on CPU, used to size the worker pool
+MODEL_RSS_BYTES = 1_500_000_000
 
 candidate_labels = [
 "agriculture",
 "budget",
-"economy", 
+"economy",
 "crime",
 "education",
 "environment",
@@ -31,76 +42,419 @@ candidate_labels = [
 "transportation"
 ]
 
-mongo_uri = os.getenv("MONGO_URI")
-client = pymongo.MongoClient(mongo_uri)
 
-db = client["civiclens"]["bills"]
-target = client["civiclens"]["scores"]
+# one model per process and backend, loaded on first use
+_classifiers = {}
+
+
+def model_options(backend=None, model_dir=None, screen=None):
+    # screen: label_screen.screen_options(...) to put the embedding screen in front of the model
+    return {"backend": backend or BACKEND, "model_dir": model_dir or MODEL_DIR, "screen": screen}
+
+
+def load_classifier(model_opts=None, threads=None):
+    # transformers (and torch under it) take seconds to import, so it only happens in processes
+    # that actually run the model
+    model_opts = model_opts or model_options()
+    key = (model_opts["backend"], model_opts["model_dir"])
+    if key not in _classifiers:
+        import onnx_backend
+        _classifiers[key] = onnx_backend.load(model_opts["backend"], model_opts["model_dir"], MODEL_NAME, threads)
+    screen = model_opts.get("screen")
+    if not screen:
+        return _classifiers[key]
+    screened = key + (json.dumps(screen, sort_keys=True),)
+    if screened not in _classifiers:
+        import label_screen
+        _classifiers[screened] = label_screen.wrap(_classifiers[key], screen, threads)
+    return _classifiers[screened]
+
+
+def add_screen_args(parser):
+    parser.add_argument("--screen", action="store_true",
+                        help="score labels with a sentence embedding first and only run the NLI model on the "
+                             "top/borderline ones (see label_screen.py)")
+    parser.add_argument("--screen-model", default=None, help="embedding model name or local dir ($SCREEN_MODEL)")
+    parser.add_argument("--screen-top", type=int, default=None, help="labels per window always sent to the NLI model")
+    parser.add_argument("--screen-min-similarity", type=float, default=None,
+                        help="also send any label at least this similar to the window")
+    parser.add_argument("--screen-floor", type=float, default=None, help="screened-out labels score similarity * this")
+
+
+def screen_from_args(args):
+    if not args.screen:
+        return None
+    import label_screen
+    given = {"model": args.screen_model, "top": args.screen_top, "min_similarity": args.screen_min_similarity,
+             "floor": args.screen_floor}
+    return label_screen.screen_options(**{k: v for k, v in given.items() if v is not None})
+
+
+def chunk_options(aggregate, window_tokens, max_windows):
+    if aggregate == "off":
+        return None
+    return {"method": aggregate, "max_tokens": window_tokens, "max_windows": max_windows}
+
+
+def classify(classifier, texts, batch_size=8):
+    # the pipeline takes a list of sequences and batches the premise/hypothesis pairs itself
+    out = classifier(texts, candidate_labels, multi_label=True, batch_size=batch_size)
+    if isinstance(out, dict):
+        out = [out]
+    return [dict(zip(data["labels"], data["scores"])) for data in out]
+
+
+def default_workers(threads_per_worker=2):
+    # as many model copies as the cores and memory allow, leaving one core for mongo/io
+    cores = os.cpu_count() or 1
+    by_cores = max(1, (cores - 1) // threads_per_worker)
+    try:
+        ram = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        by_ram = max(1, int(ram * 0.75) // MODEL_RSS_BYTES)
+    except (ValueError, OSError, AttributeError):
+        by_ram = by_cores
+    return max(1, min(by_cores, by_ram))
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# per-process model copy for worker pools, loaded once by _init_worker
+_worker_classifier = None
+_worker_batch_size = 8
+_worker_chunking = None
+
+
+def _init_worker(threads, batch_size, chunk_opts=None, model_opts=None):
+    global _worker_classifier, _worker_batch_size, _worker_chunking
+    model_opts = model_opts or model_options()
+    if model_opts["backend"] == "torch":
+        import torch
+        torch.set_num_threads(threads)
+    _worker_classifier = load_classifier(model_opts, threads)
+    _worker_batch_size = batch_size
+    _worker_chunking = chunk_opts
+
+
+def _classify_texts(classifier, texts, batch_size, chunk_opts):
+    # returns (scores, per-text window stats or None)
+    if not chunk_opts:
+        return classify(classifier, texts, batch_size), None
+    return chunking.classify_long(classifier, texts, candidate_labels, batch_size=batch_size, **chunk_opts)
+
+
+def classify_items(classifier, items, batch_size, chunk_opts=None):
+    # returns (results, errors, stats); falls back to one at a time if a batch fails so one bad
+    # bill doesn't take the rest of the batch down with it. stats holds per-bill compute time
+    # (the batch's wall time split by window count) and window counts when chunking
+    results, errors, stats = [], [], []
+    a = time.perf_counter()
+    try:
+        scores, window_stats = _classify_texts(classifier, [item["text"] for item in items], batch_size, chunk_opts)
+        elapsed = time.perf_counter() - a
+        window_stats = window_stats or [{"windows": 1, "window_tokens": 0} for _ in items]
+        total_windows = sum(max(1, st["windows"]) for st in window_stats) or 1
+        for item, s, st in zip(items, scores, window_stats):
+            results.append({"_id": item["_id"], "scores": s})
+            stats.append(dict(st, seconds=elapsed * max(1, st["windows"]) / total_windows))
+    except Exception:
+        for item in items:
+            a = time.perf_counter()
+            try:
+                scores, window_stats = _classify_texts(classifier, [item["text"]], batch_size, chunk_opts)
+                results.append({"_id": item["_id"], "scores": scores[0]})
+                st = window_stats[0] if window_stats else {"windows": 1, "window_tokens": 0}
+                stats.append(dict(st, seconds=time.perf_counter() - a))
+            except Exception as e:
+                errors.append((item["_id"], str(e)))
+    return results, errors, stats
+
+
+def _work(items):
+    return classify_items(_worker_classifier, items, _worker_batch_size, _worker_chunking)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def print_latency_report(stats):
+    if not stats:
+        return
+    seconds = [st["seconds"] for st in stats]
+    print(f"Per-bill compute time: p50 {percentile(seconds, 50):.2f}s, p90 {percentile(seconds, 90):.2f}s, "
+          f"p99 {percentile(seconds, 99):.2f}s, max {max(seconds):.2f}s")
+    if any("clean_chars" in st for st in stats):
+        raw = sum(st.get("raw_chars", 0) for st in stats)
+        clean = sum(st.get("clean_chars", 0) for st in stats)
+        windows = sum(st["windows"] for st in stats)
+        print(f"Markup stripped: {raw} -> {clean} chars ({100 * (1 - clean / raw) if raw else 0:.1f}% removed), "
+              f"{windows} windows ({windows / len(stats):.1f} per bill)")
+
+
+def run_sequential(classifier, items):
+    # the original loop: one bill per pipeline call
+    results = []
+    for item in items:
+        data = classifier(item["text"], candidate_labels, multi_label=True)
+        results.append({"_id": item["_id"], "scores": dict(zip(data["labels"], data["scores"]))})
+    return results
+
 
-print("Connecting to database...")
+def run_batched(items, batch_size, workers, threads_per_worker, chunk_size=None, classifier=None, chunk_opts=None,
+                model_opts=None):
+    # yields (results, errors, stats) per chunk as soon as it finishes so callers can stream inserts
+    chunk_size = chunk_size or batch_size * 4
+    chunks = batched(items, chunk_size)
+    if workers <= 1:
+        if classifier is None:
+            classifier = load_classifier(model_opts)
+        for chunk in chunks:
+            yield classify_items(classifier, chunk, batch_size, chunk_opts)
+        return
 
-# Get list of already categorized item IDs
-print("Checking for already categorized items...")
-already_categorized = set(doc["_id"] for doc in target.find({}, {"_id": 1}))
-print(f"Found {len(already_categorized)} already categorized items")
+    # submit with a bounded window instead of imap_unordered, which would drain the whole
+    # (lazily fetched) item stream into the task queue up front
+    pool = get_pool(workers, threads_per_worker, batch_size, chunk_opts, model_opts)
+    window = collections.deque()
+    for chunk in chunks:
+        window.append(pool.apply_async(_work, (chunk,)))
+        if len(window) >= workers * 2:
+            yield window.popleft().get()
+    while window:
+        yield window.popleft().get()
 
-# Fetch all items to process
-print("Fetching items to process...")
-items_to_process = list(db.find(
-    {"_id": {"$nin": list(already_categorized)}}, 
-    {"_id": 1, "text": 1}  # Only fetch needed fields
-))
 
-print(f"Found {len(items_to_process)} items to process")
+# worker pools outlive a single run, so a long-lived process (pipeline.py --every) loads the model
+# into each worker once rather than once per run
+_pools = {}
+
+
+def get_pool(workers, threads_per_worker, batch_size, chunk_opts, model_opts=None):
+    model_opts = model_opts or model_options()
+    key = (workers, threads_per_worker, batch_size, json.dumps(chunk_opts, sort_keys=True),
+           json.dumps(model_opts, sort_keys=True))
+    if key not in _pools:
+        ctx = multiprocessing.get_context("spawn")
+        _pools[key] = ctx.Pool(workers, initializer=_init_worker,
+                               initargs=(threads_per_worker, batch_size, chunk_opts, model_opts))
+    return _pools[key]
+
+
+@atexit.register
+def close_pools():
+    while _pools:
+        _, pool = _pools.popitem()
+        pool.terminate()
+        pool.join()
+
+
+def make_cache(base_db, chunk_opts, model_opts=None):
+    # anything that changes what the model is asked (or how it computes) goes in the key. the torch
+    # backend keeps the original params so existing cache entries stay valid
+    params = {"labels": candidate_labels, "multi_label": True, "chunking": chunk_opts}
+    model_opts = model_opts or model_options()
+    if model_opts["backend"] != "torch":
+        params["backend"] = model_opts["backend"]
+    if model_opts.get("screen"):
+        params["screen"] = model_opts["screen"]
+    return ResultCache(base_db["result_cache"], "categorize", MODEL_NAME, params)
+
+
+def process(base_db, cache, work, batch_size, workers, threads_per_worker, chunk_opts, on_done=None, log=print,
+            model_opts=None, classifier=None):
+    # classifies an iterable of (bill, key) and writes the scores. bills sharing a key are classified
+    # once and the result written to all of them; keys already in the result cache are copied over
+    # without running the model. on_done(ids) is called as scores land. with one worker, `classifier`
+    # replaces the one model_opts would load.
+    # returns (processed, reused, per-bill stats, failed)
+    target = base_db["scores"]
+    keys = {}
+    same_text = {}
+    finished = {}
+    reused = 0
+    failed = 0
+    on_done = on_done or (lambda ids: None)
+
+    def write_scores(ids, key, scores):
+        target.bulk_write([ReplaceOne({"_id": _id}, {"scores": scores, "key": key}, upsert=True) for _id in ids],
+                          ordered=False)
+        on_done(ids)
+
+    def items_to_process():
+        nonlocal reused
+        for batch in batched(work, batch_size * 4):
+            cached = cache.get_many([key for _, key in batch])
+            for item, key in batch:
+                if key in cached:
+                    write_scores([item["_id"]], key, cached[key])
+                    reused += 1
+                elif key in finished:
+                    write_scores([item["_id"]], key, finished[key])
+                elif key in same_text:
+                    same_text[key].append(item["_id"])
+                else:
+                    same_text[key] = [item["_id"]]
+                    keys[item["_id"]] = key
+                    yield item
 
-if not items_to_process:
-    print("No items to process!")
-else:
-    INSERT_BATCH_SIZE = 25  # Insert results in batches
-    
     total_processed = 0
     start_time = time.time()
-    insert_buffer = []
-    
-    print(f"Starting to process {len(items_to_process)} items...")
-    
-    # Process items one by one (reliable approach)
-    for i, item in enumerate(items_to_process):
-        try:
-            print(f"Processing item {i+1}/{len(items_to_process)}: {item['_id']}")
-            
-            text = item["text"]
-            data = classifier(text, candidate_labels, multi_label=True)
-            
-            result = {
-                "_id": item["_id"], 
-                "scores": dict(zip(data["labels"], data["scores"]))
-            }
-            
-            insert_buffer.append(result)
-            total_processed += 1
-            
-            # Insert when buffer is full
-            if len(insert_buffer) >= INSERT_BATCH_SIZE:
-                target.insert_many(insert_buffer)
-                print(f"✓ Inserted batch of {len(insert_buffer)} scores")
-                insert_buffer = []
-            
-            # Progress update every 5 items
-            if total_processed % 5 == 0:
-                elapsed = time.time() - start_time
-                rate = total_processed / elapsed if elapsed > 0 else 0
-                eta = (len(items_to_process) - total_processed) / rate if rate > 0 else 0
-                print(f"Progress: {total_processed}/{len(items_to_process)} ({rate:.2f} items/sec, ETA: {eta/60:.1f}min)")
-            
-        except Exception as e:
-            print(f"Error processing item {item['_id']}: {e}")
-            continue
-    
-    # Insert any remaining items
-    if insert_buffer:
-        target.insert_many(insert_buffer)
-        print(f"✓ Inserted final batch of {len(insert_buffer)} scores")
-    
+
+    log(f"Starting to process items with {workers} worker(s), batch size {batch_size}, "
+        f"{(model_opts or model_options())['backend']} backend...")
+
+    all_stats = []
+    for results, errors, stats in run_batched(items_to_process(), batch_size, workers, threads_per_worker,
+                                              classifier=classifier, chunk_opts=chunk_opts, model_opts=model_opts):
+        all_stats.extend(stats)
+        for _id, err in errors:
+            log(f"Error processing item {_id}: {err}")
+            # the bills waiting on this one's text failed with it
+            failed += len(same_text.pop(keys.pop(_id, None), [_id]))
+        if results:
+            writes, new, done = [], {}, []
+            for r in results:
+                key = keys.pop(r["_id"])
+                ids = same_text.pop(key)
+                writes.extend(ReplaceOne({"_id": _id}, {"scores": r["scores"], "key": key}, upsert=True) for _id in ids)
+                new[key] = r["scores"]
+                done.extend(ids)
+            target.bulk_write(writes, ordered=False)
+            cache.put_many(new)
+            finished.update(new)
+            on_done(done)
+            log(f"✓ Inserted batch of {len(results)} scores")
+        total_processed += len(results)
+
+        elapsed = time.time() - start_time
+        rate = total_processed / elapsed if elapsed > 0 else 0
+        log(f"Progress: {total_processed} processed, {reused} reused from cache ({rate:.2f} items/sec)")
+
+    return total_processed, reused, all_stats, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Zero-shot categorize bills into the scores collection")
+    parser.add_argument("--batch-size", type=int, default=8, help="bills per pipeline call")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes, each with its own model (0 = size to cores/RAM)")
+    parser.add_argument("--threads-per-worker", type=int, default=2)
+    parser.add_argument("--aggregate", choices=chunking.AGGREGATIONS + ("off",), default="max",
+                        help="how window scores combine into a bill score; off = pass the raw text (truncated by the model)")
+    parser.add_argument("--window-tokens", type=int, default=chunking.DEFAULT_MAX_TOKENS)
+    parser.add_argument("--max-windows", type=int, default=None, help="cap windows per bill, spread evenly over the text")
+    parser.add_argument("--backend", choices=BACKENDS, default=BACKEND,
+                        help="model runtime (default $CLASSIFIER_BACKEND or torch); onnx ones need --model-dir")
+    parser.add_argument("--model-dir", default=MODEL_DIR,
+                        help="local model directory, loaded offline (default $CLASSIFIER_MODEL_DIR)")
+    add_screen_args(parser)
+    parser.add_argument("--changes", action="store_true",
+                        help="only look at bills in changesets from legiscan_data.py this stage hasn't consumed yet")
+    parser.add_argument("--recheck-legacy", action="store_true",
+                        help="also redo bills whose scores predate content keys")
+    parser.add_argument("--compare", type=int, default=0, metavar="N",
+                        help="don't write anything; time the one-by-one loop against the batched mode on N bills")
+    args = parser.parse_args(argv)
+    workers = args.workers or default_workers(args.threads_per_worker)
+    chunk_opts = chunk_options(args.aggregate, args.window_tokens, args.max_windows)
+    model_opts = model_options(args.backend, args.model_dir, screen_from_args(args))
+
+    mongo_uri = os.getenv("MONGO_URI")
+    client = pymongo.MongoClient(mongo_uri)
+
+    cache = make_cache(client["civiclens"], chunk_opts, model_opts)
+
+    print("Connecting to database...")
+
+    # new bills, and bills whose text or scoring setup changed; texts are fetched lazily in batches
+    print("Fetching items to process...")
+    query = {}
+    changesets = []
+    if args.changes:
+        changesets, touched, _ = changeset.pending(client["civiclens"], "categorize")
+        print(f"{len(changesets)} pending changesets touching {len(touched)} bills")
+        query = {"_id": {"$in": list(touched)}}
+    work = iter_work(client["civiclens"], "scores", cache, query=query, recheck_legacy=args.recheck_legacy,
+                     batch_size=args.batch_size * 4)
+
+    if args.compare:
+        items = [item for item, _ in itertools.islice(work, args.compare)]
+        return compare(items, args.batch_size, workers, args.threads_per_worker, chunk_opts, model_opts)
+
+    start_time = time.time()
+    total_processed, reused, all_stats, failed = process(client["civiclens"], cache, work, args.batch_size, workers,
+                                                     args.threads_per_worker, chunk_opts, model_opts=model_opts)
+
+    if not total_processed and not failed:
+        print("No items to process!" if not reused else f"✓ Reused {reused} cached scores, nothing else to process")
+        changeset.mark_consumed(client["civiclens"], "categorize", changesets)
+        return 0
+
     final_time = time.time() - start_time
     print(f"\n🎉 Completed! Processed {total_processed} items in {final_time/60:.1f} minutes ({total_processed/final_time:.2f} items/sec)")
+    print_latency_report(all_stats)
+    # keep the changesets pending if anything failed so the next --changes run retries it
+    if failed:
+        print(f"{failed} items failed; changesets left pending")
+    else:
+        changeset.mark_consumed(client["civiclens"], "categorize", changesets)
+    return 0
+
+
+def compare(items, batch_size, workers, threads_per_worker, chunk_opts=None, model_opts=None):
+    if not items:
+        print("Nothing to compare on")
+        return 1
+    print("Loading classification model...")
+    classifier = load_classifier(model_opts, threads_per_worker)
+    print("Model loaded successfully!")
+
+    a = time.time()
+    run_sequential(classifier, items)
+    seq = len(items) / (time.time() - a)
+    print(f"one-by-one: {seq:.2f} items/sec")
+
+    if chunk_opts:
+        # the stock pipeline tokenizes the whole raw document once per label before truncating
+        raw_tokens = sum(chunking.raw_token_count(item["text"], classifier.tokenizer) for item in items)
+        windows = [chunking.prepare(item["text"], classifier.tokenizer, chunk_opts["max_tokens"],
+                                    max_windows=chunk_opts["max_windows"])[0] for item in items]
+        window_tokens = sum(n for w in windows for _, n in w)
+        fed_raw = sum(min(512, chunking.raw_token_count(item["text"], classifier.tokenizer)) for item in items)
+        print(f"tokenizer work per label: raw {raw_tokens} tokens -> chunked {window_tokens} tokens "
+              f"({100 * (1 - window_tokens / raw_tokens) if raw_tokens else 0:.1f}% saved)")
+        print(f"model input per label: truncated raw {fed_raw} tokens, chunked {window_tokens} tokens "
+              f"({sum(len(w) for w in windows)} windows, whole text covered)")
+
+    a = time.time()
+    stats = []
+    for _, _, st in run_batched(items, batch_size, 1, threads_per_worker, classifier=classifier, chunk_opts=chunk_opts):
+        stats.extend(st)
+    single = len(items) / (time.time() - a)
+    print(f"batched (batch size {batch_size}, 1 process): {single:.2f} items/sec ({single / seq:.2f}x)")
+    print_latency_report(stats)
+
+    if workers > 1:
+        # includes model load in every worker, so use a large enough N for this to be fair
+        a = time.time()
+        for _ in run_batched(items, batch_size, workers, threads_per_worker, chunk_opts=chunk_opts,
+                             model_opts=model_opts):
+            pass
+        multi = len(items) / (time.time() - a)
+        print(f"batched (batch size {batch_size}, {workers} processes): {multi:.2f} items/sec ({multi / seq:.2f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
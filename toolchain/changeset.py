@@ -0,0 +1,38 @@
+# changesets written by legiscan_data.py so later stages only look at what a sync touched.
+#
+# every sync stores {_id, created, added, updated, deleted, consumed_by} in civiclens.changesets.
+# a stage asks for everything it hasn't consumed yet, processes it, then marks those changesets
+# consumed, so several syncs between stage runs are merged rather than lost.
+
+import datetime
+
+
+def record(base_db, added, updated, deleted):
+    doc = {
+        "created": datetime.datetime.now(datetime.timezone.utc),
+        "added": sorted(added),
+        "updated": sorted(updated),
+        "deleted": sorted(deleted),
+        "consumed_by": [],
+    }
+    doc["_id"] = base_db["changesets"].insert_one(doc).inserted_id
+    return doc
+
+
+def pending(base_db, stage):
+    # returns (changeset ids, bill ids to (re)process, bill ids deleted)
+    ids, touched, deleted = [], set(), set()
+    for doc in base_db["changesets"].find({"consumed_by": {"$ne": stage}}).sort("created", 1):
+        ids.append(doc["_id"])
+        touched.update(doc.get("added", []))
+        touched.update(doc.get("updated", []))
+        deleted.update(doc.get("deleted", []))
+        # a bill deleted and later re-added is live again
+        deleted.difference_update(doc.get("added", []))
+    touched.difference_update(deleted)
+    return ids, touched, deleted
+
+
+def mark_consumed(base_db, stage, changeset_ids):
+    if changeset_ids:
+        base_db["changesets"].update_many({"_id": {"$in": list(changeset_ids)}}, {"$addToSet": {"consumed_by": stage}})
@@ -0,0 +1,149 @@
+# long-document support for the zero-shot classifier.
+#
+# bill texts are full html/text documents that are far longer than the model's 512 token context.
+# handing the raw text to the pipeline makes it tokenize the whole thing (markup included) once per
+# candidate label, then throw away everything past the first window. instead we strip markup,
+# tokenize once, cut the text into token-bounded windows, classify the windows, and combine the
+# per-label scores.
+
+import re
+import html
+from html.parser import HTMLParser
+
+# room for the hypothesis ("This example is infrastructure.") and special tokens within 512
+DEFAULT_MAX_TOKENS = 448
+DEFAULT_STRIDE = 32
+AGGREGATIONS = ("max", "mean", "weighted")
+
+_ws_re = re.compile(r"[ \t\r\f\v]+")
+_blank_lines_re = re.compile(r"\n\s*\n+")
+
+
+class _TextExtractor(HTMLParser):
+    skip_tags = {"script", "style", "head"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.skip_tags:
+            self._skip += 1
+        elif tag in ("p", "br", "div", "pre", "li", "tr", "h1", "h2", "h3", "h4"):
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.skip_tags and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def clean_text(raw):
+    if not raw:
+        return ""
+    if "<" in raw and ">" in raw:
+        parser = _TextExtractor()
+        parser.feed(raw)
+        parser.close()
+        text = "".join(parser.parts)
+    else:
+        text = html.unescape(raw)
+    text = _ws_re.sub(" ", text)
+    text = _blank_lines_re.sub("\n\n", text)
+    return text.strip()
+
+
+def split_windows(text, tokenizer, max_tokens=DEFAULT_MAX_TOKENS, stride=DEFAULT_STRIDE, max_windows=None):
+    # returns [(window_text, n_tokens)], windows overlap by `stride` tokens
+    if not text:
+        return []
+    step = max(1, max_tokens - stride)
+    try:
+        enc = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, truncation=False)
+        offsets = enc["offset_mapping"]
+    except (NotImplementedError, TypeError, KeyError):
+        offsets = None
+
+    windows = []
+    if offsets:
+        for start in range(0, len(offsets), step):
+            span = offsets[start:start + max_tokens]
+            windows.append((text[span[0][0]:span[-1][1]], len(span)))
+            if start + max_tokens >= len(offsets):
+                break
+    else:
+        # slow tokenizer without offsets: approximate tokens with words
+        words = text.split()
+        words_per_window = max(1, int(max_tokens * 0.75))
+        word_step = max(1, int(step * 0.75))
+        for start in range(0, len(words), word_step):
+            chunk = words[start:start + words_per_window]
+            windows.append((" ".join(chunk), int(len(chunk) / 0.75)))
+            if start + words_per_window >= len(words):
+                break
+
+    if max_windows and len(windows) > max_windows:
+        # keep an even spread across the document rather than just the beginning
+        picked = [windows[round(i * (len(windows) - 1) / (max_windows - 1))] for i in range(max_windows)] if max_windows > 1 else windows[:1]
+        windows = picked
+    return windows
+
+
+def aggregate(window_scores, weights=None, method="max"):
+    # window_scores: list of {label: score}; weights: tokens per window (for "weighted")
+    if method not in AGGREGATIONS:
+        raise ValueError(f"unknown aggregation {method!r}, expected one of {AGGREGATIONS}")
+    if not window_scores:
+        return {}
+    labels = window_scores[0].keys()
+    if method == "max":
+        return {label: max(s[label] for s in window_scores) for label in labels}
+    if method == "mean" or not weights:
+        return {label: sum(s[label] for s in window_scores) / len(window_scores) for label in labels}
+    total = float(sum(weights))
+    return {label: sum(s[label] * w for s, w in zip(window_scores, weights)) / total for label in labels}
+
+
+def prepare(raw, tokenizer, max_tokens=DEFAULT_MAX_TOKENS, stride=DEFAULT_STRIDE, max_windows=None):
+    # returns (windows, stats); stats compares the work against feeding the raw document
+    cleaned = clean_text(raw)
+    windows = split_windows(cleaned, tokenizer, max_tokens, stride, max_windows)
+    stats = {
+        "raw_chars": len(raw or ""),
+        "clean_chars": len(cleaned),
+        "windows": len(windows),
+        "window_tokens": sum(n for _, n in windows),
+    }
+    return windows, stats
+
+
+def raw_token_count(raw, tokenizer):
+    # what the stock pipeline tokenizes for every candidate label before truncating
+    return len(tokenizer(raw or "", add_special_tokens=False, truncation=False)["input_ids"])
+
+
+def classify_long(classifier, texts, labels, batch_size=8, method="max", max_tokens=DEFAULT_MAX_TOKENS,
+                  stride=DEFAULT_STRIDE, max_windows=None):
+    # classifies several documents at once: all their windows go through the pipeline together
+    # returns (scores per document, stats per document)
+    tokenizer = classifier.tokenizer
+    prepared = [prepare(text, tokenizer, max_tokens, stride, max_windows) for text in texts]
+    flat = [w for windows, _ in prepared for w, _ in windows]
+    results = []
+    if flat:
+        out = classifier(flat, labels, multi_label=True, batch_size=batch_size)
+        if isinstance(out, dict):
+            out = [out]
+        results = [dict(zip(d["labels"], d["scores"])) for d in out]
+
+    scores, stats, i = [], [], 0
+    for windows, st in prepared:
+        window_scores = results[i:i + len(windows)]
+        i += len(windows)
+        scores.append(aggregate(window_scores, [n for _, n in windows], method) if window_scores else {label: 0.0 for label in labels})
+        stats.append(st)
+    return scores, stats
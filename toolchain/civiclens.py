@@ -0,0 +1,43 @@
+# one entry point for the toolchain:
+#
+#   python civiclens.py ingest --workers 8
+#   python civiclens.py categorize --changes
+#   python civiclens.py summarize --concurrency 16
+#   python civiclens.py pipeline --every 3600
+#
+# each subcommand's module is only imported when that subcommand runs, so `ingest` or `summarize`
+# never pay for transformers/torch, and everything after the subcommand name is handed to that
+# script's own argument parser (`python civiclens.py categorize --help`).
+
+import sys
+
+COMMANDS = {
+    "ingest": ("legiscan_data", "sync new and changed bills from LegiScan/congress.gov"),
+    "categorize": ("categorize", "zero-shot categorize bills into scores"),
+    "summarize": ("generate_summaries", "summarize bills into summaries"),
+    "translate": ("translate_summaries", "translate summaries into every supported language"),
+    "pipeline": ("pipeline", "ingest, categorize, summarize and translate as one streaming run"),
+    "index": ("index_search", "update the backend's full-text search index"),
+    "prewarm": ("prewarm_cache", "fill the backend translation cache from texts.log"),
+    "sanitize": ("sanitize_data", "drop bills that aren't house bills"),
+    "bench": ("bench_suite", "offline benchmarks, and a compare against a stored baseline"),
+}
+
+
+def usage():
+    lines = ["usage: civiclens.py <command> [args...]", "", "commands:"]
+    lines += [f"  {name:<12}{help}" for name, (_, help) in COMMANDS.items()]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help") or argv[0] not in COMMANDS:
+        print(usage(), file=sys.stderr if argv and argv[0] not in ("-h", "--help") else sys.stdout)
+        return 0 if argv and argv[0] in ("-h", "--help") else 2
+    module = __import__(COMMANDS[argv[0]][0])
+    return module.main(argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
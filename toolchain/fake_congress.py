@@ -0,0 +1,192 @@
+# local stand-in for the LegiScan and congress.gov apis, so ingestion can be measured offline.
+#
+#   python fake_congress.py serve --bills 500 --latency 0.05
+#   python fake_congress.py bench --bills 300 --workers 16 --api-rate 40
+#
+# `serve` just runs the fake; point legiscan_data.py at it with
+#   LEGISCAN_URL=http://127.0.0.1:5010/legiscan/ CONGRESS_API_URL=http://127.0.0.1:5010/v3
+# `bench` runs legiscan_data.ingest() against it with an in-memory mongo (mongomock) and checks
+# that the api requests never exceeded what the token bucket allows.
+
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BILL_TYPES = [("HB", "hr"), ("SB", "s"), ("HJR", "hjres"), ("SJR", "sjres")]
+
+
+def make_master_list(n, session_name="119th Congress", seed=0):
+    rng = random.Random(seed)
+    ml = {"session": {"session_name": session_name}}
+    for i in range(n):
+        prefix, _ = BILL_TYPES[i % len(BILL_TYPES)]
+        number = f"{prefix}{i + 1}"
+        ml[str(i)] = {
+            "bill_id": 1000 + i,
+            "number": number,
+            "status": 2 if rng.random() < 0.8 else 1,
+            "change_hash": f"{i:08x}",
+            "last_action_date": "2025-09-01",
+        }
+    return ml
+
+
+class FakeCongress:
+    def __init__(self, bills=200, latency=0.0, fail_rate=0.0, port=0, seed=0):
+        self.master_list = make_master_list(bills, seed=seed)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.lock = threading.Lock()
+        self.api_requests = []  # monotonic timestamps of api.congress.gov calls
+        self.text_requests = 0
+        self.failures = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.port = self.server.server_address[1]
+        self.base = f"http://127.0.0.1:{self.port}"
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def max_requests_in_window(self, window):
+        times = sorted(self.api_requests)
+        best, j = 0, 0
+        for i, t in enumerate(times):
+            while times[j] < t - window:
+                j += 1
+            best = max(best, i - j + 1)
+        return best
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body go out as separate writes; without this nagle + delayed acks add ~40ms
+            disable_nagle_algorithm = True
+
+            def _send(self, status, body, content_type="application/json"):
+                if not isinstance(body, bytes):
+                    body = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                parts = [p for p in url.path.split("/") if p]
+                if fake.latency:
+                    time.sleep(fake.latency)
+
+                if parts[:1] == ["legiscan"]:
+                    if parse_qs(url.query).get("op") == ["getMasterList"]:
+                        return self._send(200, {"status": "OK", "masterlist": fake.master_list})
+                    return self._send(400, {"status": "ERROR"})
+
+                if parts[:1] == ["v3"]:
+                    with fake.lock:
+                        fake.api_requests.append(time.monotonic())
+                        fail = random.random() < fake.fail_rate
+                        if fail:
+                            fake.failures += 1
+                    if fail:
+                        return self._send(random.choice([429, 500, 503]), {"error": "injected"})
+                    # /v3/bill/{congress}/{type}/{number}[/text]
+                    if len(parts) == 5 and parts[1] == "bill":
+                        return self._send(200, {"bill": {
+                            "number": parts[4], "type": parts[3].upper(), "updateDate": "2025-09-01T00:00:00Z",
+                            "textVersions": {"count": 1, "url": f"{fake.base}/v3/{'/'.join(parts[1:])}/text"},
+                        }})
+                    if len(parts) == 6 and parts[5] == "text":
+                        return self._send(200, {"textVersions": [{"formats": [
+                            {"type": "Formatted Text", "url": f"{fake.base}/text/{parts[2]}/{parts[3]}/{parts[4]}.htm"},
+                        ]}]})
+                    return self._send(404, {"error": "not found"})
+
+                if parts[:1] == ["text"]:
+                    with fake.lock:
+                        fake.text_requests += 1
+                    body = "<html><body><pre>" + " ".join(f"SEC. {i}. The {parts[2]} {parts[3]} act." for i in range(200)) + "</pre></body></html>"
+                    return self._send(200, body.encode(), "text/html")
+
+                return self._send(404, {"error": "not found"})
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def bench(args):
+    import mongomock
+    import legiscan_data
+
+    fake = FakeCongress(bills=args.bills, latency=args.latency, fail_rate=args.fail_rate).start()
+    legiscan_data.LEGISCAN_URL = fake.base + "/legiscan/"
+    legiscan_data.CONGRESS_API_URL = fake.base + "/v3"
+    db = mongomock.MongoClient()["civiclens"]["bills"]
+
+    try:
+        session = legiscan_data.make_session(args.workers)
+        session_no, bills = legiscan_data.get_master_list(session)
+        links = legiscan_data.build_links(session_no, bills)
+        stats = legiscan_data.ingest(db, links, workers=args.workers, api_rate=args.api_rate,
+                                     text_rate=args.text_rate, session=session, log=lambda *a: None)
+    finally:
+        fake.stop()
+
+    # a token bucket allows at most capacity + rate * window requests in any window
+    window = 5.0
+    capacity = max(1.0, args.api_rate)
+    allowed = int(capacity + args.api_rate * window)
+    observed = fake.max_requests_in_window(window)
+    result = dict(stats, bills=len(links), stored=db.count_documents({}), api_requests=len(fake.api_requests),
+                  text_requests=fake.text_requests, injected_failures=fake.failures,
+                  max_api_requests_per_5s=observed, allowed_per_5s=allowed, limiter_ok=observed <= allowed)
+    print(json.dumps(result, indent=2))
+    return 0 if result["limiter_ok"] and result["stored"] + result["failed"] == len(links) else 1
+
+
+def serve(args):
+    fake = FakeCongress(bills=args.bills, latency=args.latency, fail_rate=args.fail_rate, port=args.port)
+    print(f"fake LegiScan on {fake.base}/legiscan/, congress.gov on {fake.base}/v3")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    for name, func in (("serve", serve), ("bench", bench)):
+        p = sub.add_parser(name)
+        p.add_argument("--bills", type=int, default=200)
+        p.add_argument("--latency", type=float, default=0.02, help="seconds added to every response")
+        p.add_argument("--fail-rate", type=float, default=0.0, help="fraction of api calls answered with 429/5xx")
+        p.set_defaults(func=func)
+        if name == "serve":
+            p.add_argument("--port", type=int, default=5010)
+        else:
+            p.add_argument("--workers", type=int, default=16)
+            p.add_argument("--api-rate", type=float, default=40.0)
+            p.add_argument("--text-rate", type=float, default=40.0)
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+# local stand-in for the parts of the OpenAI api generate_summaries.py uses (responses, files,
+# batches), so the summary pipeline can run offline.
+#
+#   python fake_openai.py --port 5020 --latency 0.5
+#   OPENAI_BASE_URL=http://127.0.0.1:5020/v1 OPENAI_KEY=test python generate_summaries.py
+#
+# responses come back after `latency` seconds with a canned structured summary built from the
+# input; batch jobs complete as soon as they're created.
+
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_response(body):
+    words = (body.get("input") or "").split()
+    text = json.dumps({
+        "summary": "This bill " + " ".join(words[:12]) + ".",
+        "bullet_points": [f"- Point {i + 1}: " + " ".join(words[i * 5:i * 5 + 5]) for i in range(3)],
+    })
+    return {
+        "id": "resp_" + uuid.uuid4().hex,
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": body.get("model"),
+        "status": "completed",
+        "output": [{
+            "type": "message", "id": "msg_" + uuid.uuid4().hex, "status": "completed", "role": "assistant",
+            "content": [{"type": "output_text", "text": text, "annotations": []}],
+        }],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {"input_tokens": len(words), "output_tokens": 60, "total_tokens": len(words) + 60,
+                  "input_tokens_details": {"cached_tokens": 0}, "output_tokens_details": {"reasoning_tokens": 0}},
+    }
+
+
+class FakeOpenAI:
+    def __init__(self, latency=0.0, port=0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.files = {}
+        self.batches = {}
+        self.responses = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.input_words = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.port = self.server.server_address[1]
+        self.base = f"http://127.0.0.1:{self.port}/v1"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _file(self, content, purpose, filename="file.jsonl"):
+        file_id = "file-" + uuid.uuid4().hex
+        self.files[file_id] = content
+        return {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                "filename": filename, "purpose": purpose, "status": "processed"}
+
+    def _run_batch(self, body):
+        lines = []
+        for line in self.files[body["input_file_id"]].decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            req = json.loads(line)
+            with self.lock:
+                self.input_words += len((req["body"].get("input") or "").split())
+            lines.append(json.dumps({
+                "id": "batch_req_" + uuid.uuid4().hex, "custom_id": req["custom_id"],
+                "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": fake_response(req["body"])},
+                "error": None,
+            }))
+        out = self._file(("\n".join(lines) + "\n").encode("utf-8"), "batch_output")
+        batch = {
+            "id": "batch_" + uuid.uuid4().hex, "object": "batch", "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"], "completion_window": body["completion_window"],
+            "status": "completed", "output_file_id": out["id"], "created_at": int(time.time()),
+            "request_counts": {"total": len(lines), "completed": len(lines), "failed": 0},
+        }
+        self.batches[batch["id"]] = batch
+        return batch
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body go out as separate writes; without this nagle + delayed acks add ~40ms
+            disable_nagle_algorithm = True
+
+            def _send(self, status, body, content_type="application/json"):
+                if not isinstance(body, bytes):
+                    body = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _body(self):
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def do_POST(self):
+                path = self.path.split("?")[0]
+                if path == "/v1/responses":
+                    body = json.loads(self._body())
+                    with fake.lock:
+                        fake.in_flight += 1
+                        fake.max_in_flight = max(fake.max_in_flight, fake.in_flight)
+                        fake.input_words += len((body.get("input") or "").split())
+                    time.sleep(fake.latency)
+                    with fake.lock:
+                        fake.in_flight -= 1
+                        fake.responses += 1
+                    return self._send(200, fake_response(body))
+                if path == "/v1/files":
+                    raw = self._body()
+                    # pull the file part out of the multipart body
+                    boundary = self.headers["Content-Type"].split("boundary=")[1].encode()
+                    content, purpose = b"", "batch"
+                    for part in raw.split(b"--" + boundary):
+                        head, _, data = part.partition(b"\r\n\r\n")
+                        if b'name="file"' in head:
+                            content = data.rsplit(b"\r\n", 1)[0]
+                        elif b'name="purpose"' in head:
+                            purpose = data.rsplit(b"\r\n", 1)[0].decode()
+                    return self._send(200, fake._file(content, purpose))
+                if path == "/v1/batches":
+                    return self._send(200, fake._run_batch(json.loads(self._body())))
+                return self._send(404, {"error": {"message": "not found"}})
+
+            def do_GET(self):
+                parts = [p for p in self.path.split("?")[0].split("/") if p]
+                if parts[:2] == ["v1", "batches"] and len(parts) == 3 and parts[2] in fake.batches:
+                    return self._send(200, fake.batches[parts[2]])
+                if parts[:2] == ["v1", "files"] and len(parts) == 4 and parts[3] == "content" and parts[2] in fake.files:
+                    return self._send(200, fake.files[parts[2]], "application/octet-stream")
+                return self._send(404, {"error": {"message": "not found"}})
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=5020)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args(argv)
+    fake = FakeOpenAI(latency=args.latency, port=args.port)
+    print(f"fake OpenAI on {fake.base}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    sys.exit(main())
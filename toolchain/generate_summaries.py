@@ -2,69 +2,286 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import os
+import sys
+import json
+import time
+import argparse
+import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-mongo_uri = os.getenv("MONGO_URI")
 from pymongo import MongoClient
-client = MongoClient(mongo_uri)
 
+from result_cache import ResultCache, text_hash
+from work_selection import select_work
+import changeset
 
-db = client["civiclens"]["bills"]
-summaries = client["civiclens"]["summaries"]
+MODEL = "gpt-5-nano"
+# one request per bill returns both the summary and the bullet points, so the bill text is only
+# sent (and billed as input) once
+INSTRUCTIONS = (
+    "Summarize this bill in one short and clear sentence, avoiding legal definitions. "
+    "Then tell me what this bill does in 3 short bullet points."
+)
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "bullet_points": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["summary", "bullet_points"],
+    "additionalProperties": False,
+}
 
-from openai import OpenAI
-client = OpenAI(api_key=os.getenv("OPENAI_KEY"), timeout=900.0)
 
+def clean_input(text):
+    return text.replace("\n", " ").replace("\r", " ").replace("\t", " ")
 
-# only select ids that exist in db but not in summaries
-bills_to_summarize = [bill for bill in db.find({}) if "text" in bill and bill["text"] and not summaries.find_one({"_id": bill["_id"]})]
 
-print(f"{len(bills_to_summarize)} bills to summarize")
+def request_body(text):
+    return {
+        "model": MODEL,
+        "instructions": INSTRUCTIONS,
+        "input": clean_input(text),
+        "text": {"format": {"type": "json_schema", "name": "bill_summary", "schema": SCHEMA, "strict": True}},
+    }
 
 
-import time
-for bill in bills_to_summarize:
-    if "text" not in bill or not bill["text"]:
-        continue
+def output_text_of(body):
+    # output_text for a raw responses api body, as found in batch output files
+    parts = []
+    for item in body.get("output", []):
+        if item.get("type") == "message":
+            parts.extend(c.get("text", "") for c in item.get("content", []) if c.get("type") == "output_text")
+    return "".join(parts)
 
-    if summaries.find_one({"_id": bill["_id"]}):
-        continue
 
-    text = bill["text"].replace("\n", " ").replace("\r", " ").replace("\t", " ")
-    
+def parse_output(output_text):
+    data = json.loads(output_text)
+    bps = [line for line in data.get("bullet_points", []) if line.strip()]
+    bps = [line.strip('- ').strip().strip(".") for line in bps]
+    return {
+        "summary": data.get("summary", "").strip(),
+        "bullet_points": bps
+    }
 
 
-    a = time.time()
-    bullet_points = client.with_options(timeout=900.0).responses.create(
-        model="gpt-5-nano",
-        instructions=f"Tell me what this bill does in 3 short bullet points",
-        input=text,
+def summary_hash(result):
+    # hash of what a reader sees; translate_summaries.py redoes a language when this moves
+    return text_hash(json.dumps([result.get("summary", ""), result.get("bullet_points", [])], ensure_ascii=False))
 
-    )
 
-    summary = client.with_options(timeout=900.0).responses.create(
-        model="gpt-5-nano",
-        instructions=f"Summarize this bill in one short and clear sentence, avoiding legal definitions",
-        input=text,
+def store(base_db, bill_id, key, result):
+    # $set rather than replace, so translations of an unchanged summary survive a re-save
+    base_db["summaries"].update_one({"_id": bill_id}, {"$set": dict(result, key=key, summary_hash=summary_hash(result))},
+                                    upsert=True)
 
-    ).output_text.strip()
 
-    # print("BP time:", time.time() - a)
+def make_cache(base_db):
+    # identical bill text under the same model and prompt is only sent to OpenAI once
+    return ResultCache(base_db["result_cache"], "summarize", MODEL, {"instructions": INSTRUCTIONS, "schema": SCHEMA})
 
 
+def select(base_db, cache, changes=False, batch_size=50):
+    # bills that have no summary yet, or whose text changed since it was summarized
+    # (summaries written before content keys existed are left alone). returns
+    # (lazy batches of [(bill, key)], changeset ids to mark consumed)
+    query = {}
+    changesets = []
+    if changes:
+        changesets, touched, _ = changeset.pending(base_db, "summarize")
+        print(f"{len(changesets)} pending changesets touching {len(touched)} bills")
+        query = {"_id": {"$in": list(touched)}}
+    return skip_submitted(base_db, select_work(base_db, "summaries", cache, query=query, batch_size=batch_size)), \
+        changesets
 
 
-    
-    bps = bullet_points.output_text.strip().split('\n')
-    bps = [line for line in bps if line.strip()]
+def skip_submitted(base_db, batches):
+    # drops bills whose key is already in a batch job that hasn't been collected, so a second
+    # submit or a run before --batch collect doesn't pay for them twice
+    submitted = {entry["key"] for record in base_db["summary_batches"].find({"collected": False}, {"keys.key": 1})
+                 for entry in record.get("keys", [])}
+    for bills in batches:
+        bills = [(bill, key) for bill, key in bills if key not in submitted]
+        if bills:
+            yield bills
 
-    bps = [line.strip('- ').strip().strip(".") for line in bps]
 
-    summaries.insert_one({
-        "_id": bill["_id"],
-        "summary": summary,
-        "bullet_points": bps
+def save(base_db, cache, bill_id, key, result):
+    cache.put(key, result)
+    store(base_db, bill_id, key, result)
+
+
+def reuse_cached(base_db, cache, batches, on_saved=None, log=print):
+    # writes cached results straight through, yields the bills that still need a model call
+    for bills in batches:
+        cached = cache.get_many([key for _, key in bills])
+        for bill, key in bills:
+            if key in cached:
+                store(base_db, bill["_id"], key, cached[key])
+                log("Reused cached summary for bill", bill["_id"])
+                if on_saved is not None:
+                    on_saved([bill["_id"]])
+            else:
+                yield bill, key
+
+
+def summarize(client, text):
+    response = client.with_options(timeout=900.0).responses.create(**request_body(text))
+    return parse_output(response.output_text)
+
+
+def run_concurrent(client, base_db, cache, bills, concurrency=8, on_saved=None, log=print):
+    # at most `concurrency` requests in flight, and only that many bill texts held at once;
+    # bills sharing a key are summarized once. on_saved(ids) is called as summaries land
+    on_saved = on_saved or (lambda ids: None)
+    waiting = {}   # key -> bill ids waiting on the in-flight request
+    finished = {}  # key -> result, for duplicates that show up after their request finished
+    futures = {}
+
+    done = failed = 0
+    start = time.time()
+
+    def collect(completed):
+        nonlocal done, failed
+        for future in completed:
+            key = futures.pop(future)
+            ids = waiting.pop(key)
+            try:
+                result = future.result()
+            except Exception as e:
+                failed += 1
+                log(f"Error summarizing {ids[0]}: {e}")
+                continue
+            finished[key] = result
+            for bill_id in ids:
+                save(base_db, cache, bill_id, key, result)
+                log("Saved summary for bill", bill_id)
+            on_saved(ids)
+            done += 1
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for bill, key in bills:
+            if key in finished:
+                save(base_db, cache, bill["_id"], key, finished[key])
+                on_saved([bill["_id"]])
+                continue
+            if key in waiting:
+                waiting[key].append(bill["_id"])
+                continue
+            waiting[key] = [bill["_id"]]
+            futures[pool.submit(summarize, client, bill["text"])] = key
+            if len(futures) >= concurrency:
+                completed, _ = wait(futures, return_when=FIRST_COMPLETED)
+                collect(completed)
+        collect(wait(futures)[0])
+    elapsed = time.time() - start
+    log(f"Summarized {done} bills ({failed} failed) in {elapsed:.1f}s ({done / elapsed if elapsed else 0:.2f} bills/sec)")
+    return done, failed
+
+
+def batch_submit(client, base_db, bills, path, changesets=()):
+    # writes one /v1/responses request per unique text to a jsonl file and submits it as a batch
+    # job; the key of every bill is remembered in civiclens.summary_batches for batch_collect, along
+    # with the changesets it covers, which stay pending until the results are saved
+    keys = {}
+    with open(path, "w", encoding="utf-8") as f:
+        for bill, key in bills:
+            if key not in keys:
+                f.write(json.dumps({"custom_id": key, "method": "POST", "url": "/v1/responses",
+                                    "body": request_body(bill["text"])}, ensure_ascii=False) + "\n")
+            keys.setdefault(key, []).append(bill["_id"])
+
+    if not keys:
+        print("No bills to summarize")
+        changeset.mark_consumed(base_db, "summarize", changesets)
+        return None
+    with open(path, "rb") as f:
+        uploaded = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(input_file_id=uploaded.id, endpoint="/v1/responses", completion_window="24h")
+    base_db["summary_batches"].insert_one({
+        "_id": batch.id,
+        "created": datetime.datetime.now(datetime.timezone.utc),
+        "keys": [{"key": k, "ids": ids} for k, ids in keys.items()],
+        "changesets": list(changesets),
+        "collected": False,
     })
+    print(f"Submitted batch {batch.id} with {len(keys)} requests ({path})")
+    return batch.id
+
+
+def batch_collect(client, base_db, cache):
+    # ingests every finished batch that hasn't been collected yet
+    collected = 0
+    for record in base_db["summary_batches"].find({"collected": False}):
+        batch = client.batches.retrieve(record["_id"])
+        if batch.status in ("validating", "in_progress", "finalizing"):
+            print(f"Batch {batch.id} is {batch.status}")
+            continue
+        ids_by_key = {entry["key"]: entry["ids"] for entry in record["keys"]}
+        saved = failed = 0
+        if batch.output_file_id:
+            content = client.files.content(batch.output_file_id).text
+            for line in content.splitlines():
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                key = row.get("custom_id")
+                response = row.get("response") or {}
+                if row.get("error") or response.get("status_code") != 200 or key not in ids_by_key:
+                    failed += 1
+                    continue
+                try:
+                    result = parse_output(output_text_of(response["body"]))
+                except (ValueError, KeyError):
+                    failed += 1
+                    continue
+                for bill_id in ids_by_key[key]:
+                    save(base_db, cache, bill_id, key, result)
+                saved += 1
+        base_db["summary_batches"].update_one({"_id": record["_id"]}, {"$set": {"collected": True, "status": batch.status}})
+        print(f"Batch {batch.id} ({batch.status}): {saved} summaries saved, {failed} failed")
+        # an expired or partly failed batch leaves its changesets pending for the next --changes run
+        if saved == len(ids_by_key):
+            changeset.mark_consumed(base_db, "summarize", record.get("changesets", []))
+        collected += saved
+    return collected
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize bills into the summaries collection")
+    parser.add_argument("--changes", action="store_true",
+                        help="only look at bills in changesets from legiscan_data.py this stage hasn't consumed yet")
+    parser.add_argument("--concurrency", type=int, default=8, help="max requests in flight")
+    parser.add_argument("--batch", choices=("submit", "collect"),
+                        help="use the OpenAI batch api instead: submit a job, or ingest finished ones")
+    parser.add_argument("--batch-file", default="summary_batch.jsonl")
+    args = parser.parse_args(argv)
+
+    mongo_uri = os.getenv("MONGO_URI")
+    base_db = MongoClient(mongo_uri)["civiclens"]
+    cache = make_cache(base_db)
+
+    from openai import OpenAI
+    client = OpenAI(api_key=os.getenv("OPENAI_KEY"), timeout=900.0)
+
+    if args.batch == "collect":
+        batch_collect(client, base_db, cache)
+        return 0
+
+    batches, changesets = select(base_db, cache, args.changes)
+    bills = reuse_cached(base_db, cache, batches)
+
+    if args.batch == "submit":
+        # batch_collect marks the changesets consumed once the results are in
+        batch_submit(client, base_db, bills, args.batch_file, changesets)
+        return 0
 
+    _, failed = run_concurrent(client, base_db, cache, bills, args.concurrency)
+    # keep the changesets pending if anything failed so the next --changes run retries it
+    if not failed:
+        changeset.mark_consumed(base_db, "summarize", changesets)
+    return 0
 
-    print("Saved summary for bill", bill["_id"])
 
+if __name__ == "__main__":
+    sys.exit(main())
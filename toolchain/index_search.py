@@ -0,0 +1,112 @@
+from dotenv import load_dotenv
+load_dotenv()
+
+# keeps the backend's full-text search index (backend/search_index.py, a SQLite FTS5 file) in step
+# with mongo. each bill is indexed with its title, summary, bullet points, cleaned text and label
+# scores, under a version hashed from {title, text_hash, summary_hash, scores}. a run reads only
+# those small fields, re-indexes the bills whose version moved (new text, a new summary, new
+# scores) and drops bills that are gone from `bills`, so after the first run it costs about as much
+# as what changed. pipeline.py runs it after each pass.
+#
+#   python index_search.py                 # new and changed bills
+#   python index_search.py --rebuild       # start the index over
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+
+from pymongo import MongoClient
+
+from chunking import clean_text
+
+base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(base, "backend"))
+
+from search_index import SearchIndex  # noqa: E402
+
+INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", os.path.join(base, "backend", "search.db"))
+# omnibus and budget bills run to megabytes; past this the text adds index size, not findability
+BODY_MAX_CHARS = 200000
+
+
+def doc_version(bill, summary, scores):
+    blob = json.dumps([bill.get("title"), bill.get("text_hash"), (summary or {}).get("summary_hash"),
+                       (scores or {}).get("scores")], sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:24]
+
+
+def plan(base_db, indexed):
+    # ({bill id: version} to (re)index, [bill ids to drop]) against the index's {id: version}
+    summaries = {doc["_id"]: doc for doc in base_db["summaries"].find({}, {"summary_hash": 1})}
+    scores = {doc["_id"]: doc for doc in base_db["scores"].find({}, {"scores": 1})}
+    changed = {}
+    seen = set()
+    for bill in base_db["bills"].find({}, {"title": 1, "text_hash": 1}):
+        bill_id = str(bill["_id"])
+        seen.add(bill_id)
+        version = doc_version(bill, summaries.get(bill["_id"]), scores.get(bill["_id"]))
+        if indexed.get(bill_id) != version:
+            changed[bill["_id"]] = version
+    return changed, [bill_id for bill_id in indexed if bill_id not in seen]
+
+
+def build_docs(base_db, versions):
+    ids = list(versions)
+    bills = base_db["bills"].find({"_id": {"$in": ids}}, {"title": 1, "text": 1})
+    summaries = {doc["_id"]: doc for doc in base_db["summaries"].find(
+        {"_id": {"$in": ids}}, {"summary": 1, "bullet_points": 1})}
+    scores = {doc["_id"]: doc.get("scores") for doc in base_db["scores"].find({"_id": {"$in": ids}}, {"scores": 1})}
+    docs = []
+    for bill in bills:
+        summary = summaries.get(bill["_id"], {})
+        docs.append({
+            "id": str(bill["_id"]),
+            "title": bill.get("title") or str(bill["_id"]),
+            "summary": summary.get("summary") or "",
+            "bullets": summary.get("bullet_points") or [],
+            "body": clean_text(bill.get("text") or "")[:BODY_MAX_CHARS],
+            "scores": scores.get(bill["_id"]) or {},
+            "version": versions[bill["_id"]],
+        })
+    return docs
+
+
+def run(base_db, path=INDEX_PATH, batch_size=200, log=print):
+    start = time.time()
+    index = SearchIndex(path)
+    changed, gone = plan(base_db, index.versions())
+    if gone:
+        index.remove(gone)
+    ids = list(changed)
+    indexed = 0
+    for i in range(0, len(ids), batch_size):
+        indexed += index.upsert(build_docs(base_db, {k: changed[k] for k in ids[i:i + batch_size]}))
+        log(f"Indexed {indexed}/{len(ids)} bills")
+    if indexed > 1000:
+        index.optimize()
+    return {"indexed": indexed, "removed": len(gone), "bills": len(index), "seconds": time.time() - start}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Update the backend's full-text search index from mongo")
+    parser.add_argument("--index", default=INDEX_PATH, help="index file (SEARCH_INDEX_PATH)")
+    parser.add_argument("--batch-size", type=int, default=200, help="bills per index transaction")
+    parser.add_argument("--rebuild", action="store_true", help="delete the index and build it from scratch")
+    args = parser.parse_args(argv)
+
+    if args.rebuild:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.index + suffix):
+                os.remove(args.index + suffix)
+    base_db = MongoClient(os.getenv("MONGO_URI"))["civiclens"]
+    stats = run(base_db, args.index, args.batch_size)
+    print(f"{stats['indexed']} bills indexed, {stats['removed']} removed, {stats['bills']} in the index "
+          f"({stats['seconds']:.1f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+# two-stage zero-shot scoring: a cheap embedding screen in front of the NLI model.
+#
+# the NLI pipeline runs one premise/hypothesis pair per (text, label), so every extra topic in
+# candidate_labels adds a full model pass per window. a bi-encoder embeds the window once and each
+# label hypothesis once per label set (cached), and a dot product ranks every label for the window.
+# only the labels that come out on top, or close enough to be borderline, go through the NLI model;
+# the rest get a low score derived from their similarity. the NLI work per window is then bounded
+# by the screen settings instead of growing with the number of labels.
+#
+#   python categorize.py --screen --screen-top 4 --screen-min-similarity 0.3
+#
+# ScreenedClassifier is a drop-in for the pipeline (same call and output, .tokenizer), so
+# chunking.py and categorize.py use it unchanged. the screen settings are part of the categorize
+# result-cache params, so screened and full scores never mix.
+
+import os
+
+import numpy as np
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+HYPOTHESIS_TEMPLATE = "This example is {}."
+# labels always sent to the NLI model per window, plus any others at least this similar
+DEFAULT_TOP = 4
+DEFAULT_MIN_SIMILARITY = 0.35
+# screened-out labels score similarity * FLOOR, below anything the screen let through in practice
+DEFAULT_FLOOR = 0.1
+
+
+def screen_options(model=None, top=DEFAULT_TOP, min_similarity=DEFAULT_MIN_SIMILARITY, floor=DEFAULT_FLOOR):
+    return {"model": model or os.getenv("SCREEN_MODEL") or DEFAULT_MODEL, "top": top,
+            "min_similarity": min_similarity, "floor": floor}
+
+
+class Encoder:
+    # mean-pooled, L2-normalized sentence embeddings. a directory with a model.onnx runs on
+    # onnxruntime; anything else (hub name or local dir) on torch. local dirs load offline
+    def __init__(self, model, threads=None):
+        from transformers import AutoTokenizer
+        local = os.path.isdir(model)
+        self.tokenizer = AutoTokenizer.from_pretrained(model, local_files_only=local)
+        self.session = self.net = None
+        if local and os.path.exists(os.path.join(model, "model.onnx")):
+            import onnxruntime as ort
+            options = ort.SessionOptions()
+            if threads:
+                options.intra_op_num_threads = threads
+            self.session = ort.InferenceSession(os.path.join(model, "model.onnx"), options,
+                                                providers=["CPUExecutionProvider"])
+            self.input_names = {i.name for i in self.session.get_inputs()}
+        else:
+            from transformers import AutoModel
+            self.net = AutoModel.from_pretrained(model, local_files_only=local).eval()
+
+    def _hidden(self, encoded):
+        if self.session is not None:
+            feed = {k: np.asarray(v, dtype=np.int64) for k, v in encoded.items() if k in self.input_names}
+            return self.session.run(None, feed)[0]
+        import torch
+        with torch.no_grad():
+            return self.net(**{k: torch.from_numpy(np.asarray(v)) for k, v in encoded.items()})[0].numpy()
+
+    def __call__(self, texts, batch_size=32):
+        out = []
+        for i in range(0, len(texts), batch_size):
+            encoded = self.tokenizer(texts[i:i + batch_size], padding=True, truncation=True, return_tensors="np")
+            hidden = self._hidden(encoded)
+            mask = np.asarray(encoded["attention_mask"], dtype=np.float32)[..., None]
+            pooled = (hidden * mask).sum(1) / np.maximum(mask.sum(1), 1e-9)
+            out.append(pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-9))
+        return np.concatenate(out).astype(np.float32) if out else np.zeros((0, 0), dtype=np.float32)
+
+
+class ScreenedClassifier:
+    def __init__(self, classifier, encoder, top=DEFAULT_TOP, min_similarity=DEFAULT_MIN_SIMILARITY,
+                 floor=DEFAULT_FLOOR):
+        self.classifier = classifier
+        self.encoder = encoder
+        self.tokenizer = classifier.tokenizer
+        self.top = top
+        self.min_similarity = min_similarity
+        self.floor = floor
+        # hypothesis text -> embedding, so a label is embedded once per process however many label
+        # sets it appears in, and adding a topic embeds only the new one
+        self._label_vectors = {}
+        self.pairs = {"screened": 0, "nli": 0}
+
+    def label_matrix(self, labels, hypothesis_template=HYPOTHESIS_TEMPLATE):
+        hypotheses = [hypothesis_template.format(label) for label in labels]
+        missing = [h for h in dict.fromkeys(hypotheses) if h not in self._label_vectors]
+        if missing:
+            self._label_vectors.update(zip(missing, self.encoder(missing)))
+        return np.stack([self._label_vectors[h] for h in hypotheses])
+
+    def select(self, similarity):
+        # (texts x labels) similarity -> boolean mask of the labels each text sends to the NLI model
+        top = min(self.top, similarity.shape[1])
+        chosen = similarity >= self.min_similarity
+        if top:
+            best = np.argpartition(-similarity, top - 1, axis=1)[:, :top]
+            np.put_along_axis(chosen, best, True, axis=1)
+        return chosen
+
+    def __call__(self, sequences, candidate_labels, multi_label=True, batch_size=8,
+                 hypothesis_template=HYPOTHESIS_TEMPLATE):
+        single = isinstance(sequences, str)
+        sequences = [sequences] if single else list(sequences)
+        labels = list(candidate_labels)
+        similarity = self.encoder(sequences) @ self.label_matrix(labels, hypothesis_template).T
+        chosen = self.select(similarity)
+        scores = np.clip(similarity, 0.0, 1.0) * self.floor
+
+        # every chosen (text, label) pair across the batch goes through the NLI model in batch_size
+        # chunks, whichever labels each text picked
+        rows, columns = np.nonzero(chosen)
+        pairs = [(sequences[i], hypothesis_template.format(labels[c])) for i, c in zip(rows, columns)]
+        got = pair_scores(self.classifier, pairs, batch_size)
+        if got is not None:
+            scores[rows, columns] = got
+        else:
+            self._grouped(sequences, labels, chosen, scores, batch_size, hypothesis_template)
+        self.pairs["screened"] += similarity.size
+        self.pairs["nli"] += int(chosen.sum())
+
+        results = []
+        for seq, row in zip(sequences, scores):
+            order = np.argsort(-row, kind="stable")
+            results.append({"sequence": seq, "labels": [labels[i] for i in order],
+                            "scores": [float(row[i]) for i in order]})
+        return results[0] if single else results
+
+    def _grouped(self, sequences, labels, chosen, scores, batch_size, hypothesis_template):
+        # for a classifier that can only be called like the pipeline: texts that picked the same
+        # labels go through it together
+        groups = {}
+        for i, row in enumerate(chosen):
+            groups.setdefault(tuple(np.flatnonzero(row)), []).append(i)
+        for columns, rows in groups.items():
+            subset = [labels[c] for c in columns]
+            out = self.classifier([sequences[i] for i in rows], subset, multi_label=True, batch_size=batch_size,
+                                  hypothesis_template=hypothesis_template)
+            if isinstance(out, dict):
+                out = [out]
+            for i, data in zip(rows, out):
+                got = dict(zip(data["labels"], data["scores"]))
+                for c in columns:
+                    scores[i, c] = got[labels[c]]
+
+
+def pair_scores(classifier, pairs, batch_size=8):
+    # entailment probability per (premise, hypothesis) pair, or None when the classifier can't
+    # score arbitrary pairs. onnx_backend.OnnxZeroShot has score_pairs; the transformers pipeline
+    # is driven through its model and tokenizer the way it does multi_label itself
+    if hasattr(classifier, "score_pairs"):
+        return classifier.score_pairs(pairs, batch_size)
+    if not (hasattr(classifier, "model") and hasattr(classifier, "entailment_id")):
+        return None
+    import torch
+    entailment = classifier.entailment_id
+    contradiction = -1 if entailment == 0 else 0
+    out = []
+    for i in range(0, len(pairs), batch_size):
+        chunk = pairs[i:i + batch_size]
+        encoded = classifier.tokenizer([p for p, _ in chunk], [h for _, h in chunk], padding=True,
+                                       truncation="only_first", return_tensors="pt")
+        with torch.no_grad():
+            logits = classifier.model(**encoded.to(classifier.model.device))[0].float().cpu().numpy()
+        pair = logits[:, [contradiction, entailment]]
+        pair = np.exp(pair - pair.max(-1, keepdims=True))
+        out.append(pair[:, 1] / pair.sum(-1))
+    return np.concatenate(out) if out else np.zeros(0, dtype=np.float32)
+
+
+# one encoder per process and model
+_encoders = {}
+
+
+def load_encoder(model, threads=None):
+    if model not in _encoders:
+        _encoders[model] = Encoder(model, threads)
+    return _encoders[model]
+
+
+def wrap(classifier, screen_opts, threads=None):
+    return ScreenedClassifier(classifier, load_encoder(screen_opts["model"], threads), screen_opts["top"],
+                              screen_opts["min_similarity"], screen_opts["floor"])
@@ -2,34 +2,97 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import os
-
-LEGISCAN_KEY = os.getenv("LEGISCAN_KEY")
-CONGRESS_GOV_KEY = os.getenv("CONGRESS_GOV_KEY")
-
-mongo_uri = os.getenv("MONGO_URI")
-from pymongo import MongoClient
-client = MongoClient(mongo_uri)
-
-
-base_db = client["civiclens"]
-
-db = client["civiclens"]["bills"]
-
-# grab all _ids already in the database
-existing_ids = set(item["_id"] for item in db.find({}, {"_id": 1}))
-
-print(len(existing_ids), "existing bills in database")
-
+import sys
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import requests
-endpoint = f"https://api.legiscan.com/?key={LEGISCAN_KEY}&op=getMasterList&state=US"
+from pymongo import MongoClient, ReplaceOne, UpdateOne
 
-resp = requests.get(endpoint)
-import os
+import changeset
+from result_cache import text_hash
 
-links = {}
+LEGISCAN_KEY = os.getenv("LEGISCAN_KEY")
+CONGRESS_GOV_KEY = os.getenv("CONGRESS_GOV_KEY")
 
-if resp.status_code == 200:
+LEGISCAN_URL = os.getenv("LEGISCAN_URL", "https://api.legiscan.com/")
+CONGRESS_API_URL = os.getenv("CONGRESS_API_URL", "https://api.congress.gov/v3")
+
+# api.congress.gov allows 5,000 requests per hour per key
+CONGRESS_RATE = 5000 / 3600
+# the formatted bill texts live on www.congress.gov, outside the api key's quota; stay polite
+TEXT_RATE = 5.0
+
+translation = {
+    "HB": "HR",
+    "HCR": "hconres",
+    "HJR": "hjres",
+
+    "SB": "S",
+    "SCR": "sconres",
+    "SJR": "sjres"
+}
+
+
+class TokenBucket:
+    # thread-safe token bucket: `rate` tokens per second, bursts of up to `capacity`
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def make_session(pool_size=8):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_with_retry(session, url, limiter=None, params=None, retries=5, backoff=1.0, timeout=60):
+    # retries connection errors, 429s and 5xxs with exponential backoff plus jitter; honours
+    # Retry-After. returns the last response (or None if every attempt raised)
+    resp = None
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            resp = session.get(url, params=params, timeout=timeout)
+        except requests.RequestException:
+            resp = None
+        if resp is not None and resp.status_code < 500 and resp.status_code != 429:
+            return resp
+        if attempt == retries:
+            break
+        delay = backoff * (2 ** attempt) * (0.5 + random.random())
+        if resp is not None and resp.headers.get("Retry-After", "").isdigit():
+            delay = max(delay, int(resp.headers["Retry-After"]))
+        time.sleep(delay)
+    return resp
+
+
+def get_master_list(session):
+    resp = get_with_retry(session, LEGISCAN_URL, params={"key": LEGISCAN_KEY, "op": "getMasterList", "state": "US"})
+    if resp is None or resp.status_code != 200:
+        return None, []
     data = resp.json()
     ml = data["masterlist"]
     session_data = ml["session"]
@@ -38,7 +101,12 @@ if resp.status_code == 200:
     bills = [
         v for k, v in ml.items() if isinstance(v, dict) and k != "session"
     ]
+    return session_no, bills
+
 
+def build_links(session_no, bills):
+    # {number: congress.gov url} for active bills
+    links = {}
     for bill in bills:
         if bill["status"] == 2 and bill["number"][1] != "R": # active, not just introduced
             billtype = ""
@@ -49,72 +117,181 @@ if resp.status_code == 200:
                 else:
                     # if char == "B": char = "R"
                     billtype += char
-    
-            translation = {
-                "HB": "HR",
-                "HCR": "hconres",
-                "HJR": "hjres",
-
-            "SB": "S",
-            "SCR": "sconres",
-            "SJR": "sjres"
-
-            }
-            #bill["number"] = translation.get(bill["number"], bill["number"]).upper() + billno
-
-
-
-            links[bill["number"]] = f"https://api.congress.gov/v3/bill/{session_no}/{translation.get(billtype, billtype)}/{billno}"
-
-
-# links = dict((k, v) for k, v in links.items() if not k.startswith("HB"))
-
-
-
-links_to_add = dict((k, v) for k, v in links.items() if k not in existing_ids)
-links_to_delete = set(existing_ids) - set(links.keys())
-
-
-
-# print(list(links.items())[0])
-
-print(f"{len(links_to_add)} new bills to add\n{len(links_to_delete)} bills to delete\nPress enter to continue.")
-
-
-for k in links_to_delete:
-    base_db["bills"].delete_one({"_id": k})
-    base_db["scores"].delete_many({"_id": k})
-    base_db["summaries"].delete_many({"_id": k})
-    print(f"Deleted {k}")
-
-final = {}
-import time
-
-links = {k: v for k, v in links.items() if k in links_to_add}
-
-for k, v in links.items():
-    
-    resp = requests.get(v + "?format=json&api_key=" + CONGRESS_GOV_KEY)
-    d = {}
-    if resp.status_code == 200:
-
-        resp_data = resp.json()["bill"]
-        textversions = resp_data.get("textVersions", [])["url"]
-        resp2 = requests.get(textversions + "?format=json&api_key=" + CONGRESS_GOV_KEY)
-        if resp2.status_code == 200:
-            resp2_data = resp2.json()
-            ver = resp2_data["textVersions"][-1]["formats"][0] # formatted text guaranteed to always be first? unsure
-            text = requests.get(ver["url"]).text
-            d["text"] = text
-        d["title"] = k
-
-    final[k] = d
-
-    d["_id"] = k
-
-    
-    db.insert_one(d)
-
 
-    time.sleep(1) # avoid rate limiting
-    print(f"Inserted {k}")
+            links[bill["number"]] = f"{CONGRESS_API_URL}/bill/{session_no}/{translation.get(billtype, billtype)}/{billno}"
+    return links
+
+
+def change_info(bills):
+    # what legiscan tells us about each bill's latest change, keyed by bill number
+    return {bill["number"]: {"change_hash": bill.get("change_hash"), "last_action_date": bill.get("last_action_date")}
+            for bill in bills}
+
+
+def fetch_bill(session, api_limiter, text_limiter, k, v, extra=None):
+    # bill -> textVersions -> formatted text. returns the document, or None if it couldn't be
+    # fetched (it stays out of the db, or keeps its old hash, so the next run tries again)
+    params = {"format": "json", "api_key": CONGRESS_GOV_KEY}
+    resp = get_with_retry(session, v, api_limiter, params=params)
+    if resp is None or resp.status_code != 200:
+        return None
+
+    d = {"_id": k, "title": k}
+    d.update(extra or {})
+    resp_data = resp.json()["bill"]
+    d["update_date"] = resp_data.get("updateDate")
+    textversions = (resp_data.get("textVersions") or {}).get("url")
+    if textversions:
+        resp2 = get_with_retry(session, textversions, api_limiter, params=params)
+        if resp2 is None or resp2.status_code != 200:
+            return None
+        versions = resp2.json().get("textVersions") or []
+        if versions and versions[-1].get("formats"):
+            ver = versions[-1]["formats"][0] # formatted text guaranteed to always be first? unsure
+            resp3 = get_with_retry(session, ver["url"], text_limiter)
+            if resp3 is None or resp3.status_code != 200:
+                return None
+            d["text"] = resp3.text
+            # lets the later stages tell whether the text changed without downloading it
+            d["text_hash"] = text_hash(resp3.text)
+    return d
+
+
+def ingest(db, links, workers=8, api_rate=CONGRESS_RATE, text_rate=TEXT_RATE, write_batch=50, session=None, log=print,
+           extra=None, on_written=None):
+    # fetches every link on a thread pool behind shared rate limiters and upserts the results
+    # into `bills` in batches. extra holds per-bill fields to store alongside (change hashes);
+    # on_written(docs) is called after each batch lands so later stages can start on it.
+    # returns counts, timing and the ids actually written
+    session = session or make_session(workers)
+    api_limiter = TokenBucket(api_rate)
+    text_limiter = TokenBucket(text_rate)
+    extra = extra or {}
+    buffer = []
+    written = []
+    inserted = failed = 0
+    start = time.time()
+
+    def flush():
+        nonlocal buffer, inserted
+        if buffer:
+            db.bulk_write([ReplaceOne({"_id": d["_id"]}, d, upsert=True) for d in buffer], ordered=False)
+            inserted += len(buffer)
+            written.extend(d["_id"] for d in buffer)
+            if on_written is not None:
+                on_written(buffer)
+            buffer = []
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch_bill, session, api_limiter, text_limiter, k, v, extra.get(k)): k
+                   for k, v in links.items()}
+        for future in as_completed(futures):
+            k = futures[future]
+            try:
+                d = future.result()
+            except Exception as e:
+                d = None
+                log(f"Error fetching {k}: {e}")
+            if d is None:
+                failed += 1
+                log(f"Failed {k}")
+                continue
+            buffer.append(d)
+            log(f"Inserted {k}")
+            if len(buffer) >= write_batch:
+                flush()
+    flush()
+
+    elapsed = time.time() - start
+    return {"inserted": inserted, "failed": failed, "seconds": elapsed,
+            "bills_per_sec": inserted / elapsed if elapsed > 0 else 0.0, "ids": written}
+
+
+def plan_sync(existing, links, info, full=False):
+    # existing: {_id: change_hash stored on the bill (None for bills from before hashes were kept)}
+    # returns (to_add, to_update, to_delete, to_backfill)
+    to_add = {k: v for k, v in links.items() if k not in existing}
+    to_delete = set(existing) - set(links)
+    to_update, to_backfill = {}, {}
+    for k, v in links.items():
+        if k not in existing:
+            continue
+        stored, current = existing[k], info.get(k, {}).get("change_hash")
+        if full or (stored is not None and current is not None and stored != current):
+            to_update[k] = v
+        elif stored is None and current is not None:
+            # no hash to compare against: adopt the current one without refetching
+            to_backfill[k] = info[k]
+    return to_add, to_update, to_delete, to_backfill
+
+
+def delete_bills(base_db, ids):
+    ids = list(ids)
+    for i in range(0, len(ids), 1000):
+        chunk = {"_id": {"$in": ids[i:i + 1000]}}
+        base_db["bills"].delete_many(chunk)
+        base_db["scores"].delete_many(chunk)
+        base_db["summaries"].delete_many(chunk)
+
+
+def sync(base_db, session, workers=8, api_rate=CONGRESS_RATE, text_rate=TEXT_RATE, full=False, log=print,
+         write_batch=50, on_written=None):
+    # one incremental sync: add new bills, refetch bills whose legiscan change_hash moved, bulk-delete
+    # bills that dropped off the master list, and record a changeset for the later stages
+    db = base_db["bills"]
+    session_no, bills = get_master_list(session)
+    links = build_links(session_no, bills) if session_no else {}
+    if not links:
+        return None
+    info = change_info(bills)
+
+    existing = {item["_id"]: item.get("change_hash") for item in db.find({}, {"_id": 1, "change_hash": 1})}
+    log(f"{len(existing)} existing bills in database")
+    to_add, to_update, to_delete, to_backfill = plan_sync(existing, links, info, full)
+    log(f"{len(to_add)} new bills to add\n{len(to_update)} changed bills to refetch\n{len(to_delete)} bills to delete")
+
+    if to_delete:
+        delete_bills(base_db, to_delete)
+        log(f"Deleted {len(to_delete)} bills")
+    if to_backfill:
+        db.bulk_write([UpdateOne({"_id": k}, {"$set": v}) for k, v in to_backfill.items()], ordered=False)
+
+    stats = ingest(db, dict(to_add, **to_update), workers=workers, api_rate=api_rate, text_rate=text_rate,
+                   session=session, log=log, extra=info, write_batch=write_batch, on_written=on_written)
+    written = set(stats["ids"])
+    added, updated = written & set(to_add), written & set(to_update)
+    stats.update(added=len(added), updated=len(updated), deleted=len(to_delete), changeset=None)
+    if added or updated or to_delete:
+        stats["changeset"] = changeset.record(base_db, added, updated, to_delete)["_id"]
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sync active bills from LegiScan/congress.gov into mongo")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--api-rate", type=float, default=CONGRESS_RATE, help="congress.gov api requests per second")
+    parser.add_argument("--text-rate", type=float, default=TEXT_RATE, help="bill text downloads per second")
+    parser.add_argument("--full", action="store_true", help="refetch every active bill, not just new/changed ones")
+    args = parser.parse_args(argv)
+
+    mongo_uri = os.getenv("MONGO_URI")
+    client = MongoClient(mongo_uri)
+
+    base_db = client["civiclens"]
+
+    session = make_session(args.workers)
+    stats = sync(base_db, session, workers=args.workers, api_rate=args.api_rate, text_rate=args.text_rate, full=args.full)
+    if stats is None:
+        print("Could not load the master list")
+        return 1
+
+    print(f"Inserted {stats['inserted']} bills ({stats['failed']} failed) in {stats['seconds']:.1f}s ({stats['bills_per_sec']:.2f} bills/sec)")
+    if stats["changeset"] is not None:
+        print(f"Changeset {stats['changeset']}: {stats['added']} added, {stats['updated']} updated, {stats['deleted']} deleted")
+    else:
+        print("Nothing changed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+# optional ONNX Runtime backend for the comprehend_it zero-shot classifier, with dynamic int8
+# quantization. inference needs only onnxruntime and the tokenizer (no torch), which is what the
+# CPU-only ARM box wants; exporting needs torch once, on any machine.
+#
+#   pip install onnxruntime
+#   python onnx_backend.py export --model knowledgator/comprehend_it-base --out models/comprehend_it-onnx
+#   python onnx_backend.py quantize --dir models/comprehend_it-onnx        # if export ran with --no-quantize
+#   python categorize.py --backend onnx-int8 --model-dir models/comprehend_it-onnx
+#   CLASSIFIER_BACKEND=onnx-int8 CLASSIFIER_MODEL_DIR=models/comprehend_it-onnx python ../utils/zeroshot.py bill.txt
+#
+# the exported directory holds model.onnx, model_int8.onnx, config.json and the tokenizer files, and
+# everything is loaded with local_files_only, so nothing reaches the network.
+#
+#   python onnx_backend.py compare --model-dir models/comprehend_it-onnx --sample 200
+#
+# re-scores a random sample of bills that already have scores with each backend (each in its own
+# process, for a clean peak RSS) and reports parity against the stored scores plus items/sec.
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+import numpy as np
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+MODEL_FILES = {"onnx": "model.onnx", "onnx-int8": "model_int8.onnx"}
+HYPOTHESIS_TEMPLATE = "This example is {}."
+
+
+class OnnxZeroShot:
+    # stands in for transformers' zero-shot-classification pipeline in multi_label mode: same call
+    # signature and output, and a .tokenizer for chunking.py
+    def __init__(self, model_dir, quantized=True, threads=None):
+        import onnxruntime as ort
+        from transformers import AutoConfig, AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir, local_files_only=True)
+        config = AutoConfig.from_pretrained(model_dir, local_files_only=True)
+        self.entailment_id = next((i for label, i in config.label2id.items() if label.lower().startswith("entail")), -1)
+        self.contradiction_id = -1 if self.entailment_id == 0 else 0
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        path = os.path.join(model_dir, MODEL_FILES["onnx-int8" if quantized else "onnx"])
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _logits(self, pairs):
+        encoded = self.tokenizer([p for p, _ in pairs], [h for _, h in pairs], padding=True,
+                                 truncation="only_first", return_tensors="np")
+        feed = {name: np.asarray(value, dtype=np.int64) for name, value in encoded.items() if name in self.input_names}
+        return self.session.run(None, feed)[0]
+
+    def score_pairs(self, pairs, batch_size=8):
+        # [(premise, hypothesis)] -> entailment probability of each, softmaxed over contradiction vs
+        # entailment as the pipeline does for multi_label. pairs needn't share labels or premises
+        if not pairs:
+            return np.zeros(0, dtype=np.float32)
+        logits = np.concatenate([self._logits(pairs[i:i + batch_size]) for i in range(0, len(pairs), batch_size)])
+        pair = logits[:, [self.contradiction_id, self.entailment_id]]
+        pair = np.exp(pair - pair.max(-1, keepdims=True))
+        return pair[:, 1] / pair.sum(-1)
+
+    def __call__(self, sequences, candidate_labels, multi_label=True, batch_size=8, hypothesis_template=HYPOTHESIS_TEMPLATE):
+        single = isinstance(sequences, str)
+        sequences = [sequences] if single else list(sequences)
+        pairs = [(seq, hypothesis_template.format(label)) for seq in sequences for label in candidate_labels]
+        scores = self.score_pairs(pairs, batch_size).reshape(len(sequences), len(candidate_labels))
+        out = []
+        for seq, row in zip(sequences, scores):
+            order = list(reversed(row.argsort()))
+            out.append({"sequence": seq, "labels": [candidate_labels[i] for i in order],
+                        "scores": [float(row[i]) for i in order]})
+        return out[0] if single else out
+
+
+def load(backend, model_dir=None, model_name=None, threads=None):
+    # the classifier for a backend; torch goes through the stock pipeline, from model_dir when
+    # given (offline) or the hub name otherwise
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown backend {backend!r}, expected one of {BACKENDS}")
+    if backend == "torch":
+        from transformers import pipeline
+        from transformers.utils import logging
+        logging.set_verbosity_error()
+        kwargs = {"model_kwargs": {"local_files_only": True}} if model_dir else {}
+        return pipeline("zero-shot-classification", model=model_dir or model_name, device=-1, **kwargs)
+    if not model_dir:
+        raise ValueError(f"the {backend} backend needs a local model directory (see onnx_backend.py export)")
+    return OnnxZeroShot(model_dir, quantized=backend == "onnx-int8", threads=threads)
+
+
+def export(model, out_dir, quantize=True, opset=17):
+    # model: hub name or local directory of the torch model
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    local = os.path.isdir(model)
+    tokenizer = AutoTokenizer.from_pretrained(model, local_files_only=local)
+    net = AutoModelForSequenceClassification.from_pretrained(model, local_files_only=local).eval()
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer.save_pretrained(out_dir)
+    net.config.save_pretrained(out_dir)
+
+    sample = tokenizer(["A bill about schools."], ["This example is education."], return_tensors="pt")
+    names = list(sample.keys())
+    axes = {name: {0: "batch", 1: "tokens"} for name in names}
+    axes["logits"] = {0: "batch"}
+    with torch.no_grad():
+        torch.onnx.export(net, tuple(sample[name] for name in names), os.path.join(out_dir, MODEL_FILES["onnx"]),
+                          input_names=names, output_names=["logits"], dynamic_axes=axes, opset_version=opset)
+    if quantize:
+        quantize_model(out_dir)
+
+
+def quantize_model(model_dir):
+    # dynamic int8: weights stored as int8, activations quantized on the fly, no calibration data
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    quantize_dynamic(os.path.join(model_dir, MODEL_FILES["onnx"]), os.path.join(model_dir, MODEL_FILES["onnx-int8"]),
+                     weight_type=QuantType.QInt8)
+
+
+def score(args):
+    # one backend over a sample file, in its own process: writes scores plus throughput and peak RSS
+    import chunking
+    import categorize
+    with open(args.input, encoding="utf-8") as f:
+        sample = json.load(f)
+    chunk_opts = categorize.chunk_options(args.aggregate, args.window_tokens, args.max_windows)
+
+    a = time.perf_counter()
+    classifier = load(args.backend, args.model_dir, categorize.MODEL_NAME, args.threads)
+    load_seconds = time.perf_counter() - a
+
+    texts = [item["text"] for item in sample]
+    a = time.perf_counter()
+    if chunk_opts:
+        scores, _ = chunking.classify_long(classifier, texts, categorize.candidate_labels, batch_size=args.batch_size,
+                                           **chunk_opts)
+    else:
+        scores = categorize.classify(classifier, texts, args.batch_size)
+    elapsed = time.perf_counter() - a
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({
+            "backend": args.backend,
+            "scores": scores,
+            "load_seconds": load_seconds,
+            "items_per_sec": len(texts) / elapsed if elapsed else 0.0,
+            # ru_maxrss is in kilobytes on linux
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }, f)
+    return 0
+
+
+def parity(reference, candidate, labels):
+    ref = np.array([[r.get(label, 0.0) for label in labels] for r in reference])
+    got = np.array([[c.get(label, 0.0) for label in labels] for c in candidate])
+    diff = np.abs(ref - got)
+    top1 = (ref.argmax(1) == got.argmax(1)).mean()
+    top3 = np.mean([len(set(np.argsort(-r)[:3]) & set(np.argsort(-g)[:3])) / 3 for r, g in zip(ref, got)])
+    # labels that land on the other side of 0.5, the cut the frontend treats as "about this topic"
+    flips = ((ref >= 0.5) != (got >= 0.5)).mean()
+    return {"mean_abs_diff": float(diff.mean()), "max_abs_diff": float(diff.max()), "top1_agreement": float(top1),
+            "top3_overlap": float(top3), "threshold_flips": float(flips)}
+
+
+def load_sample(args):
+    # held-out bills: ones that already have stored scores, so parity is against what's in production
+    if args.texts:
+        sample = []
+        for name in sorted(os.listdir(args.texts))[:args.sample]:
+            with open(os.path.join(args.texts, name), encoding="utf-8") as f:
+                sample.append({"_id": name, "text": f.read(), "scores": None})
+        return sample
+    from pymongo import MongoClient
+    base_db = MongoClient(os.getenv("MONGO_URI"))["civiclens"]
+    picked = list(base_db["scores"].aggregate([{"$sample": {"size": args.sample}}]))
+    texts = {doc["_id"]: doc.get("text") for doc in base_db["bills"].find(
+        {"_id": {"$in": [doc["_id"] for doc in picked]}}, {"text": 1})}
+    return [{"_id": doc["_id"], "text": texts[doc["_id"]], "scores": doc["scores"]}
+            for doc in picked if texts.get(doc["_id"])]
+
+
+def compare(args):
+    import tempfile
+    import categorize
+    sample = load_sample(args)
+    if not sample:
+        print("No scored bills to compare on")
+        return 1
+    print(f"{len(sample)} held-out bills")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sample.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump([{"_id": item["_id"], "text": item["text"]} for item in sample], f)
+        for backend in args.backends:
+            out = os.path.join(tmp, backend + ".json")
+            cmd = [sys.executable, os.path.abspath(__file__), "score", "--backend", backend, "--input", path,
+                   "--output", out, "--batch-size", str(args.batch_size), "--aggregate", args.aggregate,
+                   "--window-tokens", str(args.window_tokens)]
+            if args.max_windows:
+                cmd += ["--max-windows", str(args.max_windows)]
+            if args.threads:
+                cmd += ["--threads", str(args.threads)]
+            if args.model_dir and (backend != "torch" or args.torch_from_dir):
+                cmd += ["--model-dir", args.model_dir]
+            if subprocess.run(cmd).returncode != 0:
+                print(f"{backend}: failed")
+                continue
+            with open(out, encoding="utf-8") as f:
+                results[backend] = json.load(f)
+
+    # stored scores when the sample came from mongo, else the first backend that ran (torch by default)
+    if all(item["scores"] is not None for item in sample):
+        reference, against = [item["scores"] for item in sample], "stored scores"
+    elif results:
+        against = next(backend for backend in args.backends if backend in results)
+        reference, against = results[against]["scores"], against + " backend"
+    else:
+        reference, against = None, None
+
+    report = {}
+    for backend, result in results.items():
+        report[backend] = {k: round(result[k], 3) for k in ("items_per_sec", "peak_rss_mb", "load_seconds")}
+        if reference is not None:
+            report[backend]["parity"] = {k: round(v, 4) for k, v in
+                                         parity(reference, result["scores"], categorize.candidate_labels).items()}
+    print(f"parity against {against}:" if against else "no reference scores for parity")
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+def add_scoring_args(parser):
+    import chunking
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--aggregate", choices=chunking.AGGREGATIONS + ("off",), default="max")
+    parser.add_argument("--window-tokens", type=int, default=chunking.DEFAULT_MAX_TOKENS)
+    parser.add_argument("--max-windows", type=int, default=None)
+    parser.add_argument("--threads", type=int, default=None, help="intra-op threads for onnxruntime")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ONNX Runtime / int8 backend for the zero-shot classifier")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("export", help="export the torch model to ONNX (needs torch), then quantize it")
+    p.add_argument("--model", default="knowledgator/comprehend_it-base", help="hub name or local model directory")
+    p.add_argument("--out", required=True)
+    p.add_argument("--no-quantize", action="store_true")
+    p.add_argument("--opset", type=int, default=17)
+    p = sub.add_parser("quantize", help="write model_int8.onnx next to an exported model.onnx")
+    p.add_argument("--dir", required=True)
+    p = sub.add_parser("compare", help="parity, items/sec and peak RSS per backend on a held-out sample")
+    p.add_argument("--model-dir", help="exported directory (from export)")
+    p.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    p.add_argument("--sample", type=int, default=200)
+    p.add_argument("--texts", help="directory of bill texts to use instead of mongo (parity is then against the first backend)")
+    p.add_argument("--torch-from-dir", action="store_true", help="load the torch backend from --model-dir too")
+    add_scoring_args(p)
+    p = sub.add_parser("score")
+    p.add_argument("--backend", choices=BACKENDS, required=True)
+    p.add_argument("--model-dir")
+    p.add_argument("--input", required=True)
+    p.add_argument("--output", required=True)
+    add_scoring_args(p)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "export":
+        export(args.model, args.out, quantize=not args.no_quantize, opset=args.opset)
+        print(f"Exported to {args.out}")
+        return 0
+    if args.cmd == "quantize":
+        quantize_model(args.dir)
+        print(f"Wrote {os.path.join(args.dir, MODEL_FILES['onnx-int8'])}")
+        return 0
+    if args.cmd == "compare":
+        return compare(args)
+    return score(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
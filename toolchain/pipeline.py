@@ -0,0 +1,312 @@
+from dotenv import load_dotenv
+load_dotenv()
+
+# runs ingest -> categorize -> summarize as one streaming job instead of three scripts in a row.
+#
+# ingest writes bills in small batches and hands each batch to the categorize and summarize stages
+# over bounded queues, so classification and summaries start while bills are still downloading and
+# a slow stage pushes back on ingest instead of piling texts up in memory. each stage keeps its own
+# concurrency (ingest threads, classifier processes, OpenAI requests in flight). once summaries are
+# done, new or changed ones are translated into every language (translate_summaries.py) and the
+# search index picks up whatever changed (index_search.py).
+#
+# there is no separate checkpoint file: every stage writes its output under a content key as it
+# goes, so after a crash the next run's backlog (the same anti-join categorize.py and
+# generate_summaries.py use) picks up exactly the bills that never got scores or a summary.
+# runs are recorded in civiclens.pipeline_runs with their counts and a heartbeat.
+#
+#   python pipeline.py --categorize-workers 2 --summarize-concurrency 16
+
+import os
+import sys
+import time
+import queue
+import argparse
+import datetime
+import threading
+
+from pymongo import MongoClient
+
+import changeset
+import chunking
+import categorize
+import legiscan_data
+import generate_summaries
+import translate_summaries
+import index_search
+from print_texts import load_languages
+from work_selection import select_work
+
+STAGES = ("categorize", "summarize")
+_print_lock = threading.Lock()
+
+
+def stage_log(name):
+    def log(*args):
+        with _print_lock:
+            print(f"[{name}]", *args, flush=True)
+    return log
+
+
+def drain(backlog, q):
+    # the stage's backlog from the db first, then whatever ingest hands over until it's done
+    for batch in backlog:
+        yield from batch
+    while True:
+        item = q.get()
+        if item is None:
+            return
+        yield item
+
+
+def now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class Freshness:
+    # ingest -> servable latency: a bill is servable once every enabled stage has written it
+    def __init__(self, stages):
+        self.stages = set(stages)
+        self.lock = threading.Lock()
+        self.ingested = {}
+        self.pending = {}
+        self.latencies = []
+        self.counts = {stage: 0 for stage in stages}
+        self.counts["ingest"] = 0
+
+    def ingested_batch(self, ids):
+        t = time.time()
+        with self.lock:
+            self.counts["ingest"] += len(ids)
+            for _id in ids:
+                self.ingested[_id] = t
+                self.pending[_id] = set(self.stages)
+
+    def done(self, stage, ids):
+        t = time.time()
+        with self.lock:
+            self.counts[stage] += len(ids)
+            for _id in ids:
+                left = self.pending.get(_id)
+                if left is None:
+                    continue
+                left.discard(stage)
+                if not left:
+                    del self.pending[_id]
+                    self.latencies.append(t - self.ingested.pop(_id))
+
+    def report(self):
+        with self.lock:
+            lat = sorted(self.latencies)
+            return {
+                "counts": dict(self.counts),
+                "servable": len(lat),
+                "waiting": len(self.pending),
+                "p50_minutes": categorize.percentile(lat, 50) / 60 if lat else None,
+                "p90_minutes": categorize.percentile(lat, 90) / 60 if lat else None,
+                "max_minutes": lat[-1] / 60 if lat else None,
+            }
+
+
+def start_run(base_db, args):
+    runs = base_db["pipeline_runs"]
+    for prev in runs.find({"status": "running"}, {"_id": 1, "started": 1}):
+        # nothing to restore: the backlog selection below finds what it didn't finish
+        print(f"Previous run {prev['_id']} (started {prev['started']}) didn't finish, resuming its work")
+        runs.update_one({"_id": prev["_id"]}, {"$set": {"status": "interrupted"}})
+    run_id = now().strftime("%Y%m%dT%H%M%S.%f")
+    runs.insert_one({"_id": run_id, "started": now(), "heartbeat": now(), "status": "running", "args": vars(args)})
+    return run_id
+
+
+def run(base_db, args, openai_client=None, session=None):
+    stages = [stage for stage in STAGES if stage not in args.skip]
+    freshness = Freshness(stages)
+    queues = {stage: queue.Queue(maxsize=args.queue_size) for stage in stages}
+    results = {}
+    errors = []
+    run_id = start_run(base_db, args)
+    # changesets recorded before this run are covered by the backlog; ours by the queues
+    consumed = {stage: changeset.pending(base_db, stage)[0] for stage in stages}
+
+    chunk_opts = categorize.chunk_options(args.aggregate, args.window_tokens, args.max_windows)
+    model_opts = categorize.model_options(args.backend, args.model_dir, categorize.screen_from_args(args))
+    caches = {}
+    if "categorize" in stages:
+        caches["categorize"] = categorize.make_cache(base_db, chunk_opts, model_opts)
+    if "summarize" in stages:
+        caches["summarize"] = generate_summaries.make_cache(base_db)
+
+    dead = set()
+
+    def hand_over(stage, item):
+        # blocks while the stage is behind, which is what keeps memory bounded; gives up if the
+        # stage died so ingest can still finish
+        while stage not in dead:
+            try:
+                queues[stage].put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    def on_written(docs):
+        docs = [d for d in docs if d.get("text")]
+        freshness.ingested_batch([d["_id"] for d in docs])
+        for stage in queues:
+            for d in docs:
+                hand_over(stage, ({"_id": d["_id"], "text": d["text"]}, caches[stage].key_for_hash(d["text_hash"])))
+
+    def guarded(name, fn):
+        def target():
+            try:
+                results[name] = fn()
+            except Exception as e:
+                errors.append((name, e))
+                dead.add(name)
+                stage_log(name)(f"failed: {e!r}")
+        return target
+
+    def do_ingest():
+        log = stage_log("ingest")
+        try:
+            if args.no_ingest:
+                return None
+            return legiscan_data.sync(base_db, session or legiscan_data.make_session(args.ingest_workers),
+                                      workers=args.ingest_workers, api_rate=args.api_rate,
+                                      text_rate=args.text_rate, full=args.full, log=log if args.verbose else _quiet,
+                                      write_batch=args.write_batch, on_written=on_written)
+        finally:
+            for stage in queues:
+                hand_over(stage, None)
+
+    def do_categorize():
+        log = stage_log("categorize")
+        backlog = select_work(base_db, "scores", caches["categorize"], batch_size=args.batch_size * 4)
+        work = drain(backlog, queues["categorize"])
+        workers = args.categorize_workers or categorize.default_workers(args.threads_per_worker)
+        processed, reused, stats, failed = categorize.process(
+            base_db, caches["categorize"], work, args.batch_size, workers, args.threads_per_worker, chunk_opts,
+            on_done=lambda ids: freshness.done("categorize", ids), log=log if args.verbose else _quiet,
+            model_opts=model_opts)
+        log(f"{processed} classified, {reused} reused from cache, {failed} failed")
+        if stats:
+            categorize.print_latency_report(stats)
+        return {"processed": processed, "reused": reused, "failed": failed}
+
+    def do_summarize():
+        log = stage_log("summarize")
+        quiet = log if args.verbose else _quiet
+        backlog = generate_summaries.skip_submitted(
+            base_db, select_work(base_db, "summaries", caches["summarize"], batch_size=50))
+        work = categorize.batched(drain(backlog, queues["summarize"]), args.summarize_concurrency)
+        bills = generate_summaries.reuse_cached(base_db, caches["summarize"], work,
+                                                on_saved=lambda ids: freshness.done("summarize", ids), log=quiet)
+        done, failed = generate_summaries.run_concurrent(
+            openai_client, base_db, caches["summarize"], bills, args.summarize_concurrency,
+            on_saved=lambda ids: freshness.done("summarize", ids), log=quiet)
+        log(f"{done} summarized, {failed} failed")
+        return {"summarized": done, "failed": failed}
+
+    threads = [threading.Thread(target=guarded("ingest", do_ingest), daemon=True)]
+    if "categorize" in stages:
+        threads.append(threading.Thread(target=guarded("categorize", do_categorize), daemon=True))
+    if "summarize" in stages:
+        threads.append(threading.Thread(target=guarded("summarize", do_summarize), daemon=True))
+
+    start = time.time()
+    for t in threads:
+        t.start()
+    log = stage_log("pipeline")
+    while any(t.is_alive() for t in threads):
+        threads[-1].join(args.report_every)
+        report = freshness.report()
+        depth = {stage: q.qsize() for stage, q in queues.items()}
+        log(f"{report['counts']} queued {depth}, {report['servable']} servable, {report['waiting']} in flight")
+        base_db["pipeline_runs"].update_one({"_id": run_id}, {"$set": {"heartbeat": now(), "counts": report["counts"]}})
+
+    if "translate" not in args.skip and "summarize" in stages and "summarize" in results:
+        languages = [code for code in load_languages().keys() if code != "en"]
+        results["translate"] = translate_summaries.run(base_db, languages, workers=args.translate_workers,
+                                                       log=stage_log("translate") if args.verbose else _quiet)
+        translate_summaries.print_report(results["translate"])
+
+    if "index" not in args.skip:
+        # after translate, so a bill whose summary just landed is searchable by it
+        results["index"] = index_search.run(base_db, log=stage_log("index") if args.verbose else _quiet)
+        stage_log("index")(f"{results['index']['indexed']} bills indexed, {results['index']['removed']} removed")
+
+    report = freshness.report()
+    report.update(seconds=time.time() - start, stages=results,
+                  errors=[f"{name}: {e!r}" for name, e in errors])
+    ingest = results.get("ingest")
+    if ingest and ingest.get("changeset") is not None:
+        for stage in stages:
+            consumed[stage].append(ingest["changeset"])
+    failed = errors or any(r and r.get("failed") for name, r in results.items() if name != "ingest")
+    # everything the changesets pointed at went through a stage queue or its backlog, so they're
+    # done unless something failed, in which case --changes runs of the single scripts still see them
+    if not failed:
+        for stage in stages:
+            changeset.mark_consumed(base_db, stage, consumed[stage])
+    base_db["pipeline_runs"].update_one({"_id": run_id}, {"$set": {
+        "status": "failed" if failed else "finished", "finished": now(), "heartbeat": now(),
+        "counts": report["counts"], "freshness": {k: report[k] for k in ("p50_minutes", "p90_minutes", "max_minutes")},
+    }})
+    return report
+
+
+def _quiet(*args):
+    pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest, categorize and summarize bills as one streaming run")
+    parser.add_argument("--no-ingest", action="store_true", help="only work through the categorize/summarize backlog")
+    parser.add_argument("--full", action="store_true", help="refetch every active bill, not just new/changed ones")
+    parser.add_argument("--skip", action="append", choices=STAGES + ("translate", "index"), default=[],
+                        help="leave a stage out (repeatable)")
+    parser.add_argument("--ingest-workers", type=int, default=8)
+    parser.add_argument("--api-rate", type=float, default=legiscan_data.CONGRESS_RATE)
+    parser.add_argument("--text-rate", type=float, default=legiscan_data.TEXT_RATE)
+    parser.add_argument("--write-batch", type=int, default=10, help="bills per ingest write; smaller hands work on sooner")
+    parser.add_argument("--categorize-workers", type=int, default=1, help="classifier processes (0 = size to cores/RAM)")
+    parser.add_argument("--threads-per-worker", type=int, default=2)
+    parser.add_argument("--backend", choices=categorize.BACKENDS, default=categorize.BACKEND,
+                        help="classifier runtime, see onnx_backend.py")
+    parser.add_argument("--model-dir", default=categorize.MODEL_DIR, help="local model directory, loaded offline")
+    categorize.add_screen_args(parser)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--aggregate", choices=chunking.AGGREGATIONS + ("off",), default="max")
+    parser.add_argument("--window-tokens", type=int, default=chunking.DEFAULT_MAX_TOKENS)
+    parser.add_argument("--max-windows", type=int, default=None)
+    parser.add_argument("--summarize-concurrency", type=int, default=8)
+    parser.add_argument("--translate-workers", type=int, default=8, help="concurrent LibreTranslate requests")
+    parser.add_argument("--queue-size", type=int, default=64, help="bills buffered between ingest and each stage")
+    parser.add_argument("--report-every", type=float, default=30.0, help="seconds between progress lines")
+    parser.add_argument("--verbose", action="store_true", help="log every bill")
+    parser.add_argument("--every", type=float, default=0, metavar="SECONDS",
+                        help="keep running, starting a new run this long after the last one finished; "
+                             "the classifier stays loaded between runs")
+    args = parser.parse_args(argv)
+
+    base_db = MongoClient(os.getenv("MONGO_URI"))["civiclens"]
+    openai_client = None
+    if "summarize" not in args.skip:
+        from openai import OpenAI
+        openai_client = OpenAI(api_key=os.getenv("OPENAI_KEY"), timeout=900.0)
+
+    while True:
+        report = run(base_db, args, openai_client)
+        print(f"Done in {report['seconds'] / 60:.1f} minutes: {report['counts']}")
+        if report["servable"]:
+            print(f"ingest -> servable: p50 {report['p50_minutes']:.2f} min, p90 {report['p90_minutes']:.2f} min, "
+                  f"max {report['max_minutes']:.2f} min over {report['servable']} bills")
+        for err in report["errors"]:
+            print("Error:", err)
+        if not args.every:
+            return 1 if report["errors"] else 0
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+# fills the backend translation cache with every UI string in backend/logs/texts.log for every
+# language in languages.json, so no first-time user waits on a live translation.
+#
+#   python prewarm_cache.py --workers 8
+#
+# same walk as print_texts.py, but non-interactive, parallel, and written straight into
+# backend/translations/ through the backend's ShardedTranslationStore. every translation is
+# appended to the store's log as soon as it arrives and pairs already cached are skipped, so
+# an interrupted run picks up where it left off.
+#
+# a backend that is already running only reads a shard when it first needs it, so a language it
+# has loaded won't serve the pre-warmed entries until that shard is loaded again (evicted under
+# the memory budget, or the backend restarted). warm before starting the backend, or restart it.
+
+import os
+import sys
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+from print_texts import load_languages, extract_translated_text
+
+base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(base, 'backend'))
+
+from translation_store import ShardedTranslationStore, split_leading_prefix  # noqa: E402
+from translate_client import TranslateClient  # noqa: E402
+
+TRANSLATE_URL = os.getenv('TRANSLATE_URL', 'https://translate.civiclens.app/translate')
+
+
+def load_lines(log_path):
+    with open(log_path, 'r', encoding='utf-8') as f:
+        lines = [ln for ln in f.read().split('\n') if ln.strip()]
+    # cache is keyed by the text without its leading emoji/punctuation, same as /api/translate
+    cores = []
+    for line in lines:
+        _, core = split_leading_prefix(line)
+        if core and core not in cores:
+            cores.append(core)
+    return cores
+
+
+def chunked(items, max_chars):
+    chunk, size = [], 0
+    for item in items:
+        if chunk and size + len(item) + 1 > max_chars:
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(item)
+        size += len(item) + 1
+    if chunk:
+        yield chunk
+
+
+class Prewarmer:
+    def __init__(self, store, client):
+        self.store = store
+        self.client = client
+        self.lock = threading.Lock()
+        self.translated = {}
+        self.failed = {}
+
+    def _post(self, q, target):
+        return self.client.post({'q': q, 'source': 'en', 'target': target})
+
+    def translate_texts(self, target, chunk):
+        # {text: translation} for one newline-joined request, leaving out anything that failed
+        results = {}
+        try:
+            lines = extract_translated_text('\n'.join(chunk), self._post('\n'.join(chunk), target)).split('\n')
+        except (requests.RequestException, ValueError) as e:
+            print('batch translate failed for', target, e, file=sys.stderr)
+            lines = []
+        if len(lines) == len(chunk):
+            results = {text: line for text, line in zip(chunk, lines) if line.strip()}
+
+        # anything the batch couldn't line up is retried one string at a time
+        for text in chunk:
+            if text in results:
+                continue
+            try:
+                translated = extract_translated_text(text, self._post(text, target))
+            except (requests.RequestException, ValueError) as e:
+                print('translate request failed for', target, repr(text), e, file=sys.stderr)
+                continue
+            if translated.strip():
+                results[text] = translated
+        return results
+
+    def translate_chunk(self, target, chunk):
+        pipeline = 'en-' + target
+        results = self.translate_texts(target, chunk)
+        for text, translated in results.items():
+            self.store.put(pipeline, text, translated)
+        with self.lock:
+            self.translated[target] = self.translated.get(target, 0) + len(results)
+            self.failed[target] = self.failed.get(target, 0) + len(chunk) - len(results)
+        return len(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pre-warm the backend translation cache from texts.log')
+    parser.add_argument('--workers', type=int, default=8, help='max concurrent upstream requests')
+    parser.add_argument('--chunk-chars', type=int, default=2000, help='max characters per newline-joined request')
+    parser.add_argument('--languages', nargs='*', help='ISO codes to warm (default: all in languages.json)')
+    parser.add_argument('--log', default=os.path.join(base, 'backend', 'logs', 'texts.log'))
+    parser.add_argument('--cache', default=os.path.join(base, 'backend', 'translations'), help='shard directory')
+    parser.add_argument('--url', default=TRANSLATE_URL, help='LibreTranslate endpoint, or several comma-separated')
+    args = parser.parse_args(argv)
+
+    try:
+        cores = load_lines(args.log)
+    except FileNotFoundError:
+        print('Log file not found:', args.log, file=sys.stderr)
+        return 1
+
+    iso_codes = args.languages or [code for code in load_languages().keys() if code != 'en']
+    store = ShardedTranslationStore(args.cache)
+
+    jobs = []
+    skipped = 0
+    for target in iso_codes:
+        missing = [core for core in cores if store.get('en-' + target, core) is None]
+        skipped += len(cores) - len(missing)
+        jobs.extend((target, chunk) for chunk in chunked(missing, args.chunk_chars))
+
+    total = sum(len(chunk) for _, chunk in jobs)
+    print(f'{len(cores)} strings x {len(iso_codes)} languages: {skipped} already cached, {total} to translate in {len(jobs)} requests')
+    if not jobs:
+        return 0
+
+    warmer = Prewarmer(store, TranslateClient(args.url, pool_size=args.workers, max_concurrency=args.workers,
+                                              timeout=30, queue_timeout=float('inf')))
+
+    start = time.time()
+    done = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(warmer.translate_chunk, target, chunk) for target, chunk in jobs]
+        try:
+            for future in as_completed(futures):
+                done += future.result()
+                elapsed = time.time() - start
+                rate = done / elapsed if elapsed > 0 else 0
+                print(f'Progress: {done}/{total} ({rate:.1f} strings/sec)')
+        except KeyboardInterrupt:
+            # drop the queued chunks here: leaving the `with` would wait for every one of them.
+            # the requests already in flight still finish and land in the store
+            pool.shutdown(wait=False, cancel_futures=True)
+            print('Interrupted; re-run to resume from what is already cached', file=sys.stderr)
+            return 130
+
+    elapsed = time.time() - start
+    print(f'\nTranslated {done}/{total} strings in {elapsed:.1f}s ({done / elapsed if elapsed else 0:.1f} strings/sec)')
+    for target in iso_codes:
+        if warmer.failed.get(target):
+            print(f'  {target}: {warmer.translated.get(target, 0)} ok, {warmer.failed[target]} failed')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,6 +4,9 @@ import re
 import requests
 import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from translate_client import TranslateClient  # noqa: E402
 
 def load_languages():
     try:
@@ -61,6 +64,7 @@ def main():
     # match leading characters that are NOT ASCII printable (space through ~)
     leading_non_ascii_re = re.compile(r'^[^\x20-\x7E]+')
     rtl_codes = {'ar', 'he', 'fa', 'ur'}
+    client = TranslateClient(os.getenv('TRANSLATE_URL', 'https://translate.civiclens.app/translate'))
 
     for target in iso_codes:
         for line in lines:
@@ -78,8 +82,7 @@ def main():
             payload = {'q': rest, 'source': 'en', 'target': target, 'alternatives': 3}
 
             try:
-                r = requests.post('https://translate.civiclens.app/translate', json=payload, timeout=10)
-                resp_json = r.json()
+                resp_json = client.post(payload)
                 # input(resp_json)
             except Exception as e:
                 print('translate request failed for', target, e, file=sys.stderr)
@@ -0,0 +1,73 @@
+# content-addressed cache for model outputs, shared by categorize.py and generate_summaries.py.
+#
+# results are keyed by sha256(normalized text + model name + stage params such as the label set
+# or the prompts), so
+#   - a bill whose text is identical to one already processed reuses that result,
+#   - a bill whose text changed gets a new key and is reprocessed,
+#   - changing the model, labels or prompts changes the key only for the stage it affects.
+#
+# entries live in the civiclens.result_cache collection: {_id: key, stage, model, result}
+
+import re
+import json
+import hashlib
+
+from pymongo import UpdateOne
+
+_ws_re = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    return _ws_re.sub(" ", text or "").strip()
+
+
+def text_hash(text):
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def cache_key(text_digest, model, params):
+    blob = json.dumps({"text": text_digest, "model": model, "params": params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, collection, stage, model, params):
+        self.collection = collection
+        self.stage = stage
+        self.model = model
+        self.params = params
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, text):
+        return self.key_for_hash(text_hash(text))
+
+    def key_for_hash(self, text_digest):
+        return cache_key(text_digest, self.model, self.params)
+
+    def get_many(self, keys):
+        keys = list(set(keys))
+        found = {}
+        # chunk the $in so one lookup never ships a huge array
+        for i in range(0, len(keys), 500):
+            for doc in self.collection.find({"_id": {"$in": keys[i:i + 500]}}, {"result": 1}):
+                found[doc["_id"]] = doc["result"]
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def put_many(self, results):
+        # results: {key: result}
+        if not results:
+            return
+        self.collection.bulk_write([
+            UpdateOne({"_id": key}, {"$set": {"stage": self.stage, "model": self.model, "result": result}}, upsert=True)
+            for key, result in results.items()
+        ], ordered=False)
+
+    def put(self, key, result):
+        self.put_many({key: result})
+
@@ -1,14 +1,27 @@
-
 from dotenv import load_dotenv
 load_dotenv()
 
 import os
-mongo_uri = os.getenv("MONGO_URI")
+import sys
+
 from pymongo import MongoClient
-client = MongoClient(mongo_uri)
 
-db = client["civiclens"]["bills"]
 
-for item in db.find({}):
-    if not item["_id"].startswith("HB"):
-        db.delete_one({"_id": item["_id"]})
\ No newline at end of file
+def sanitize(db):
+    # drops every bill that isn't a house bill; returns how many went
+    ids = [item["_id"] for item in db.find({}, {"_id": 1}) if not item["_id"].startswith("HB")]
+    for i in range(0, len(ids), 1000):
+        db.delete_many({"_id": {"$in": ids[i:i + 1000]}})
+    return len(ids)
+
+
+def main(argv=None):
+    mongo_uri = os.getenv("MONGO_URI")
+    client = MongoClient(mongo_uri)
+    deleted = sanitize(client["civiclens"]["bills"])
+    print(f"Deleted {deleted} bills")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+from dotenv import load_dotenv
+load_dotenv()
+
+# translates every bill summary and its bullet points into each language in backend/languages.json
+# and stores them next to the english on the summaries doc:
+#
+#   {_id, summary, bullet_points, key, summary_hash,
+#    translations: {lang: {summary, bullet_points}},
+#    translated: {lang: hash of the english it was made from}}
+#
+# so serving a summary in any language is one lookup. a language is redone only when the
+# summary_hash of the english summary + bullets no longer matches what it was translated from, and
+# readers should likewise only use translations[lang] while translated[lang] == summary_hash.
+# texts are sent per target language, many summaries' strings newline-joined into one request.
+#
+#   TRANSLATE_URL=http://localhost:5000/translate python translate_summaries.py --workers 8
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from pymongo import MongoClient, UpdateOne
+
+from print_texts import load_languages
+from prewarm_cache import Prewarmer, chunked, TRANSLATE_URL
+from translate_client import TranslateClient
+from generate_summaries import summary_hash
+
+
+def texts_of(doc):
+    # the strings to translate for one summary; newlines would break the line-joined batches
+    texts = [doc.get("summary") or ""] + list(doc.get("bullet_points") or [])
+    return [" ".join(t.split()) for t in texts]
+
+
+def _pages(collection, query, fields, page_size):
+    # a fresh query per _id range rather than one cursor: each batch spends a while on upstream
+    # calls, and a cursor left idle that long is reaped by the server (CursorNotFound)
+    last = None
+    while True:
+        page_query = query if last is None else {"$and": [query, {"_id": {"$gt": last}}]}
+        docs = list(collection.find(page_query, fields).sort("_id", 1).limit(page_size))
+        if not docs:
+            return
+        last = docs[-1]["_id"]
+        yield from docs
+        if len(docs) < page_size:
+            return
+
+
+def select(base_db, languages, batch_size=100, query=None):
+    # yields lists of (doc, hash, languages it needs)
+    batch = []
+    fields = {"summary": 1, "bullet_points": 1, "summary_hash": 1, "translated": 1}
+    for doc in _pages(base_db["summaries"], query or {}, fields, batch_size * 10):
+        digest = doc.get("summary_hash") or summary_hash(doc)
+        done = doc.get("translated") or {}
+        needed = [lang for lang in languages if done.get(lang) != digest]
+        if needed and doc.get("summary"):
+            batch.append((doc, digest, needed))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+class Throughput:
+    # per language pair: strings and characters translated, failures, and time spent in requests.
+    # rates are per second of request time, so pairs compare the same whatever --workers is
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pairs = {}
+
+    def add(self, target, strings, chars, failed, seconds):
+        with self.lock:
+            row = self.pairs.setdefault("en-" + target, {"strings": 0, "chars": 0, "failed": 0, "seconds": 0.0})
+            row["strings"] += strings
+            row["chars"] += chars
+            row["failed"] += failed
+            row["seconds"] += seconds
+
+    def report(self):
+        with self.lock:
+            out = {}
+            for pair, row in sorted(self.pairs.items()):
+                out[pair] = dict(row, strings_per_sec=row["strings"] / row["seconds"] if row["seconds"] else 0.0,
+                                 chars_per_sec=row["chars"] / row["seconds"] if row["seconds"] else 0.0)
+            return out
+
+
+def translate_batch(translator, pool, batch, chunk_chars, throughput):
+    # every string the batch needs, grouped by language and sent as newline-joined chunks.
+    # returns {lang: {text: translation}}
+    wanted = {}
+    for doc, _, needed in batch:
+        for lang in needed:
+            wanted.setdefault(lang, set()).update(texts_of(doc))
+
+    def job(lang, chunk):
+        a = time.time()
+        results = translator.translate_texts(lang, chunk)
+        throughput.add(lang, len(results), sum(len(t) for t in results), len(chunk) - len(results), time.time() - a)
+        return lang, results
+
+    found = {lang: {} for lang in wanted}
+    futures = [pool.submit(job, lang, chunk) for lang, texts in wanted.items()
+               for chunk in chunked(sorted(t for t in texts if t), chunk_chars)]
+    for future in as_completed(futures):
+        lang, results = future.result()
+        found[lang].update(results)
+    return found
+
+
+def apply(base_db, batch, found):
+    # writes a language for a summary only when all of its strings came back
+    updates = []
+    written = 0
+    for doc, digest, needed in batch:
+        fields = {}
+        for lang in needed:
+            got = found.get(lang, {})
+            texts = texts_of(doc)
+            if all(not t or t in got for t in texts):
+                translated = [got.get(t, "") for t in texts]
+                fields[f"translations.{lang}"] = {"summary": translated[0], "bullet_points": translated[1:]}
+                fields[f"translated.{lang}"] = digest
+        if fields:
+            written += len(fields) // 2
+            # older summaries predate summary_hash; readers need it to trust translated[lang]
+            if not doc.get("summary_hash"):
+                fields["summary_hash"] = digest
+            updates.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields}))
+    if updates:
+        base_db["summaries"].bulk_write(updates, ordered=False)
+    return written
+
+
+def run(base_db, languages, client=None, url=TRANSLATE_URL, workers=8, batch_size=100, chunk_chars=2000,
+        query=None, log=print):
+    client = client or TranslateClient(url, pool_size=workers, max_concurrency=workers, timeout=30,
+                                       queue_timeout=float("inf"))
+    translator = Prewarmer(None, client)
+    throughput = Throughput()
+
+    start = time.time()
+    summaries = written = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for batch in select(base_db, languages, batch_size, query):
+            found = translate_batch(translator, pool, batch, chunk_chars, throughput)
+            written += apply(base_db, batch, found)
+            summaries += len(batch)
+            log(f"Translated {summaries} summaries ({written} summary-languages written)")
+    return {"summaries": summaries, "written": written, "seconds": time.time() - start, "pairs": throughput.report()}
+
+
+def print_report(stats):
+    print(f"{stats['summaries']} summaries, {stats['written']} summary-languages written in {stats['seconds']:.1f}s")
+    for pair, row in stats["pairs"].items():
+        print(f"  {pair}: {row['strings']} strings ({row['failed']} failed), "
+              f"{row['strings_per_sec']:.1f} strings/sec, {row['chars_per_sec']:.0f} chars/sec")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Translate bill summaries into every supported language")
+    parser.add_argument("--workers", type=int, default=8, help="max concurrent upstream requests")
+    parser.add_argument("--batch-size", type=int, default=100, help="summaries translated together")
+    parser.add_argument("--chunk-chars", type=int, default=2000, help="max characters per newline-joined request")
+    parser.add_argument("--languages", nargs="*", help="ISO codes (default: all in languages.json)")
+    parser.add_argument("--url", default=TRANSLATE_URL, help="LibreTranslate endpoint, or several comma-separated")
+    parser.add_argument("--json", action="store_true", help="print the throughput report as json")
+    args = parser.parse_args(argv)
+
+    languages = args.languages or [code for code in load_languages().keys() if code != "en"]
+    base_db = MongoClient(os.getenv("MONGO_URI"))["civiclens"]
+    stats = run(base_db, languages, url=args.url, workers=args.workers, batch_size=args.batch_size,
+                chunk_chars=args.chunk_chars)
+    if args.json:
+        print(json.dumps(stats, indent=2))
+    else:
+        print_report(stats)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+# streaming work selection shared by categorize.py and generate_summaries.py.
+#
+# one aggregation anti-joins `bills` against the stage's output collection (scores / summaries)
+# and only ships {_id, text_hash, stored key} over the wire, a page of _ids at a time. bill texts
+# are fetched lazily, one batch at a time, for the bills that actually need work, so memory is
+# bounded by the batch size rather than the corpus.
+
+from pymongo import UpdateOne
+
+from result_cache import text_hash
+
+
+def _fetch_texts(bills, ids):
+    docs = {doc["_id"]: doc for doc in bills.find({"_id": {"$in": ids}}, {"_id": 1, "text": 1})}
+    return [docs[_id] for _id in ids if _id in docs and docs[_id].get("text")]
+
+
+def _pages(bills, match, pipeline, page_size):
+    # runs the aggregation one _id range at a time, each page read in full before its rows are
+    # handed out. callers spend minutes per batch on inference or api calls, and a cursor left
+    # idle that long is reaped by the server (CursorNotFound)
+    last = None
+    while True:
+        page_match = match if last is None else {"$and": [match, {"_id": {"$gt": last}}]}
+        rows = list(bills.aggregate([{"$match": page_match}, {"$sort": {"_id": 1}}, {"$limit": page_size}]
+                                    + pipeline))
+        if not rows:
+            return
+        last = rows[-1]["_id"]
+        yield from rows
+        if len(rows) < page_size:
+            return
+
+
+def select_work(base_db, stage, cache, query=None, recheck_legacy=False, batch_size=100):
+    # yields lists of (bill, key) with bill = {_id, text}, at most batch_size per list.
+    # a bill needs work when it has no entry in `stage`, or its entry was made under a different
+    # content key (text, model or params changed). entries that predate content keys are only
+    # redone with recheck_legacy. bills without a stored text_hash get one backfilled on the way
+    bills = base_db["bills"]
+    match = dict(query or {})
+    match["text"] = {"$exists": True, "$nin": [None, ""]}
+    pipeline = [
+        {"$project": {"text_hash": 1}},
+        {"$lookup": {"from": stage, "localField": "_id", "foreignField": "_id", "as": "done"}},
+        {"$project": {
+            "text_hash": 1,
+            "has_done": {"$gt": [{"$size": "$done"}, 0]},
+            "done_key": {"$arrayElemAt": ["$done.key", 0]},
+        }},
+    ]
+
+    pending = []   # (_id, key) known to need work
+    unhashed = []  # rows whose bill has no text_hash yet
+
+    def needs_work(row, key):
+        if not row.get("has_done"):
+            return True
+        stored = row.get("done_key")
+        if stored is None:
+            return recheck_legacy
+        return stored != key
+
+    def flush_pending():
+        nonlocal pending
+        ids = [_id for _id, _ in pending]
+        keys = dict(pending)
+        pending = []
+        return [(bill, keys[bill["_id"]]) for bill in _fetch_texts(bills, ids)]
+
+    def resolve_unhashed():
+        # legacy bills: hash their text now and remember it so the next run doesn't have to
+        nonlocal unhashed
+        rows = {row["_id"]: row for row in unhashed}
+        unhashed = []
+        out, updates = [], []
+        for bill in _fetch_texts(bills, list(rows)):
+            digest = text_hash(bill["text"])
+            updates.append(UpdateOne({"_id": bill["_id"]}, {"$set": {"text_hash": digest}}))
+            key = cache.key_for_hash(digest)
+            if needs_work(rows[bill["_id"]], key):
+                out.append((bill, key))
+        if updates:
+            bills.bulk_write(updates, ordered=False)
+        return out
+
+    for row in _pages(bills, match, pipeline, batch_size * 10):
+        if not row.get("text_hash"):
+            unhashed.append(row)
+            if len(unhashed) >= batch_size:
+                work = resolve_unhashed()
+                if work:
+                    yield work
+            continue
+        key = cache.key_for_hash(row["text_hash"])
+        if needs_work(row, key):
+            pending.append((row["_id"], key))
+            if len(pending) >= batch_size:
+                yield flush_pending()
+
+    if unhashed:
+        work = resolve_unhashed()
+        if work:
+            yield work
+    if pending:
+        yield flush_pending()
+
+
+def iter_work(base_db, stage, cache, **kwargs):
+    # flattened select_work: yields (bill, key) one at a time
+    for batch in select_work(base_db, stage, cache, **kwargs):
+        yield from batch
@@ -116,17 +116,21 @@ targets = [x for x in targets if x not in loaded]
 
 print(targets, loaded)
 
-import requests
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(base), "backend"))
+from translate_client import TranslateClient
+
+client = TranslateClient(os.getenv("TRANSLATE_URL", "http://localhost:5000/translate"), timeout=60)
 for target in targets:
-    x = requests.post("http://localhost:5000/translate", json={"q": lbl, "source": "en", "target": target})
-    if x.status_code == 200:
-        resp = x.json()
+    try:
+        resp = client.post({"q": lbl, "source": "en", "target": target})
+    except Exception as e:
+        print(f"error with {target}: {e}")
+    else:
         lines = resp["translatedText"].split("\n")
         for i, item in enumerate(translations):
             translations[item][target] = lines[i]
         print(f"success with {target}")
-    else:
-        print(f"error with {target}: {x.text}")
 
 
 with open(os.path.join(base, "translations.json"), "w", encoding="utf-8") as f:
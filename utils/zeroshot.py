@@ -1,23 +1,37 @@
-# expects to be run as zeroshot.py [path to bill text]
+# expects to be run as zeroshot.py [path to bill text] [max|mean|weighted|off]
 # output printed directly to stdout. probably entirely in descending order? 
+# long texts are cleaned and split into windows (see toolchain/chunking.py) unless the
+# aggregation is "off", in which case the raw text goes straight to the model and gets truncated
 
 
-from transformers.utils import logging
+# CLASSIFIER_BACKEND=onnx-int8 CLASSIFIER_MODEL_DIR=... runs it on onnxruntime instead of torch
+# (see toolchain/onnx_backend.py), fully offline
 
-logging.set_verbosity_error()
 
+import os
+import sys
+backend = os.getenv("CLASSIFIER_BACKEND", "torch")
 
-from transformers import pipeline
+if backend == "torch":
+    from transformers.utils import logging
 
+    logging.set_verbosity_error()
 
 
-classifier = pipeline("zero-shot-classification",
-                      model="knowledgator/comprehend_it-base")
+    from transformers import pipeline
 
 
-import sys
+
+    classifier = pipeline("zero-shot-classification",
+                          model=os.getenv("CLASSIFIER_MODEL_DIR") or "knowledgator/comprehend_it-base")
+else:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "toolchain"))
+    import onnx_backend
+    classifier = onnx_backend.load(backend, os.getenv("CLASSIFIER_MODEL_DIR"))
+
 with open(sys.argv[1]) as f:
     text = f.read()
+aggregate = sys.argv[2] if len(sys.argv) > 2 else "max"
 
 #print(text)
 
@@ -36,6 +50,12 @@ candidate_labels = [
 "safety",
 "transportation"
 ]
-data = (classifier(text, candidate_labels, multi_label=True))
-print(dict(zip(data["labels"], data["scores"])))
+if aggregate == "off":
+    data = (classifier(text, candidate_labels, multi_label=True))
+    print(dict(zip(data["labels"], data["scores"])))
+else:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "toolchain"))
+    import chunking
+    scores, stats = chunking.classify_long(classifier, [text], candidate_labels, method=aggregate)
+    print(dict(sorted(scores[0].items(), key=lambda kv: kv[1], reverse=True)))
 